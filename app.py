@@ -1,33 +1,55 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
-import subprocess
-from intelhex import IntelHex
+from hex_splice import splice_hex, splice_hex_file
 import os
-from PIL import Image, ImageTk  # PIL is actually installed as Pillow
 import sys
 import tempfile
-import shutil
+import queue
+import threading
+import time
+from config_block import (CONFIG_BLOCK_ADDRESS, DEFAULT_CONFIG, FLAG_NAMES, TIME_RANGE_NAMES,
+                          encode_config)
+from nulink import CommandCancelled, NuLinkRunner
+from plans import ERASE_STEP, PROBE_STEP, RESET_STEP, connect_plan, execute, flash_plan
+from config_flash import flash_config_only
+from flash_layout import aprom_bytes, code_fingerprint
+from hex_cache import file_digest, load_hex
+from resources import bundle_dir, extract_tool, qr_thumbnail
+from session import ConnectionSession
+from spool import SpooledImage, remove_stale
 
 class FlashToolGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Microcontroller Flash Tool")
-        self.root.geometry("570x585")  # Increased height for new frame
+        self.root.geometry("570x700")  # Increased height for new frame
         self.root.resizable(False, False)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.tool_path = self.detect_tool_path()
+        self.runner = NuLinkRunner(self.tool_path)
+        # Cached probe result; status changes come back through job_events
+        self.session = ConnectionSession(self.tool_path, on_change=lambda mcu_id: self.post_event("status", mcu_id))
+        self.journal = None  # Opened once the window is up, see open_journal()
+        self.registry = None  # See firmware_registry()
+        self.pack = None  # ConfigPack feeding Save & Flash instead of the form, see load_pack()
+        self.pack_index = 0  # Next pack record to flash
+        remove_stale()  # Spool files of a session that crashed mid-flash
+        self.journal_board = None  # Journal board id of the running flash cycle
+        self.connected = False
+        self.job_thread = None  # Worker running NuLink steps, None when idle
+        self.job_events = queue.Queue()  # (kind, value) posted by the worker
         self.file_path = tk.StringVar()
         self.output_hex_name = tk.StringVar(value="output.hex")  # Default output name
-        self.eeprom_entries = []
-        self.multi_byte_entries = {}  # Track entries that need byte splitting
-        self.EEPROM_START_ADDRESS = 0x7F01  # Skip init byte
+        self.eeprom_entries = {}  # config_block field name -> entry widget
         self.checkbox_vars = []  # Thêm list để lưu các BooleanVar của checkbox
 
         # Khởi tạo tooltips
         self.tooltips = {}
 
         self.lock_chip_var = tk.BooleanVar(value=True)  # Default checked
+        self.config_only_var = tk.BooleanVar(value=False)  # Save & Flash rewrites only the config pages
 
         # File selection frame
         file_frame = ttk.LabelFrame(root, text="File Selection")
@@ -45,8 +67,22 @@ class FlashToolGUI:
         # Output hex row - match style with input row
         tk.Label(file_frame, text="Output Hex:", width=10).grid(row=1, column=0, padx=5, pady=5)
         tk.Entry(file_frame, textvariable=self.output_hex_name).grid(row=1, column=1, sticky="ew", padx=5)
-        gen_btn = ttk.Button(file_frame, text="Generate", command=self.generate_hex, width=10)
-        gen_btn.grid(row=1, column=2, padx=5)
+        self.generate_btn = ttk.Button(file_frame, text="Generate", command=self.generate_hex, width=10)
+        self.generate_btn.grid(row=1, column=2, padx=5)
+
+        # Multi-adapter station
+        self.station_btn = ttk.Button(file_frame, text="Station", command=self.open_station, width=10)
+        self.station_btn.grid(row=2, column=0, padx=5, pady=(0,5))
+        self.station_window = None
+
+        # Config pack: Save & Flash takes the next record instead of the form
+        pack_frame = ttk.Frame(file_frame)
+        pack_frame.grid(row=2, column=1, sticky="w", padx=5, pady=(0,5))
+        self.pack_btn = ttk.Button(pack_frame, text="Pack", command=self.load_pack, width=10)
+        self.pack_btn.pack(side="left")
+        self.pack_status = tk.Label(pack_frame, text="")
+        self.pack_status.pack(side="left", padx=(5,0))
+        self.create_tooltip(self.pack_btn, "Nạp file .pack: mỗi lần Save & Flash ghi bản ghi tiếp theo (Cancel: dùng lại form)")
 
         # Connect status row
         status_frame = ttk.Frame(file_frame)
@@ -63,6 +99,9 @@ class FlashToolGUI:
         # Add lock chip checkbox
         lock_chk = tk.Checkbutton(btn_frame, text="Lock chip", variable=self.lock_chip_var)
         lock_chk.pack(side="right", padx=5)
+        config_only_chk = tk.Checkbutton(btn_frame, text="Config only", variable=self.config_only_var)
+        config_only_chk.pack(side="right")
+        self.create_tooltip(config_only_chk, "Chỉ ghi trang cấu hình nếu firmware trên chip trùng với file hex")
         
         # Left side buttons 
         self.flash_btn = ttk.Button(btn_frame, text="Flash", command=self.flash_microcontroller)
@@ -87,7 +126,20 @@ class FlashToolGUI:
         self.save_flash_btn.pack(side="left", padx=5)
         self.save_flash_btn["state"] = "disabled"
         
-        ttk.Button(btn_frame, text="Connect", command=self.connect_device).pack(side="left", padx=5)
+        self.connect_btn = ttk.Button(btn_frame, text="Connect", command=self.connect_device)
+        self.connect_btn.pack(side="left", padx=5)
+
+        # Device job frame: progress, NuLink output and Cancel
+        job_frame = ttk.Frame(root)
+        job_frame.pack(side="bottom", fill="x", padx=5, pady=5)
+        job_frame.grid_columnconfigure(0, weight=1)
+        self.progress = ttk.Progressbar(job_frame, mode="determinate")
+        self.progress.grid(row=0, column=0, sticky="ew", padx=(0, 5))
+        self.cancel_btn = ttk.Button(job_frame, text="Cancel", command=self.cancel_job, width=10)
+        self.cancel_btn.grid(row=0, column=1)
+        self.cancel_btn["state"] = "disabled"
+        self.log_text = tk.Text(job_frame, height=5, state="disabled", font=("Consolas", 8))
+        self.log_text.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(5, 0))
 
         # EEPROM data frames
         left_frame = ttk.LabelFrame(root, text="Parameters Setup")
@@ -102,81 +154,80 @@ class FlashToolGUI:
         right_frame.grid_columnconfigure(0, minsize=100)
         right_frame.grid_columnconfigure(1, minsize=100)
 
-        self.eeprom_entries = []
         row_left = row_right = 0
 
         # Map EEPROM fields in exact struct order
         # 1. time[2][2] array
-        self.add_entry_field(left_frame, row_left, "Chạy lạnh CL :", 1, is_uint16=True, default="5", align="w", min_val=1, max_val=999, 
+        self.add_entry_field(left_frame, row_left, "Chạy lạnh CL :", 1, name="time_cl_run", default="5", align="w", min_val=1, max_val=999, 
                             tooltip="Thời gian chạy lạnh CL (1-999)")
         row_left += 1
-        self.add_entry_field(left_frame, row_left, "Chạy lạnh OP :", 1, is_uint16=True, default="5", align="w", min_val=1, max_val=999,
+        self.add_entry_field(left_frame, row_left, "Chạy lạnh OP :", 1, name="time_op_run", default="5", align="w", min_val=1, max_val=999,
                             tooltip="Thời gian chạy lạnh OP (1-999)")
         row_left += 1
-        self.add_entry_field(left_frame, row_left, "Xả đá CL :", 1, is_uint16=True, default="60", align="w", min_val=1, max_val=200,
+        self.add_entry_field(left_frame, row_left, "Xả đá CL :", 1, name="time_cl_defrost", default="60", align="w", min_val=1, max_val=200,
                             tooltip="Thời gian xả đá CL (1-200)")
         row_left += 1
-        self.add_entry_field(left_frame, row_left, "Xả đá OP :", 1, is_uint16=True, default="6", align="w", min_val=1, max_val=60,
+        self.add_entry_field(left_frame, row_left, "Xả đá OP :", 1, name="time_op_defrost", default="6", align="w", min_val=1, max_val=60,
                             tooltip="Thời gian xả đá OP (1-60)")
         row_left += 1
 
         # 2. delayST, ST
-        self.add_entry_field(left_frame, row_left, "Delay ST(100ms) :", 1, is_uint8=True, default="70", align="w", min_val=1, max_val=999,
+        self.add_entry_field(left_frame, row_left, "Delay ST(100ms) :", 1, name="delay_st", default="70", align="w", min_val=1, max_val=999,
                             tooltip="Thời gian delay relay (1-999, đơn vị 0.1s)")
         row_left += 1
-        self.add_entry_field(left_frame, row_left, "ST(100ms) :", 1, is_uint8=True, default="50", align="w", min_val=1, max_val=999,
+        self.add_entry_field(left_frame, row_left, "ST(100ms) :", 1, name="st", default="50", align="w", min_val=1, max_val=999,
                             tooltip="Thời gian bật relay (1-999, đơn vị 0.1s)")
         row_left += 1
 
         # 3. Mode settings
-        self.add_entry_field(right_frame, row_right, "Mode DF :", 1, is_combo=True, values=["OFF", "ON"], default="ON", align="w",
+        self.add_entry_field(right_frame, row_right, "Mode DF :", 1, name="mode_df", is_combo=True, values=["OFF", "ON"], default="ON", align="w",
                             tooltip="ON/OFF: Bật/tắt điều khiển kéo theo Relay 3")
         row_right += 1
-        self.add_entry_field(right_frame, row_right, "Mode END :", 1, is_combo=True, values=["OFF", "ON"], default="ON", align="w",
+        self.add_entry_field(right_frame, row_right, "Mode END :", 1, name="mode_end", is_combo=True, values=["OFF", "ON"], default="ON", align="w",
                             tooltip="ON/OFF: Bật tắt Relay 3 tại end OP chạy lạnh")
         row_right += 1
-        self.add_entry_field(right_frame, row_right, "Mode chạy lạnh :", 1, is_combo=True, values=["CL", "OP"], default="OP", align="w",
+        self.add_entry_field(right_frame, row_right, "Mode chạy lạnh :", 1, name="mode_run", is_combo=True, values=["CL", "OP"], default="OP", align="w",
                             tooltip="CL: Mặc định CL, OP: Mặc định OP")
         row_right += 1
-        self.add_entry_field(right_frame, row_right, "Mode xả đá :", 1, is_combo=True, values=["CL", "OP"], default="OP", align="w",
+        self.add_entry_field(right_frame, row_right, "Mode xả đá :", 1, name="mode_defrost", is_combo=True, values=["CL", "OP"], default="OP", align="w",
                             tooltip="CL: Xả đá theo CL, OP: Xả đá theo OP")
         row_right += 1
-        self.add_entry_field(right_frame, row_right, "Mode SL :", 1, is_combo=True, values=["LCD", "LED"], default="LCD", align="w",
+        self.add_entry_field(right_frame, row_right, "Mode SL :", 1, name="mode_sl", is_combo=True, values=["LCD", "LED"], default="LCD", align="w",
                             tooltip="LCD: Hiển thị LCD, LED: Hiển thị LED")
         row_right += 1
 
         # 4. lock_time through tried_time
-        self.add_entry_field(left_frame, row_left, "Auto lock (Lock time) :", 1, is_uint16=True, default="0", align="w", min_val=0, max_val=999,
+        self.add_entry_field(left_frame, row_left, "Auto lock (Lock time) :", 1, name="lock_time", default="0", align="w", min_val=0, max_val=999,
                             tooltip="Thời gian tự động khóa (0-999)")
         row_left += 1
-        self.add_entry_field(left_frame, row_left, "Độ sáng led xanh :", 1, is_uint8=True, default="0", align="w", min_val=0, max_val=7,
+        self.add_entry_field(left_frame, row_left, "Độ sáng led xanh :", 1, name="led_green", default="0", align="w", min_val=0, max_val=7,
                             tooltip="Điều chỉnh độ sáng LED xanh (0-7)")
         row_left += 1
-        self.add_entry_field(left_frame, row_left, "Độ sáng led đỏ :", 1, is_uint8=True, default="0", align="w", min_val=0, max_val=7,
+        self.add_entry_field(left_frame, row_left, "Độ sáng led đỏ :", 1, name="led_red", default="0", align="w", min_val=0, max_val=7,
                             tooltip="Điều chỉnh độ sáng LED đỏ (0-7)")
         row_left += 1
-        self.add_entry_field(right_frame, row_right, "Mode HCF :", 1, is_combo=True, values=["CF", "H"], default="CF", align="w",
+        self.add_entry_field(right_frame, row_right, "Mode HCF :", 1, name="mode_hcf", is_combo=True, values=["CF", "H"], default="CF", align="w",
                             tooltip="CF: Mode Cold Fast, H: Mode Hot")
         row_right += 1
         
-        self.add_entry_field(right_frame, row_right, "Mode HDF :", 1, is_combo=True, values=["OFF", "ON"], default="OFF", align="w",
+        self.add_entry_field(right_frame, row_right, "Mode HDF :", 1, name="mode_hdf", is_combo=True, values=["OFF", "ON"], default="OFF", align="w",
                             tooltip="ON/OFF: Bật/tắt mode HDF")
         row_right += 1
         
-        self.add_entry_field(right_frame, row_right, "On time Mode LED :", 1, is_combo=True, 
+        self.add_entry_field(right_frame, row_right, "On time Mode LED :", 1, name="led_on_time", is_combo=True, 
                            values=["R1:1 R2:1", "R1:2 R2:1", "R1:1 R2:2", "R1:2 R2:2"], 
                            default="R1:1 R2:1", align="w",
                            tooltip="Chọn số lần nhấp nháy LED")
         row_right += 1
-        self.add_entry_field(right_frame, row_right, "Touch Num :", 1, is_combo=True, values=["1", "2"], default="1", align="w",
+        self.add_entry_field(right_frame, row_right, "Touch Num :", 1, name="touch_num", is_combo=True, values=["1", "2"], default="1", align="w",
                             tooltip="1: Chạm 1 lần, 2: Chạm 2 lần")
         row_right += 1
-        self.add_entry_field(left_frame, row_left, "Try time :", 1, is_uint16=True, default="0", align="w", min_val=0, max_val=999, has_unit_toggle=True,
+        self.add_entry_field(left_frame, row_left, "Try time :", 1, name="try_time", default="0", align="w", min_val=0, max_val=999, has_unit_toggle=True,
                             tooltip="Thời gian thử (0-999 giờ/ngày)")
         row_left += 1
 
         # Add HCF OP time entry
-        self.add_entry_field(left_frame, row_left, "HCF OP time :", 1, is_uint16=True, default="10", align="w", min_val=1, max_val=999,
+        self.add_entry_field(left_frame, row_left, "HCF OP time :", 1, name="hcf_op_time", default="10", align="w", min_val=1, max_val=999,
                             tooltip="Thời gian chạy HCF OP (1-999)")
         row_left += 1
 
@@ -194,19 +245,13 @@ class FlashToolGUI:
             contact_label.pack(side="left", padx=(0, 10))
 
             # Get QR path from bundle
-            if getattr(sys, 'frozen', False):
-                bundle_dir = sys._MEIPASS
-            else:
-                bundle_dir = os.path.dirname(os.path.abspath(__file__))
-                
-            qr_path = os.path.join(bundle_dir, "qr_a_trung.jpg")
+            qr_path = os.path.join(bundle_dir(), "qr_a_trung.jpg")
             
             if not os.path.exists(qr_path):
                 raise FileNotFoundError("Không tìm thấy file qr_a_trung.jpg")
                 
-            qr_image = Image.open(qr_path)
-            qr_image = qr_image.resize((75, 75))
-            qr_photo = ImageTk.PhotoImage(qr_image)
+            # Pre-resized PNG, cached across launches; Tk reads PNG without PIL
+            qr_photo = tk.PhotoImage(file=qr_thumbnail(qr_path, (75, 75)))
             
             qr_label = tk.Label(contact_frame, image=qr_photo)
             qr_label.image = qr_photo
@@ -237,8 +282,11 @@ class FlashToolGUI:
 
         row_left += 1
 
-    def add_entry_field(self, parent, row, label, display_width=1, column=0, is_uint16=False, 
-                       is_uint32=False, is_uint8=False, is_combo=False, values=None, default="0", 
+        self.poll_job_events()
+        self.root.after_idle(self.open_journal)
+
+    def add_entry_field(self, parent, row, label, display_width=1, column=0, name=None,
+                       is_combo=False, values=None, default="0",
                        align="e", min_val=None, max_val=None, has_unit_toggle=False, tooltip=None):
         lbl = tk.Label(parent, text=label)
         lbl.grid(row=row, column=column, padx=(1,1), pady=2, sticky=align)  # Thêm pady=2
@@ -254,7 +302,6 @@ class FlashToolGUI:
             entry = ttk.Combobox(frame, width=6, values=values, state="readonly")  # Increased from 5
             entry.pack(side="left")
             entry.set(default)
-            self.eeprom_entries.append(entry)
             
             # Add checkbox with consistent spacing
             if "Mode" in label and "On time" not in label and "chạy lạnh" not in label and "xả đá" not in label:
@@ -298,18 +345,9 @@ class FlashToolGUI:
             if min_val is not None and max_val is not None:
                 entry.bind('<FocusOut>', lambda e, ent=entry, min_v=min_val, max_v=max_val, def_v=default: 
                          self.validate_entry_range(ent, min_v, max_v, def_v))
-            
-            if is_uint16 or is_uint32 or is_uint8:
-                self.multi_byte_entries[len(self.eeprom_entries)] = {
-                    'entry': entry,
-                    'bytes': 4 if is_uint32 else (2 if is_uint16 else 1),
-                    'default': default  # Store default value
-                }
-                # Add placeholder entries for the actual bytes
-                for _ in range(4 if is_uint32 else (2 if is_uint16 else 1)):
-                    self.eeprom_entries.append(None)
-            else:
-                self.eeprom_entries.append(entry)
+
+        # Byte width and value mapping come from config_block.CONFIG_FIELDS
+        self.eeprom_entries[name] = entry
 
     def create_tooltip(self, widget, text):
         def enter(event):
@@ -344,42 +382,29 @@ class FlashToolGUI:
             entry.delete(0, tk.END)
             entry.insert(0, default)
 
-    def get_entry_bytes(self, value, num_bytes):
-        """Convert decimal input to specified number of bytes in big endian"""
-        try:
-            value = int(value)
-            # Check value ranges based on number of bytes
-            if num_bytes == 1 and value > 255:  # uint8_t
-                return [0] * num_bytes
-            elif num_bytes == 2 and value > 65535:  # uint16_t 
-                return [0] * num_bytes
-            elif num_bytes == 4 and value > 4294967295:  # uint32_t
-                return [0] * num_bytes
-                
-            bytes_list = []
-            for i in range(num_bytes):
-                bytes_list.append(value & 0xFF)
-                value >>= 8
-            return bytes_list[::-1]  # Reverse list for big endian
-        except ValueError:
-            return [0] * num_bytes
+    def get_config(self):
+        """Collect the form into a config dict for config_block.encode_config"""
+        config = {name: entry.get().strip() for name, entry in self.eeprom_entries.items()}
+        # Checkbox vars are created in check_box[] order
+        for name, var in zip(FLAG_NAMES, self.checkbox_vars):
+            config[name] = 1 if var.get() else 0
+        min_values, max_values = self.get_time_range_values()
+        for (min_name, max_name), min_val, max_val in zip(TIME_RANGE_NAMES, min_values, max_values):
+            config[min_name] = min_val
+            config[max_name] = max_val
+        return config
 
     def detect_tool_path(self):
+        # Development/CI override, e.g. the fake_nulink.py stand-in
+        if os.environ.get("NULINK_TOOL"):
+            return os.environ["NULINK_TOOL"]
+
         try:
-            # Get path when running as exe
-            if getattr(sys, 'frozen', False):
-                bundle_dir = sys._MEIPASS
-            else:
-                bundle_dir = os.path.dirname(os.path.abspath(__file__))
-                
-            tool_path = os.path.join(bundle_dir, "NuLink_8051OT.exe")
+            tool_path = os.path.join(bundle_dir(), "NuLink_8051OT.exe")
             
             if os.path.exists(tool_path):
-                # Extract tool to temp folder
-                temp_dir = tempfile.gettempdir()
-                temp_tool = os.path.join(temp_dir, "NuLink_8051OT.exe") 
-                shutil.copy2(tool_path, temp_tool)
-                return temp_tool
+                # Extract tool to temp folder, reusing the copy of a previous launch
+                return extract_tool(tool_path, tempfile.gettempdir())
                 
             # Fallback to default install path
             default_path = r"C:\Program Files (x86)\Nuvoton Tools\NuLink Command Tool\NuLink_8051OT.exe"
@@ -394,209 +419,197 @@ class FlashToolGUI:
             return None
 
     def browse_file(self):
+        from registry import check_layout, describe
+
         file_path = filedialog.askopenfilename(filetypes=[("Hex files", "*.hex")])
         if file_path:
+            try:
+                match = check_layout(file_path, self.firmware_registry())
+            except Exception as e:
+                messagebox.showerror("Error", f"Hex file not selected:\n{e}")
+                return
             self.file_path.set(file_path)
-            messagebox.showinfo("Success", "Hex file selected")
+            messagebox.showinfo("Success", f"Hex file selected\nFirmware: {describe(match)}")
 
-    def check_connection(self):
-        """Check if device is connected and update status"""
-        if not self.tool_path:
-            messagebox.showerror("Error", "NuLink tool not found")
-            return False
-            
-        command = [self.tool_path, "-p"]
-        info = self.run_command(command)
-        if info:
-            # Extract MCU info after second >>>
-            info_parts = info.split('>>>')
-            if len(info_parts) > 2:
-                mcu_info = ''.join(c for c in info_parts[2] if c.isalnum())[:9]
-                self.connect_status.config(text="Status: Connected", fg="green")
-                self.mcu_info.config(text=f"MCU: {mcu_info}")
-                self.enable_buttons()
+    def load_pack(self):
+        """Pick a config pack for Save & Flash; cancelling goes back to the form values"""
+        from pack import ConfigPack
+
+        pack_path = filedialog.askopenfilename(filetypes=[("Config packs", "*.pack")])
+        if self.pack is not None:
+            self.pack.close()
+            self.pack = None
+        if pack_path:
+            try:
+                self.pack = ConfigPack(pack_path)
+            except Exception as e:
+                messagebox.showerror("Error", f"Pack not loaded:\n{e}")
             else:
-                self.connect_status.config(text="Status: Connected", fg="green")
-                self.mcu_info.config(text="")
-                self.enable_buttons()
-            return True
+                self.pack_index = 0
+                self.append_log(f"Pack {os.path.basename(pack_path)}: {len(self.pack)} records")
+        self.update_pack_status()
+
+    def update_pack_status(self):
+        if self.pack is None:
+            self.pack_status.config(text="")
+        else:
+            self.pack_status.config(text=f"{self.pack_index + 1}/{len(self.pack)}")
+
+    def firmware_registry(self):
+        """Registry of known base firmwares, loaded on first use"""
+        if self.registry is None:
+            from registry import FirmwareRegistry
+
+            self.registry = FirmwareRegistry()
+        return self.registry
+
+    def set_connection_status(self, mcu_info):
+        """Show connection state; mcu_info is None when disconnected"""
+        self.connected = mcu_info is not None
+        if self.connected:
+            self.connect_status.config(text="Status: Connected", fg="green")
+            self.mcu_info.config(text=f"MCU: {mcu_info}" if mcu_info else "")
         else:
             self.connect_status.config(text="Status: Disconnected", fg="red")
             self.mcu_info.config(text="")
-            self.disable_buttons()
-            messagebox.showerror("Error", "Device not connected")
-            return False
+        if self.connected and self.station_window is None:
+            # Keep watching for unplug/replug from now on
+            self.session.start_polling()
+        if self.job_thread is None:
+            self.update_buttons()
 
     def save_and_flash(self):
-        if not self.check_connection():
-            return
-            
+        from metrics import metrics
+
         hex_file_path = self.file_path.get()
         if not hex_file_path:
             messagebox.showerror("Error", "Please select a HEX file first.")
             return
 
+        record = None
         try:
-            # Process all entries and convert multi-byte values
-            new_data = []
-            current_idx = 0
-            
-            # Add init byte = 2 at 0x7F00 
-            new_data.append(2)
-            
-            # Map in exact order defined in memory map
-            while current_idx < len(self.eeprom_entries):
-                if isinstance(self.eeprom_entries[current_idx], ttk.Combobox):
-                    value = self.eeprom_entries[current_idx].get()
-                    # Map combo values to numbers based on mode
-                    if value == "CF":  # HCF mode 
-                        value = 1
-                    elif value == "H":  # HCF mode
-                        value = 0
-                    elif value in ["OP", "LED", "ON"]:
-                        value = 1
-                    elif value == "R1:2 R2:1": 
-                        value = 1
-                    elif value == "R1:1 R2:2":
-                        value = 2  
-                    elif value == "R1:2 R2:2":
-                        value = 3
-                    elif value == "2":  # Touch Num
-                        value = 1
-                    else:  # CL, LCD, OFF, "1"
-                        value = 0
-                    new_data.append(value)
-                    current_idx += 1
-                elif current_idx in self.multi_byte_entries:
-                    entry_info = self.multi_byte_entries[current_idx]
-                    value = entry_info['entry'].get().strip()
-                    bytes_list = self.get_entry_bytes(value, entry_info['bytes'])
-                    new_data.extend(bytes_list)
-                    current_idx += entry_info['bytes']
-                else:
-                    if self.eeprom_entries[current_idx]:
-                        value = self.eeprom_entries[current_idx].get().strip()
-                        new_data.append(int(value, 16) if value else 0)
-                    current_idx += 1
-
-            # Add checkbox values first
-            for var in self.checkbox_vars:
-                new_data.append(1 if var.get() else 0)
-
-            # Then add remaining padding (1 uint8 + 4 uint32 + 101 zero = 106 bytes)
-            new_data.extend([0] * 202)  
-
-            # Map min/max values from the 8 entry fields
-            min_values, max_values = self.get_time_range_values()
-            for value in min_values:
-                new_data.extend([(value >> 8) & 0xFF, value & 0xFF])
-            for value in max_values:
-                new_data.extend([(value >> 8) & 0xFF, value & 0xFF])
-
-            # Continue with hex file handling...
-            hex_file = IntelHex(hex_file_path)
-            
-            # Write all data including init byte
-            for i, value in enumerate(new_data):
-                addr = self.EEPROM_START_ADDRESS - 1 + i  # Start from 0x7F00
-                hex_file[addr] = value
-
-            # Create temporary file with merged data
-            temp_file = hex_file_path.replace('.hex', '_merged.hex')
-            hex_file.write_hex_file(temp_file)
-
-            # Flash the merged file
-            if self.tool_path:
-                self.run_command([self.tool_path, "-e", "ALL"])
-                self.run_command([self.tool_path, "-reset"])
-                command = [self.tool_path, "-w", "APROM", temp_file]
-                result = self.run_command(command)
-                if result:
-                    # Only lock if checkbox checked
-                    if self.lock_chip_var.get():
-                        lock_cmd = [self.tool_path, "-w", "cfg0", "0xFFFFFFFD"] 
-                        self.run_command(lock_cmd)
-                    messagebox.showinfo("Success", "Save & Flash!")
-                
-            # Clean up
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+            if self.pack is not None:
+                record = self.pack_index
+                if record >= len(self.pack):
+                    messagebox.showerror("Error", "Every record of the pack has been flashed.")
+                    return
+                config_data = bytes(self.pack[record])  # Encoded when the pack was built
+            else:
+                with metrics.span("encode"):
+                    config_data = encode_config(self.get_config())
 
+            # Merged image stays in memory; it reaches a private spool file only for a full flash
+            with metrics.span("render"):
+                merged = SpooledImage(splice_hex(hex_file_path, CONFIG_BLOCK_ADDRESS, config_data))
         except ValueError as e:
             messagebox.showerror("Error", "Invalid input value")
             return
         except Exception as e:
             messagebox.showerror("Error", f"Failed to merge and flash:\n{e}")
+            return
 
-    def erase_microcontroller(self):
-        if not self.check_connection():
+        # Only lock if checkbox checked
+        lock = self.lock_chip_var.get()
+        config_only = self.config_only_var.get()
+        if record is None:
+            job = lambda: self.save_and_flash_job(hex_file_path, config_data, merged, lock, config_only)
+        else:
+            def job():
+                self.post_event("log", f"Pack record {record + 1}/{len(self.pack)}")
+                self.save_and_flash_job(hex_file_path, config_data, merged, lock, config_only)
+                self.pack_index = record + 1  # Only a flashed record is used up
+        # Clean up the spool file once the job ends
+        self.start_job(job, "Save & Flash!", cleanup=merged.close, cycle="save_and_flash")
+
+    def save_and_flash_job(self, hex_file_path, config_data, merged, lock, config_only):
+        """Job thread: write only the config pages when possible, else flash everything.
+
+        merged is the SpooledImage of the merged hex.
+        """
+        from metrics import metrics
+        from registry import describe
+
+        with metrics.span("parse"):
+            image = load_hex(hex_file_path)
+        image.write(CONFIG_BLOCK_ADDRESS, config_data)
+        if config_only:
+            result = flash_config_only(self.runner, image, lock, self.session, **self.plan_hooks())
+            if result is not None:
+                return result
+            on_chip = self.session.fingerprint
+            if on_chip is None:
+                self.post_event("log", "Firmware on the chip cannot be read, full flash")
+            else:
+                match = self.firmware_registry().by_fingerprint(on_chip)
+                self.post_event("log", f"Chip runs {describe(match)}, full flash")
+        with metrics.span("write"):
+            merged_path = merged.path()
+        result = self.run_plan(flash_plan(merged_path, lock))
+        self.session.fingerprint = code_fingerprint(aprom_bytes(image))
+        return result
+
+    def open_station(self):
+        """Flash the current form config on every adapter of a station file, or every attached one.
+
+        The station's slots include the default adapter, so while its window
+        is open the session poller is stopped and the device buttons are off.
+        """
+        from station import StationWindow, detect_slots, load_station_config
+
+        if self.station_window is not None:
+            self.station_window.window.lift()
             return
-            
-        if self.tool_path:
-            command = [self.tool_path, "-e", "ALL"]
-            if self.run_command(command):
-                messagebox.showinfo("Success", "Erase!")
+        if self.job_thread is not None:
+            return
+        hex_file_path = self.file_path.get()
+        if not hex_file_path:
+            messagebox.showerror("Error", "Please select a HEX file first.")
+            return
+        config_path = filedialog.askopenfilename(title="Station config", filetypes=[("Station config", "*.json")])
+        if not config_path and not messagebox.askyesno(
+                "Station", "Không chọn file station. Dùng các NuLink đang cắm (NuLink -l)?"):
+            return
+        try:
+            slots = load_station_config(config_path) if config_path else detect_slots(self.tool_path)
+            if not slots:
+                raise ValueError("No NuLink adapter found")
+            image = SpooledImage(splice_hex(hex_file_path, CONFIG_BLOCK_ADDRESS, encode_config(self.get_config())),
+                                 "station")
+            image_path = image.path()  # Every slot reads it, for the whole session
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to start station:\n{e}")
+            return
+
+        def on_close():
+            self.station_window = None
+            image.close()
+            if self.connected:
+                self.session.start_polling()
+            self.update_buttons()
+
+        self.session.stop_polling()
+        self.station_window = StationWindow(self.root, slots, image_path, lock=self.lock_chip_var.get(),
+                                            on_close=on_close, journal=self.journal)
+        self.update_buttons()
+
+    def erase_microcontroller(self):
+        self.start_job([PROBE_STEP, ERASE_STEP], "Erase!")
 
     def reset_microcontroller(self):
-        if not self.check_connection():
-            return
-            
-        if self.tool_path:
-            command = [self.tool_path, "-reset"]
-            if self.run_command(command):
-                messagebox.showinfo("Success", "Reset!")
+        self.start_job([PROBE_STEP, RESET_STEP], "Reset!")
 
     def flash_microcontroller(self):
-        if not self.check_connection():
+        hex_file = self.file_path.get()
+        if not hex_file:
+            messagebox.showerror("Error", "Please select a HEX file first.")
             return
-            
-        if self.tool_path:
-            # Erase và reset không hiện thông báo
-            self.run_command([self.tool_path, "-e", "ALL"])
-            self.run_command([self.tool_path, "-reset"])
-            
-            hex_file = self.file_path.get()
-            if hex_file:
-                # Flash
-                flash_cmd = [self.tool_path, "-w", "APROM", hex_file]
-                if self.run_command(flash_cmd):
-                    # Only lock if checkbox checked
-                    if self.lock_chip_var.get():
-                        lock_cmd = [self.tool_path, "-w", "cfg0", "0xFFFFFFFD"]
-                        self.run_command(lock_cmd)
-                    messagebox.showinfo("Success", "Flash!")
+        # Only lock if checkbox checked
+        self.start_job(flash_plan(hex_file, lock=self.lock_chip_var.get()), "Flash!", cycle="flash")
 
     def connect_device(self):
-        try:
-            if not messagebox.askyesno("Xác nhận", "Bộ nhớ sẽ bị xóa trước khi connect. Bạn có muốn tiếp tục?"):
-                return
-
-            if self.tool_path:
-                command = [self.tool_path, "-e", "ALL"]
-                self.run_command(command)
-
-            command = [self.tool_path, "-p"]
-            info = self.run_command(command)
-            if info:
-                # Extract MCU info after second >>>
-                info_parts = info.split('>>>')
-                if len(info_parts) > 2:
-                    mcu_info = ''.join(c for c in info_parts[2] if c.isalnum())[:9]
-                    self.connect_status.config(text="Status: Connected", fg="green")
-                    self.mcu_info.config(text=f"MCU: {mcu_info}")
-                    self.enable_buttons()
-                else:
-                    self.connect_status.config(text="Status: Connected", fg="green")
-                    self.mcu_info.config(text="")
-                    self.enable_buttons()
-            else:
-                self.connect_status.config(text="Status: Disconnected", fg="red")
-                self.mcu_info.config(text="")
-                self.disable_buttons()
-        except Exception as e:
-            self.connect_status.config(text="Status: Disconnected", fg="red")
-            self.mcu_info.config(text="")
-            self.disable_buttons()
+        if not messagebox.askyesno("Xác nhận", "Bộ nhớ sẽ bị xóa trước khi connect. Bạn có muốn tiếp tục?"):
+            return
+        self.start_job(connect_plan())
 
     def enable_buttons(self):
         """Enable all control buttons"""
@@ -612,27 +625,200 @@ class FlashToolGUI:
         self.reset_btn["state"] = "disabled"
         self.save_flash_btn["state"] = "disabled"
 
+    def update_buttons(self):
+        """Enable controls for the current connection and job state"""
+        busy = self.job_thread is not None
+        station = self.station_window is not None  # Its slots own the adapters, the default one included
+        if self.connected and not busy and not station:
+            self.enable_buttons()
+        else:
+            self.disable_buttons()
+        self.connect_btn["state"] = "disabled" if busy or station else "normal"
+        self.station_btn["state"] = "disabled" if busy else "normal"
+        self.generate_btn["state"] = "disabled" if busy else "normal"
+        self.pack_btn["state"] = "disabled" if busy else "normal"  # The running job may use the pack
+        self.cancel_btn["state"] = "normal" if busy else "disabled"
+
     def get_info(self):
         pass
 
-    def run_command(self, command):
+    def start_job(self, job, success_message=None, cleanup=None, cycle=None):
+        """Run a device plan (or job callable) on a worker thread; results come back through job_events.
+
+        cycle names a board flash; its time and outcome go to the station metrics.
+        """
+        if self.job_thread is not None:
+            return
+        if not self.tool_path:
+            messagebox.showerror("Error", "NuLink tool not found")
+            if cleanup:
+                cleanup()
+            return
+        self.runner.reset()
+        self.progress.config(maximum=100, value=0)
+        self.clear_log()
+        self.job_thread = threading.Thread(target=self.run_job, args=(job, success_message, cleanup, cycle),
+                                           daemon=True)
+        self.update_buttons()
+        self.job_thread.start()
+
+    def run_job(self, job, success_message, cleanup, cycle=None):
+        """Worker thread body, must not touch Tk widgets. job is a plan or a callable"""
+        from metrics import metrics
+
+        start = time.perf_counter()
+        run_id = None
+        if cycle and self.journal is not None:
+            run_id = self.journal.start_run("gui")
+            self.journal_board = self.journal.add_board(run_id, cycle, 0)
+            self.journal.board_started(self.journal_board)
         try:
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-            
-            result = subprocess.run(command, 
-                                  check=True,
-                                  capture_output=True,
-                                  text=True,
-                                  startupinfo=startupinfo)
-            return result.stdout
-        except subprocess.CalledProcessError as e:
-            messagebox.showerror("Error", e.stderr)
-            return ""
+            with self.session.device_lock:
+                if callable(job):
+                    job()
+                else:
+                    self.run_plan(job)
+            self.post_event("log", f"Total {time.perf_counter() - start:.2f}s")
+            if cycle:
+                metrics.record("cycle", time.perf_counter() - start, action=cycle)
+            self.finish_journal(run_id, True)
+            self.post_event("progress", 100)
+            self.post_event("done", success_message)
+        except CommandCancelled:
+            self.finish_journal(run_id, False, "Cancelled")
+            self.post_event("cancelled")
+        except Exception as e:
+            if cycle:
+                metrics.record("cycle", time.perf_counter() - start, False, action=cycle)
+            self.finish_journal(run_id, False, str(e))
+            self.post_event("error", str(e))
+        finally:
+            if cleanup:
+                cleanup()
+
+    def open_journal(self):
+        """Open the flash journal (SQLite) and report a flash a crash cut short"""
+        from journal import FlashJournal
+
+        try:
+            self.journal = FlashJournal()
+        except Exception as e:
+            print(f"Flash journal unavailable: {e}")
+            return
+        self.report_interrupted_job()
+
+    def finish_journal(self, run_id, ok, error=None):
+        """Close the journal run of a flash cycle started by run_job"""
+        if run_id is None:
+            return
+        self.journal.board_finished(self.journal_board, ok, self.session.mcu_id, error)
+        self.journal.finish_run(run_id)
+        self.journal_board = None
+
+    def report_interrupted_job(self):
+        """Tell the operator which steps a flash cut short by a crash had completed"""
+        if self.journal is None:
+            return
+        run = self.journal.open_run("gui")
+        if run is None:
+            return
+        done_steps = set()
+        for status, steps in self.journal.board_progress(run["id"]).values():
+            done_steps |= steps
+        order = ["probe", "erase", "reset", "page_erase", "write", "verify", "lock"]
+        done = ", ".join(step for step in order if step in done_steps) or "none"
+        self.append_log(f"The last flash was interrupted (steps completed: {done}). Flash that board again.")
+        self.journal.abandon_runs("gui")
+
+    def plan_hooks(self):
+        """plans.execute callbacks that report to the log, progress bar and journal"""
+        log = lambda line: self.post_event("log", line)
+        board = self.journal_board
+
+        def on_step(index, count, result):
+            log(f"  {result.step.name} {result.seconds:.2f}s")
+            if board:
+                self.journal.step_finished(board, result.step.name, seconds=result.seconds)
+            self.post_event("progress", (index + 1) * 100 // count)
+
+        def on_skip(step):
+            log(f"- {step.name} skipped (already done)")
+            if board:
+                self.journal.step_finished(board, step.name, "skipped")
+
+        return {
+            "on_output": log,
+            "on_skip": on_skip,
+            "on_start": lambda index, count, step: log("> " + " ".join(step.args)),
+            "on_step": on_step,
+            "on_progress": lambda index, count, fraction: self.post_event(
+                "progress", int((index + fraction) * 100 / count)),
+        }
+
+    def run_plan(self, plan):
+        return execute(self.runner, plan, self.session, **self.plan_hooks())
+
+    def post_event(self, kind, value=None):
+        self.job_events.put((kind, value))
+
+    def poll_job_events(self):
+        """Apply worker events on the Tk thread"""
+        try:
+            while True:
+                kind, value = self.job_events.get_nowait()
+                if kind == "log":
+                    self.append_log(value)
+                elif kind == "progress":
+                    self.progress["value"] = value
+                elif kind == "status":
+                    self.set_connection_status(value)
+                else:
+                    self.finish_job(kind, value)
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_job_events)
+
+    def finish_job(self, kind, value):
+        self.job_thread = None
+        self.update_buttons()
+        self.update_pack_status()
+        if kind == "done" and value:
+            messagebox.showinfo("Success", value)
+        elif kind == "error":
+            messagebox.showerror("Error", value)
+        elif kind == "cancelled":
+            self.append_log("Cancelled")
+
+    def cancel_job(self):
+        if self.job_thread is not None:
+            self.append_log("Cancelling...")
+            self.runner.cancel()
+
+    def on_close(self):
+        self.cancel_job()
+        self.session.stop_polling()
+        if self.journal is not None:
+            self.journal.close()
+        if self.pack is not None:
+            self.pack.close()
+        self.root.destroy()
+
+    def clear_log(self):
+        self.log_text.config(state="normal")
+        self.log_text.delete("1.0", tk.END)
+        self.log_text.config(state="disabled")
+
+    def append_log(self, line):
+        self.log_text.config(state="normal")
+        self.log_text.insert(tk.END, line + "\n")
+        self.log_text.see(tk.END)
+        self.log_text.config(state="disabled")
 
     def generate_hex(self):
         """Generate merged hex file without flashing"""
+        from metrics import metrics
+        from output_cache import default_output_cache
+
         # No connection check needed for generate_hex since it doesn't interact with device
         try:
             save_path = filedialog.asksaveasfilename(
@@ -648,71 +834,20 @@ class FlashToolGUI:
                 messagebox.showerror("Error", "Please select input HEX file first.")
                 return
 
-            # Process entries and create merged hex file
-            new_data = []
-            current_idx = 0
-            new_data.append(2)  # Init byte
-            
-            # Reuse existing conversion logic
-            while current_idx < len(self.eeprom_entries):
-                if isinstance(self.eeprom_entries[current_idx], ttk.Combobox):
-                    value = self.eeprom_entries[current_idx].get()
-                    # Map combo values to numbers based on mode
-                    if value == "CF":  # HCF mode 
-                        value = 1
-                    elif value == "H":  # HCF mode
-                        value = 0
-                    elif value in ["OP", "LED", "ON"]:
-                        value = 1
-                    elif value == "R1:2 R2:1": 
-                        value = 1
-                    elif value == "R1:1 R2:2":
-                        value = 2  
-                    elif value == "R1:2 R2:2":
-                        value = 3
-                    elif value == "2":  # Touch Num
-                        value = 1
-                    else:  # CL, LCD, OFF, "1"
-                        value = 0
-                    new_data.append(value)
-                    current_idx += 1
-                elif current_idx in self.multi_byte_entries:
-                    entry_info = self.multi_byte_entries[current_idx]
-                    value = entry_info['entry'].get().strip()
-                    bytes_list = self.get_entry_bytes(value, entry_info['bytes'])
-                    new_data.extend(bytes_list)
-                    current_idx += entry_info['bytes']
-                else:
-                    if self.eeprom_entries[current_idx]:
-                        value = self.eeprom_entries[current_idx].get().strip()
-                        new_data.append(int(value, 16) if value else 0)
-                    current_idx += 1
-
-            # Add checkbox values first
-            for var in self.checkbox_vars:
-                new_data.append(1 if var.get() else 0)
-
-            # Then add remaining padding (1 uint8 + 4 uint32 + 101 zero = 106 bytes)
-            new_data.extend([0] * 202)  
-
-            # Add fixed min-max values for time ranges
-            min_values = [1, 1, 1, 1]  # Min values for CL, OP, CL, OP
-            max_values = [999, 999, 999, 999]  # Max values for CL, OP, CL, OP
-            
-            # Map min values (2 bytes each)
-            for value in min_values:
-                new_data.extend([(value >> 8) & 0xFF, value & 0xFF])
-                
-            # Map max values (2 bytes each)  
-            for value in max_values:
-                new_data.extend([(value >> 8) & 0xFF, value & 0xFF])
-
-            hex_file = IntelHex(hex_file_path)
-            for i, value in enumerate(new_data):
-                addr = self.EEPROM_START_ADDRESS - 1 + i
-                hex_file[addr] = value
-
-            hex_file.write_hex_file(save_path)
+            # Generate keeps the fixed 1-999 time ranges instead of the form's
+            config = self.get_config()
+            for min_name, max_name in TIME_RANGE_NAMES:
+                config[min_name] = DEFAULT_CONFIG[min_name]
+                config[max_name] = DEFAULT_CONFIG[max_name]
+            with metrics.span("encode"):
+                config_data = encode_config(config)
+
+            # Only the records covering the config block are rewritten; a config
+            # generated before from the same base is taken from the output cache
+            with metrics.span("write"):
+                key = default_output_cache.key(file_digest(hex_file_path), config_data)
+                default_output_cache.build(key, save_path, lambda path: splice_hex_file(
+                    hex_file_path, path, CONFIG_BLOCK_ADDRESS, config_data))
             messagebox.showinfo("Success", f"Generated hex file: {save_path}")
 
         except Exception as e:
@@ -736,6 +871,22 @@ class FlashToolGUI:
         return min_values, max_values
 
 if __name__ == "__main__":
+    import multiprocessing  # Only the batch path needs it, but freeze_support must run first
+
+    multiprocessing.freeze_support()  # batch workers in the onefile exe
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "audit":
+        import audit
+        sys.exit(audit.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        import hex_service
+        sys.exit(hex_service.main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "pack":
+        import pack
+        sys.exit(pack.main(sys.argv[2:]))
+
     root = tk.Tk()
     app = FlashToolGUI(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""Write-then-rename file replacement.
+
+Caches, packs, indexes, the registry and the metrics textfile are read by
+other processes (batch workers, stations, node_exporter) while they are being
+written. Each one is written to a partial file next to its path, unique per
+process and thread, and renamed over it only once complete, so a reader sees
+the old file or the new one, never half of one. No project imports here: the
+cache modules at the bottom of the import graph use it.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+
+def partial_path(path):
+    """Name next to path that no other process or thread writes"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+@contextmanager
+def replacing(path):
+    """Yield a partial path to write; it replaces path if the block succeeds and is removed if not"""
+    partial = partial_path(path)
+    try:
+        yield partial
+        os.replace(partial, path)
+    finally:
+        try:
+            os.remove(partial)
+        except OSError:  # Already renamed, or never created
+            pass
+
+
+def write_atomic(path, data):
+    """Replace path with the bytes data"""
+    with replacing(path) as partial:
+        with open(partial, "wb") as f:
+            f.write(data)
@@ -0,0 +1,140 @@
+"""Bulk config audit: decode the config block of many archived hex files.
+
+Usage:
+    python audit.py archive_dir [more dirs or files] -o audit.csv [-j 8]
+    FlashTool.exe audit archive_dir -o audit.csv
+
+Each file is memory-mapped and only the headers of its records are decoded;
+data is read (and checksum-checked) just for the records overlapping the
+config block, so the rest of the image is never parsed. Files whose record
+index is cached (see hex_index; --index writes them) skip even the header
+scan. Files are spread over worker processes and the result is one CSV row
+per file with the parameters under their config_block field names (combo
+fields as labels) and the unit serial / lot / date (template.py), the same
+columns batch.py takes as input.
+"""
+import argparse
+import csv
+import mmap
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE, CONFIG_INIT_BYTE, FIELD_NAMES, decode_config
+from hex_index import RECORD_DATA, RECORD_EOF, StaleIndexError, decode_record, iter_records, load_index
+from template import UNIT_COLUMNS, decode_unit
+
+COLUMNS = ("file", "status") + FIELD_NAMES + UNIT_COLUMNS
+
+
+def fill_range(records, start, size, pad=0xFF):
+    """Bytes [start, start + size) from (address, data) records, and how many were present"""
+    block = bytearray([pad]) * size
+    present = bytearray(size)
+    for address, data in records:
+        lo = max(address, start)
+        hi = min(address + len(data), start + size)
+        if lo < hi:
+            block[lo - start:hi - start] = data[lo - address:hi - address]
+            present[lo - start:hi - start] = b"\x01" * (hi - lo)
+    return block, sum(present)
+
+
+def scan_records(source, start, size):
+    """(address, data) of the data records of source overlapping the range"""
+    for line_start, line_end, address, rtype, length in iter_records(source):
+        if rtype == RECORD_EOF:
+            break
+        if rtype == RECORD_DATA and address < start + size and address + length > start:
+            yield address, decode_record(source[line_start:line_end])[3]
+
+
+def read_config_block(path, build_index=False):
+    """(block bytes, bytes present) of the config block in a hex file.
+
+    With a cached record index (or build_index) only the block's lines are
+    decoded; otherwise the memory-mapped file is scanned.
+    """
+    start, size = CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return bytearray(b"\xFF" * size), 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            index = load_index(path, source, create=build_index)
+            if index is not None:
+                try:
+                    return fill_range(index.read_records(f, index.overlapping(start, size)), start, size)
+                except StaleIndexError:
+                    pass
+            return fill_range(scan_records(source, start, size), start, size)
+
+
+def audit_file(path, build_index=False):
+    """One table row for path: file, status and the decoded parameters"""
+    row = {"file": path}
+    try:
+        block, present = read_config_block(path, build_index)
+    except (OSError, ValueError) as e:
+        row["status"] = f"error: {e}"
+        return row
+    if present == 0:
+        row["status"] = "missing"
+        return row
+    row.update(decode_config(block, labels=True))
+    row.update(decode_unit(block))
+    if present < CONFIG_BLOCK_SIZE:
+        row["status"] = "partial"
+    elif row["init"] != CONFIG_INIT_BYTE:
+        row["status"] = "bad init"
+    else:
+        row["status"] = "ok"
+    return row
+
+
+def find_hex_files(paths):
+    """Every .hex file under the given files/directories, sorted per directory"""
+    found = []
+    for path in paths:
+        if not os.path.isdir(path):
+            found.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            found.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                         if name.lower().endswith(".hex"))
+    return found
+
+
+def run_audit(files, workers=None, chunksize=32, build_index=False):
+    """Yield one row per file, in order"""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(partial(audit_file, build_index=build_index), files, chunksize=chunksize)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="audit", description="Decode the config block of archived hex files")
+    parser.add_argument("paths", nargs="+", help="hex files or directories to scan")
+    parser.add_argument("-o", "--output", help="CSV file to write (default: stdout)")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--index", action="store_true", help="cache record indexes for later runs")
+    args = parser.parse_args(argv)
+
+    files = find_hex_files(args.paths)
+    out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    bad = 0
+    try:
+        writer = csv.DictWriter(out, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in run_audit(files, args.jobs, build_index=args.index):
+            bad += row["status"] != "ok"
+            writer.writerow(row)
+    finally:
+        if args.output:
+            out.close()
+    print(f"Audited {len(files)} hex files, {bad} not ok", file=sys.stderr)
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
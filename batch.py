@@ -0,0 +1,202 @@
+"""Headless batch generator: one patched hex per row of a CSV / JSON-lines file.
+
+Usage:
+    python batch.py base.hex params.csv -o out_dir [-j 8]
+    FlashTool.exe batch base.hex params.jsonl -o out_dir
+
+Each row is a config dict using the field names of config_block.CONFIG_FIELDS
+(missing fields take the form defaults). An optional "output" column names the
+generated file, otherwise rows are numbered.
+
+Output files copy the base hex verbatim except for the records covering the
+config block (see hex_splice); --rewrite re-serializes the whole image instead.
+Outputs are kept in a content-addressed cache (output_cache), so a row whose
+config was generated before from the same base is linked from there instead of
+being built again; --no-cache turns it off.
+
+Rows with "serial", "lot" or "date" columns are serialized units (see
+template.py): the image of their static config is rendered once per worker
+and each unit only stamps its values into it.
+
+The table is checked first (validate.py) and nothing is generated if any value
+would be stored wrong; --no-validate skips the check.
+
+The parameter file can also be a config pack (pack.py): its records are
+already validated and encoded, each worker maps the pack and takes record N
+as it is. Files of serialized records are named by serial.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic_file import write_atomic
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE, encode_config
+from hex_cache import default_cache, file_digest, load_hex
+from hex_splice import HexSplicer, splicer_for_file
+from output_cache import default_output_cache
+from pack import PACK_SUFFIX, ConfigPack, PackError, split_unit
+from registry import check_layout
+from template import ImageTemplate, decode_unit, unit_from_row
+
+OUTPUT_COLUMN = "output"
+
+# Base image (SparseImage or HexSplicer), loaded once per worker process by _init_worker
+_base_image = None
+# (OutputCache, base digest) of the worker, None when outputs are not cached
+_output_cache = None
+# Serialized unit templates of the worker by static config block
+_templates = {}
+MAX_TEMPLATES = 16
+# ConfigPack the worker's jobs index into, None for table rows
+_pack = None
+
+
+def _init_worker(base_path, rewrite=False, cache=None, base_digest=None, pack_path=None):
+    global _base_image, _output_cache, _pack
+    if rewrite:
+        _base_image = load_hex(base_path)
+    else:
+        _base_image = splicer_for_file(base_path, CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE)
+    _output_cache = (cache, base_digest) if cache is not None else None
+    _pack = ConfigPack(pack_path) if pack_path else None
+
+
+def _render(config_data):
+    if isinstance(_base_image, HexSplicer):
+        return _base_image.render(config_data)
+    # Every row rewrites the same block, so the base image is reused in place
+    _base_image.write(CONFIG_BLOCK_ADDRESS, config_data)
+    return _base_image.to_hex().encode("ascii")
+
+
+def _template(config_data):
+    key = bytes(config_data)
+    template = _templates.get(key)
+    if template is None:
+        if len(_templates) >= MAX_TEMPLATES:
+            _templates.clear()
+        template = _templates[key] = ImageTemplate(_render(config_data))
+    return template
+
+
+def _generate(job):
+    """Patch the worker's base image with one config (a row, or a record number of the pack) and write it out"""
+    out_path, config = job
+    if _pack is not None:
+        config_data, unit = split_unit(_pack[config])
+    else:
+        config_data = encode_config(config)
+        unit = unit_from_row(config)
+    # Renamed into place, never truncated: out_path may be a hard link to a cache entry from an earlier run
+    if unit is not None:
+        # Every unit is different, caching them would only evict reusable outputs
+        write_atomic(out_path, _template(config_data).stamp(unit))
+    elif _output_cache is None:
+        write_atomic(out_path, _render(config_data))
+    else:
+        cache, base_digest = _output_cache
+        variant = "splice" if isinstance(_base_image, HexSplicer) else "rewrite"
+        cache.build(cache.key(base_digest, config_data, variant), out_path,
+                    lambda path: write_atomic(path, _render(config_data)))
+    return out_path
+
+
+def read_rows(path):
+    """Read parameter sets from a .csv file or a JSON-lines file"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if path.lower().endswith(".csv"):
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def output_name(row, index):
+    """File name for a row: its "output" column or a zero-padded row number"""
+    name = os.path.basename(str(row.get(OUTPUT_COLUMN) or "").strip())
+    if not name:
+        name = f"{index:05d}"
+    if not name.lower().endswith(".hex"):
+        name += ".hex"
+    return name
+
+
+def pack_output_name(block, index):
+    """File name for a pack record: its serial if it has one, else the record number"""
+    serial = decode_unit(block)["serial"]
+    return f"{serial}.hex" if serial != "" else output_name({}, index)
+
+
+def run_batch(base_path, rows, out_dir, workers=None, chunksize=64, rewrite=False, cache=None):
+    """Generate one hex per row into out_dir, yielding output paths as they finish.
+
+    rows is a list of config dicts or a ConfigPack (workers map the pack
+    themselves, jobs only carry record numbers). cache is an OutputCache for
+    the generated files (None: build every row).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if rewrite:
+        # Parse once here so every worker starts from the disk snapshot
+        default_cache.get(base_path)
+    if isinstance(rows, ConfigPack):
+        pack_path = rows.path
+        jobs = [(os.path.join(out_dir, pack_output_name(block, n + 1)), n) for n, block in enumerate(rows)]
+    else:
+        pack_path = None
+        jobs = [(os.path.join(out_dir, output_name(row, i)), row) for i, row in enumerate(rows, 1)]
+    base_digest = file_digest(base_path) if cache is not None else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(base_path, rewrite, cache, base_digest, pack_path)) as pool:
+        yield from pool.map(_generate, jobs, chunksize=chunksize)
+    if cache is not None:
+        cache.prune()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="batch", description="Generate patched hex files from a parameter table")
+    parser.add_argument("base", help="base firmware .hex")
+    parser.add_argument("params", help="parameter sets (.csv, JSON lines or a .pack)")
+    parser.add_argument("-o", "--out-dir", default="output", help="directory for generated files")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--rewrite", action="store_true", help="re-serialize the whole image instead of splicing")
+    parser.add_argument("--no-validate", action="store_true", help="generate even if values are out of range")
+    parser.add_argument("--no-cache", action="store_true", help="build every file instead of reusing cached outputs")
+    args = parser.parse_args(argv)
+
+    try:
+        check_layout(args.base)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.params.lower().endswith(PACK_SUFFIX):
+        try:
+            rows = ConfigPack(args.params)  # Validated when it was built
+        except PackError as e:
+            print(e, file=sys.stderr)
+            return 2
+        if not rows.check():  # Every record is read anyway, a damaged pack must not give wrong files
+            print(f"{args.params}: records do not match the header digest", file=sys.stderr)
+            return 2
+    else:
+        rows = read_rows(args.params)
+    if not isinstance(rows, ConfigPack) and not args.no_validate:
+        from validate import format_violation, validate_rows
+
+        violations = validate_rows(rows)
+        for violation in violations[:50]:
+            print(format_violation(violation), file=sys.stderr)
+        if violations:
+            print(f"{len(violations)} invalid values, nothing generated (--no-validate to force)", file=sys.stderr)
+            return 2
+    count = 0
+    cache = None if args.no_cache else default_output_cache
+    for count, _ in enumerate(run_batch(args.base, rows, args.out_dir, args.jobs, rewrite=args.rewrite,
+                                        cache=cache), 1):
+        pass
+    print(f"Generated {count} hex files in {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+"""Performance benchmarks for the flash tool.
+
+    python bench.py [names ...] [--repeat N] [--latency S] [--json report.json]
+                    [--baseline old.json [--max-ratio R]] [--max-startup SECONDS]
+
+encode_one            encode_config of one form config
+encode_10k            encode_config of 10 000 different configs
+parse_small           SparseImage.from_hex_file of a 32 KB base firmware
+parse_large           the same for a 512 KB image (extended linear records)
+patch_splice          splice_hex_file of the config block (Generate / Save & Flash)
+patch_rewrite         write the block into a parsed image and re-serialize it
+save_and_flash        Save & Flash job (full flash, lock) against fake_nulink.py
+save_and_flash_config Save & Flash job rewriting only the config pages
+startup               fresh interpreter: import app and build the main window
+                      (needs a display)
+
+Inputs are generated from a fixed seed, so runs are comparable between
+releases. --latency is the time each fake NuLink command takes. --json
+writes a machine-readable report and --baseline prints the ratio of each
+median to the one in an earlier report. Exits with 1 when a benchmark
+raises, the startup median exceeds --max-startup or a median is more than
+--max-ratio times its baseline, so it can guard against regressions in CI
+(name the benchmarks there if the runner has no display for startup).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from config_block import CONFIG_BLOCK_ADDRESS, DEFAULT_CONFIG, VALUE_FIELDS, encode_config
+from hex_splice import splice_hex, splice_hex_file
+from sparse_image import SparseImage
+from spool import SpooledImage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPORT_VERSION = 1
+SEED = 20240501
+
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+import tkinter as tk
+import app
+root = tk.Tk()
+root.withdraw()
+gui = app.FlashToolGUI(root)
+root.update_idletasks()
+print(time.perf_counter() - start)
+gui.session.stop_polling()
+root.destroy()
+"""
+
+
+def timed(func, repeat, number=1):
+    """Seconds per call of func, one sample per batch of number calls"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def random_configs(count, seed=SEED):
+    """count configs with every field drawn from its form range"""
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(count):
+        config = {}
+        for field in VALUE_FIELDS:
+            if field.choices is not None:
+                config[field.name] = rng.choice(list(field.choices))
+            elif field.min_val is not None:
+                config[field.name] = rng.randint(field.min_val, min(field.max_val, 0xFF if field.code == "B" else 0xFFFF))
+            else:
+                config[field.name] = field.default
+        configs.append(config)
+    return configs
+
+
+def make_base_hex(path, size, seed=SEED):
+    """Random firmware of size bytes from address 0, stopping short of the config block"""
+    rng = random.Random(seed)
+    image = SparseImage()
+    code_size = min(size, CONFIG_BLOCK_ADDRESS)
+    image.write(0, bytes(rng.getrandbits(8) for _ in range(code_size)))
+    if size > CONFIG_BLOCK_ADDRESS:
+        image.write(0x10000, bytes(rng.getrandbits(8) for _ in range(size - code_size)))
+    image.write_hex_file(path)
+    return path
+
+
+class HeadlessTool:
+    """The parts of app.FlashToolGUI that its Save & Flash job uses, without Tk"""
+
+    def __init__(self, tool_path):
+        import app
+        from metrics import metrics
+        from nulink import NuLinkRunner
+        from registry import FirmwareRegistry
+        from session import ConnectionSession
+
+        metrics.directory = None  # Keep benchmark cycles out of the station metrics files
+
+        self.save_and_flash_job = app.FlashToolGUI.save_and_flash_job.__get__(self)
+        self.run_plan = app.FlashToolGUI.run_plan.__get__(self)
+        self.firmware_registry = lambda: self.registry
+        self.registry = FirmwareRegistry(None)
+        self.runner = NuLinkRunner(tool_path)
+        self.session = ConnectionSession(tool_path)
+
+    def post_event(self, kind, value=None):
+        pass
+
+    def plan_hooks(self):
+        return {}
+
+
+def bench_encode_one(args, workdir):
+    return timed(lambda: encode_config(DEFAULT_CONFIG), args.repeat, number=10000)
+
+
+def bench_encode_10k(args, workdir):
+    configs = random_configs(10000)
+    return timed(lambda: [encode_config(config) for config in configs], args.repeat)
+
+
+def bench_parse_small(args, workdir):
+    path = make_base_hex(os.path.join(workdir, "small.hex"), 0x7F00)
+    return timed(lambda: SparseImage.from_hex_file(path), args.repeat)
+
+
+def bench_parse_large(args, workdir):
+    path = make_base_hex(os.path.join(workdir, "large.hex"), 512 * 1024)
+    return timed(lambda: SparseImage.from_hex_file(path), args.repeat)
+
+
+def bench_patch_splice(args, workdir):
+    path = make_base_hex(os.path.join(workdir, "small.hex"), 0x7F00)
+    out = os.path.join(workdir, "spliced.hex")
+    data = encode_config(DEFAULT_CONFIG)
+    return timed(lambda: splice_hex_file(path, out, CONFIG_BLOCK_ADDRESS, data), args.repeat, number=10)
+
+
+def bench_patch_rewrite(args, workdir):
+    image = SparseImage.from_hex_file(make_base_hex(os.path.join(workdir, "small.hex"), 0x7F00))
+    out = os.path.join(workdir, "rewritten.hex")
+    data = encode_config(DEFAULT_CONFIG)
+
+    def patch():
+        image.write(CONFIG_BLOCK_ADDRESS, data)
+        image.write_hex_file(out)
+
+    return timed(patch, args.repeat, number=10)
+
+
+def _flash_cycles(args, workdir, lock, config_only):
+    """Time the Save & Flash job the way the GUI runs it: splice in memory, then flash"""
+    os.environ["FAKE_NULINK_STATE"] = os.path.join(workdir, "fake_nulink")
+    os.environ["FAKE_NULINK_DELAY"] = str(args.latency)
+    tool = HeadlessTool(os.path.join(HERE, "fake_nulink.py"))
+    base = make_base_hex(os.path.join(workdir, "small.hex"), 0x7F00)
+    configs = iter(random_configs(args.repeat + 1))
+
+    def cycle():
+        config_data = encode_config(next(configs))
+        with SpooledImage(splice_hex(base, CONFIG_BLOCK_ADDRESS, config_data)) as merged:
+            tool.save_and_flash_job(base, config_data, merged, lock, config_only)
+
+    if config_only:
+        cycle()  # The first cycle has to flash everything
+        tool.session.ttl = float("inf")  # Keep the fingerprint between samples
+    return timed(cycle, args.repeat)
+
+
+def bench_save_and_flash(args, workdir):
+    return _flash_cycles(args, workdir, lock=True, config_only=False)
+
+
+def bench_save_and_flash_config(args, workdir):
+    return _flash_cycles(args, workdir, lock=False, config_only=True)
+
+
+def bench_startup(args, workdir):
+    """Seconds from interpreter start of app code to a built main window"""
+    samples = []
+    for _ in range(args.repeat):
+        proc = subprocess.run([sys.executable, "-c", STARTUP_SNIPPET], cwd=HERE,
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"startup run failed: {proc.stderr.strip().splitlines()[-1]}")
+        samples.append(float(proc.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+BENCHMARKS = {
+    "encode_one": bench_encode_one,
+    "encode_10k": bench_encode_10k,
+    "parse_small": bench_parse_small,
+    "parse_large": bench_parse_large,
+    "patch_splice": bench_patch_splice,
+    "patch_rewrite": bench_patch_rewrite,
+    "save_and_flash": bench_save_and_flash,
+    "save_and_flash_config": bench_save_and_flash_config,
+    "startup": bench_startup,
+}
+
+
+def summarize(samples):
+    return {
+        "unit": "s",
+        "samples": samples,
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "max": max(samples),
+    }
+
+
+def format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:9.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:9.1f} ms"
+    return f"{seconds:9.2f} s "
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bench", description="Run flash tool benchmarks")
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per fake NuLink command")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="earlier report to compare medians against")
+    parser.add_argument("--max-startup", type=float, help="fail if the median startup exceeds this (s)")
+    parser.add_argument("--max-ratio", type=float, help="fail if a median exceeds this multiple of its baseline")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(sorted(unknown))}")
+    if args.max_ratio is not None and not args.baseline:
+        parser.error("--max-ratio needs --baseline")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    report = {
+        "version": REPORT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeat": args.repeat,
+        "latency": args.latency,
+        "results": {},
+    }
+    limits = {"startup": args.max_startup}
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="flashtool_bench_") as workdir:
+        for name in args.names or BENCHMARKS:
+            try:
+                result = summarize(BENCHMARKS[name](args, workdir))
+            except Exception as e:
+                report["results"][name] = {"error": str(e)}
+                print(f"{name:22} error: {e}")
+                failed = True
+                continue
+            report["results"][name] = result
+            line = (f"{name:22} min {format_seconds(result['min'])}  median {format_seconds(result['median'])}  "
+                    f"max {format_seconds(result['max'])}")
+            ratio = None
+            if baseline.get(name, {}).get("median"):
+                ratio = result["median"] / baseline[name]["median"]
+                line += f"  x{ratio:.2f} vs baseline"
+            print(line)
+            if ratio is not None and args.max_ratio is not None and ratio > args.max_ratio:
+                print(f"{name}: median is x{ratio:.2f} the baseline, limit x{args.max_ratio:.2f}")
+                failed = True
+            if limits.get(name) is not None and result["median"] > limits[name]:
+                print(f"{name}: median {result['median']:.3f}s exceeds limit {limits[name]:.3f}s")
+                failed = True
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
 @echo off
 rem Install required packages
-pip install pyinstaller pillow intelhex
+pip install pyinstaller pillow
 
 rem Build exe with all resources bundled
 pyinstaller --noconfirm ^
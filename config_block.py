@@ -0,0 +1,163 @@
+"""Layout of the EEPROM config block at 0x7F00 and a compiled encoder for it.
+
+The block mirrors the firmware struct byte for byte (all multi-byte values are
+big endian). The schema below is the single description of that struct; it is
+compiled once into a ``struct.Struct`` so a whole config packs in one call.
+"""
+import struct
+from collections import namedtuple
+
+CONFIG_BLOCK_ADDRESS = 0x7F00  # init byte, the struct follows at 0x7F01
+CONFIG_INIT_BYTE = 2
+LAYOUT_VERSION = 1  # Bumped whenever CONFIG_FIELDS changes; firmwares declare theirs in registry.py
+
+# name, struct code, default, min, max, choices (combo label -> value)
+Field = namedtuple("Field", "name code default min_val max_val choices")
+
+ON_OFF = {"OFF": 0, "ON": 1}
+CL_OP = {"CL": 0, "OP": 1}
+
+CONFIG_FIELDS = (
+    Field("init", "B", CONFIG_INIT_BYTE, None, None, None),
+    # time[2][2]
+    Field("time_cl_run", "H", 5, 1, 999, None),
+    Field("time_op_run", "H", 5, 1, 999, None),
+    Field("time_cl_defrost", "H", 60, 1, 200, None),
+    Field("time_op_defrost", "H", 6, 1, 60, None),
+    # delayST, ST (100ms)
+    Field("delay_st", "B", 70, 1, 999, None),
+    Field("st", "B", 50, 1, 999, None),
+    # Mode bytes
+    Field("mode_df", "B", "ON", None, None, ON_OFF),
+    Field("mode_end", "B", "ON", None, None, ON_OFF),
+    Field("mode_run", "B", "OP", None, None, CL_OP),
+    Field("mode_defrost", "B", "OP", None, None, CL_OP),
+    Field("mode_sl", "B", "LCD", None, None, {"LCD": 0, "LED": 1}),
+    # lock_time through tried_time
+    Field("lock_time", "H", 0, 0, 999, None),
+    Field("led_green", "B", 0, 0, 7, None),
+    Field("led_red", "B", 0, 0, 7, None),
+    Field("mode_hcf", "B", "CF", None, None, {"CF": 1, "H": 0}),
+    Field("mode_hdf", "B", "OFF", None, None, ON_OFF),
+    Field("led_on_time", "B", "R1:1 R2:1", None, None,
+          {"R1:1 R2:1": 0, "R1:2 R2:1": 1, "R1:1 R2:2": 2, "R1:2 R2:2": 3}),
+    Field("touch_num", "B", "1", None, None, {"1": 0, "2": 1}),
+    Field("try_time", "H", 0, 0, 999, None),
+    Field("hcf_op_time", "H", 10, 1, 999, None),
+    # check_box[]: one byte per checkbox, in the order the form creates them
+    Field("op_defrost_seconds", "B", 0, 0, 1, None),
+    Field("show_df", "B", 0, 0, 1, None),
+    Field("show_end", "B", 0, 0, 1, None),
+    Field("show_sl", "B", 0, 0, 1, None),
+    Field("show_hcf", "B", 0, 0, 1, None),
+    Field("show_hdf", "B", 0, 0, 1, None),
+    Field("try_time_days", "B", 0, 0, 1, None),
+    # Kept by the firmware at run time, written as zero by the form
+    Field("shutdown", "B", 0, None, None, None),
+    Field("tried_time_0", "I", 0, None, None, None),
+    Field("tried_time_1", "I", 0, None, None, None),
+    Field("tried_time_2", "I", 0, None, None, None),
+    Field("tried_time_3", "I", 0, None, None, None),
+    # 185 reserved bytes, always zero (template.py stamps unit data at their end)
+    Field(None, "185x", None, None, None, None),
+    # min/max table for the four time[2][2] values
+    Field("min_cl_run", "H", 1, 1, 999, None),
+    Field("min_op_run", "H", 1, 1, 999, None),
+    Field("min_cl_defrost", "H", 1, 1, 999, None),
+    Field("min_op_defrost", "H", 1, 1, 999, None),
+    Field("max_cl_run", "H", 999, 1, 999, None),
+    Field("max_op_run", "H", 999, 1, 999, None),
+    Field("max_cl_defrost", "H", 999, 1, 999, None),
+    Field("max_op_defrost", "H", 999, 1, 999, None),
+)
+
+VALUE_FIELDS = tuple(f for f in CONFIG_FIELDS if f.name is not None)
+FIELD_NAMES = tuple(f.name for f in VALUE_FIELDS)
+FLAG_NAMES = FIELD_NAMES[FIELD_NAMES.index("op_defrost_seconds"):FIELD_NAMES.index("try_time_days") + 1]
+TIME_RANGE_NAMES = (
+    ("min_cl_run", "max_cl_run"),
+    ("min_op_run", "max_op_run"),
+    ("min_cl_defrost", "max_cl_defrost"),
+    ("min_op_defrost", "max_op_defrost"),
+)
+
+CONFIG_STRUCT = struct.Struct(">" + "".join(f.code for f in CONFIG_FIELDS))
+CONFIG_BLOCK_SIZE = CONFIG_STRUCT.size
+
+# The reserved bytes (offset from CONFIG_BLOCK_ADDRESS), free for per-unit data (see template.py)
+_RESERVED = next(i for i, f in enumerate(CONFIG_FIELDS) if f.name is None)
+RESERVED_OFFSET = struct.calcsize(">" + "".join(f.code for f in CONFIG_FIELDS[:_RESERVED]))
+RESERVED_SIZE = struct.calcsize(CONFIG_FIELDS[_RESERVED].code)
+
+DEFAULT_CONFIG = {f.name: f.default for f in VALUE_FIELDS}
+
+WIDTH_MAX = {"B": 0xFF, "H": 0xFFFF, "I": 0xFFFFFFFF}
+
+
+def parse_value(field, value):
+    """The integer a form/CSV value stands for, or None if it is not one.
+
+    Combo fields take their label ("ON", "CF", ...) or the raw number. No
+    range or width rule is applied (see coerce_value and validate.py), but
+    booleans and floats with a fraction (JSON true, 1.5) are not numbers.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else None
+    if field.choices is not None and not isinstance(value, int):
+        label = str(value).strip()
+        if label in field.choices:
+            return field.choices[label]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def coerce_value(field, value):
+    """Turn a form/CSV value into the integer stored in the block.
+
+    The form's historical rules apply: unknown labels and non-numeric text
+    map to 0 and values too wide for the field become 0.
+    """
+    value = parse_value(field, value)
+    if value is None:
+        return 0
+    limit = WIDTH_MAX[field.code]
+    if value > limit:
+        return 0
+    return value & limit
+
+
+def config_values(config):
+    """Return the tuple of packed values for ``config`` (missing keys use defaults)."""
+    get = config.get
+    return tuple(coerce_value(f, get(f.name, f.default)) for f in VALUE_FIELDS)
+
+
+def encode_config(config):
+    """Encode a config dict into the bytes stored from CONFIG_BLOCK_ADDRESS."""
+    return bytearray(CONFIG_STRUCT.pack(*config_values(config)))
+
+
+def encode_config_into(buffer, offset, config):
+    """Encode ``config`` straight into ``buffer`` at ``offset``."""
+    CONFIG_STRUCT.pack_into(buffer, offset, *config_values(config))
+
+
+def decode_config(data, offset=0, labels=False):
+    """Inverse of encode_config: {field name: value} from the stored bytes.
+
+    With labels=True combo fields give their label ("ON", "CF", ...) when the
+    value has one, which coerce_value (and batch.py) accept back unchanged.
+    """
+    values = dict(zip(FIELD_NAMES, CONFIG_STRUCT.unpack_from(data, offset)))
+    if labels:
+        for field in VALUE_FIELDS:
+            if field.choices is not None:
+                for label, value in field.choices.items():
+                    if value == values[field.name]:
+                        values[field.name] = label
+                        break
+    return values
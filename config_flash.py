@@ -0,0 +1,62 @@
+"""Config-only flash: rewrite just the pages holding the config block.
+
+When the board already runs the selected base firmware, only the parameter
+pages differ, so the full erase + APROM program is skipped. The board's
+firmware is identified by flash_layout.code_fingerprint of an APROM readback,
+taken every time: the session cannot tell a swapped board from the last one
+(a locked chip cannot be read, which falls back to a full flash).
+
+"-w APROM" is not documented to erase the pages it programs, so the pages
+from the config block to the end of APROM are erased first ("-e APROM offset",
+which erases from that address on) and all of them are written back.
+"""
+import os
+import tempfile
+
+from flash_layout import APROM_SIZE, CONFIG_PAGES, PAGE_SIZE, aprom_bytes, code_fingerprint, page_image
+from nulink import CommandCancelled, NuLinkError
+from plans import (LOCK_STEP, PROBE_STEP, RESET_STEP, erase_from_step, execute, read_step, verify_step,
+                   write_step)
+
+# Pages erased and rewritten: the config pages and anything after them
+TAIL_PAGES = list(range(CONFIG_PAGES[0], APROM_SIZE, PAGE_SIZE))
+
+
+def read_fingerprint(runner, session=None, **hooks):
+    """Fingerprint of the firmware on the board, or None if APROM cannot be read"""
+    with tempfile.TemporaryDirectory() as workdir:
+        readback = os.path.join(workdir, "aprom.bin")
+        try:
+            execute(runner, [PROBE_STEP, read_step(readback)], session, **hooks)
+        except CommandCancelled:
+            raise
+        except NuLinkError:
+            return None
+        with open(readback, "rb") as f:
+            return code_fingerprint(f.read().ljust(APROM_SIZE, b"\xFF"))
+
+
+def flash_config_only(runner, image, lock=True, session=None, **hooks):
+    """Rewrite only TAIL_PAGES of image if the board runs the same base firmware.
+
+    Returns the plans.PlanResult, or None when the firmware differs (or
+    cannot be checked) and a full flash is needed. hooks go to plans.execute.
+    """
+    target = code_fingerprint(aprom_bytes(image))
+    current = read_fingerprint(runner, session, **hooks)
+    if session is not None:
+        session.fingerprint = current  # What the board runs now (see registry.py to name it)
+    if current != target:
+        return None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        page_path = os.path.join(workdir, "config_pages.hex")
+        page_image(image, TAIL_PAGES).write_hex_file(page_path)
+        plan = [PROBE_STEP, RESET_STEP, erase_from_step(TAIL_PAGES[0]), write_step(page_path),
+                verify_step(page_path)]
+        if lock:
+            plan.append(LOCK_STEP)
+        result = execute(runner, plan, session, **hooks)
+    if session is not None:
+        session.fingerprint = target
+    return result
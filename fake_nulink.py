@@ -0,0 +1,195 @@
+"""Stand-in for NuLink_8051OT.exe used in development and CI.
+
+Point the tool at it with NULINK_TOOL=fake_nulink.py (or as a station slot
+tool). Each adapter keeps its simulated flash in FAKE_NULINK_STATE
+(default: <tmp>/fake_nulink/<adapter>.bin), so successive commands see the
+effect of earlier ones like a real board would.
+
+Supported: -l, -p, -e ALL, -e APROM [offset <addr>], -reset, -w APROM <hex|bin>,
+-r APROM <bin> [offset <addr>], -w cfg0 <value>. "-e APROM offset" erases
+from the page of addr to the end of APROM and "-r APROM <bin> offset" reads
+from addr to the end, as the real tool's help describes them. Writing APROM
+only programs (cells go from 1 to 0, nothing is erased), the least the real
+tool can be assumed to do, so code that forgets an erase fails against the
+fake too. A locked chip refuses reads and writes until it is erased.
+Options placed before the command:
+    --adapter ID    select the simulated adapter (default "0")
+    ID              the same, the way the real tool takes it (an ID listed by -l)
+
+Erase, program and read print their progress ("Program APROM ... 40%").
+
+Environment:
+    FAKE_NULINK_DELAY         seconds each command takes (default 0)
+    FAKE_NULINK_DISCONNECTED  "1" to simulate an unplugged board
+    FAKE_NULINK_ADAPTERS      comma-separated adapter IDs that -l lists (default "0")
+    FAKE_NULINK_HANG          "<command>[:N]" (e.g. "-w APROM:1") to hang on that
+                              command, only the first N times per adapter if given
+    FAKE_NULINK_BIT_ERRORS    "<bits>[:N]" to leave that many random 0 bits of the
+                              written bytes at 1 (cells that did not program) on
+                              APROM writes, only the first N per adapter if given
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from flash_layout import APROM_SIZE, PAGE_SIZE
+from sparse_image import SparseImage
+
+MCU_NAME = "MS51FB9AE"
+
+STATE_DIR = os.environ.get("FAKE_NULINK_STATE", os.path.join(tempfile.gettempdir(), "fake_nulink"))
+PROGRESS_STEPS = 10
+
+
+class Board:
+    def __init__(self, adapter):
+        self.memory_path = os.path.join(STATE_DIR, f"{adapter}.bin")
+        self.info_path = os.path.join(STATE_DIR, f"{adapter}.json")
+        try:
+            with open(self.memory_path, "rb") as f:
+                self.memory = bytearray(f.read().ljust(APROM_SIZE, b"\xFF"))
+        except FileNotFoundError:
+            self.memory = bytearray(b"\xFF" * APROM_SIZE)
+        try:
+            with open(self.info_path) as f:
+                self.info = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.info = {"cfg0": 0xFFFFFFFF}
+
+    @property
+    def locked(self):
+        return not self.info["cfg0"] & 0x2
+
+    def save(self):
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(self.memory_path, "wb") as f:
+            f.write(self.memory)
+        with open(self.info_path, "w") as f:
+            json.dump(self.info, f)
+
+
+def load_image(path):
+    if path.lower().endswith(".hex"):
+        return SparseImage.from_hex_file(path)
+    return SparseImage.from_bin_file(path)
+
+
+def program(board, image):
+    """Program without erasing: flash cells can only go from 1 to 0"""
+    for start, end in image.segments():
+        if end > APROM_SIZE:
+            raise ValueError(f"Address 0x{end - 1:X} outside APROM")
+    for start, end in image.segments():
+        data = image.view(start, end - start)
+        for i, value in enumerate(data, start):
+            board.memory[i] &= value
+
+
+def inject_bit_errors(board, image):
+    """Set FAKE_NULINK_BIT_ERRORS random 0 bits of the bytes image programmed back to 1 (weak cells)"""
+    bits, _, times = os.environ.get("FAKE_NULINK_BIT_ERRORS", "").partition(":")
+    writes = board.info.get("bit_error_writes", 0)
+    if not bits or (times and writes >= int(times)):
+        return
+    board.info["bit_error_writes"] = writes + 1
+    zeros = [(i, bit) for start, end in image.segments() for i in range(start, min(end, APROM_SIZE))
+             for bit in range(8) if not board.memory[i] >> bit & 1]
+    for i, bit in random.sample(zeros, min(int(bits), len(zeros))):
+        board.memory[i] |= 1 << bit
+
+
+def report_progress(label, delay):
+    """Spread delay over progress lines, like the real tool's counter"""
+    for step in range(PROGRESS_STEPS + 1):
+        print(f"{label} ... {step * 100 // PROGRESS_STEPS}%", flush=True)
+        if step < PROGRESS_STEPS:
+            time.sleep(delay / PROGRESS_STEPS)
+
+
+def should_hang(board, argv):
+    """FAKE_NULINK_HANG matches this command (and its count is not used up)"""
+    command, _, times = os.environ.get("FAKE_NULINK_HANG", "").partition(":")
+    if not command or " ".join(argv[:2]) != command:
+        return False
+    hangs = board.info.get("hangs", 0)
+    if times and hangs >= int(times):
+        return False
+    board.info["hangs"] = hangs + 1
+    board.save()
+    return True
+
+
+def main(argv):
+    adapter = "0"
+    if argv[:1] == ["--adapter"]:
+        adapter, argv = argv[1], argv[2:]
+    elif argv[:1] and not argv[0].startswith("-"):
+        adapter, argv = argv[0], argv[1:]
+    delay = float(os.environ.get("FAKE_NULINK_DELAY", "0"))
+    if argv[:2] not in (["-e", "ALL"], ["-w", "APROM"], ["-r", "APROM"]):
+        time.sleep(delay)  # The others spend it in report_progress
+    if os.environ.get("FAKE_NULINK_DISCONNECTED") == "1":
+        print("Error: No NuLink adapter / target found")
+        return 1
+
+    if argv == ["-l"]:  # Lists the adapters, no board involved
+        for i, adapter_id in enumerate(os.environ.get("FAKE_NULINK_ADAPTERS", "0").split(",")):
+            print(f"{i + 1}. NuLink ID: {adapter_id.strip()}")
+        return 0
+
+    board = Board(adapter)
+    if should_hang(board, argv):
+        print("Connecting ...", flush=True)
+        time.sleep(3600)
+        return 1
+    command = argv[:1]
+    if command == ["-p"]:
+        print(f">>> NuLink adapter {adapter}")
+        print(f">>> {MCU_NAME} (APROM {APROM_SIZE // 1024}KB)")
+    elif argv == ["-e", "ALL"]:
+        report_progress("Erase ALL", delay)
+        board.memory[:] = b"\xFF" * APROM_SIZE
+        board.info["cfg0"] = 0xFFFFFFFF
+        print("Erase ALL ... done")
+    elif argv[:2] == ["-e", "APROM"] and argv[2:3] in ([], ["offset"]) and len(argv) in (2, 4):
+        if board.locked:
+            print("Error: chip is locked, erase it first")
+            return 1
+        start = int(argv[3], 16) // PAGE_SIZE * PAGE_SIZE if len(argv) == 4 else 0
+        board.memory[start:] = b"\xFF" * (APROM_SIZE - start)
+        print("Erase APROM ... done")
+    elif command == ["-reset"]:
+        print("Reset ... done")
+    elif len(argv) == 3 and argv[:2] == ["-w", "APROM"]:
+        if board.locked:
+            print("Error: chip is locked, erase it first")
+            return 1
+        image = load_image(argv[2])
+        report_progress("Program APROM", delay)
+        program(board, image)
+        inject_bit_errors(board, image)
+        print("Program APROM ... done")
+    elif argv[:2] == ["-r", "APROM"] and argv[3:4] in ([], ["offset"]) and len(argv) in (3, 5):
+        if board.locked:
+            print("Error: chip is locked, APROM cannot be read")
+            return 1
+        start = int(argv[4], 16) if len(argv) == 5 else 0
+        report_progress("Read APROM", delay * (APROM_SIZE - start) / APROM_SIZE)  # Time goes with the size
+        with open(argv[2], "wb") as f:
+            f.write(board.memory[start:])
+        print("Read APROM ... done")
+    elif len(argv) == 3 and argv[:2] == ["-w", "cfg0"]:
+        board.info["cfg0"] = int(argv[2], 16)
+        print("Program CONFIG0 ... done")
+    else:
+        print(f"Unsupported command: {' '.join(argv)}")
+        return 2
+    board.save()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
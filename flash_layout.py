@@ -0,0 +1,66 @@
+"""Flash geometry of the target MCU and page/fingerprint hashing.
+
+The MS51FB9AE has 32 KB of APROM in 128-byte pages; the config block at
+0x7F00 lives in the last pages. The firmware fingerprint hashes APROM with
+those config pages left out, so two boards running the same base firmware
+match whatever their parameters are.
+"""
+import hashlib
+
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE
+from sparse_image import SparseImage
+
+APROM_SIZE = 0x8000
+PAGE_SIZE = 128
+ERASED = 0xFF
+
+
+def pages_covering(address, size):
+    """Start addresses of the pages touched by [address, address + size)"""
+    first = address - address % PAGE_SIZE
+    return list(range(first, address + size, PAGE_SIZE))
+
+
+CONFIG_PAGES = pages_covering(CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE)
+
+
+def image_pages(image):
+    """Start addresses of the APROM pages a SparseImage programs"""
+    pages = set()
+    for start, end in image.segments():
+        end = min(end, APROM_SIZE)
+        if start < end:
+            pages.update(pages_covering(start, end - start))
+    return sorted(pages)
+
+
+def page_image(image, pages):
+    """SparseImage holding only the given pages of image (gaps as 0xFF)"""
+    pages_only = SparseImage()
+    for page in pages:
+        pages_only.write(page, image.read(page, PAGE_SIZE))
+    return pages_only
+
+
+def aprom_bytes(image):
+    """Full APROM content of a SparseImage, unprogrammed bytes as 0xFF"""
+    return image.read(0, APROM_SIZE, pad=ERASED)
+
+
+def page_hashes(aprom, pages=None):
+    """{page address: SHA-256 digest} for the given pages (default: all)"""
+    if pages is None:
+        pages = range(0, len(aprom), PAGE_SIZE)
+    return {page: hashlib.sha256(aprom[page:page + PAGE_SIZE]).digest() for page in pages}
+
+
+def code_fingerprint(aprom):
+    """Hash of APROM outside the config pages"""
+    digest = hashlib.sha256()
+    view = memoryview(aprom)
+    position = 0
+    for page in CONFIG_PAGES:
+        digest.update(view[position:page])
+        position = page + PAGE_SIZE
+    digest.update(view[position:APROM_SIZE])
+    return digest.hexdigest()
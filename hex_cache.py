@@ -0,0 +1,157 @@
+"""Cache of parsed base firmware images, in memory and on disk.
+
+Parsing Intel HEX text is the slow part of every Save & Flash / Generate, so
+parsed images are kept as binary snapshots (a list of contiguous segments).
+The in-memory cache is keyed by (path, mtime, size); the disk cache is keyed
+by the SHA-256 of the file content, so a renamed or copied base firmware still
+hits. Both sides evict least recently used entries above a size cap.
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+from atomic_file import write_atomic
+from sparse_image import SparseImage
+
+SNAPSHOT_MAGIC = b"FTHX"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct(">4sBI")
+_SEGMENT = struct.Struct(">II")
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "flashtool_cache", "images")
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dump_snapshot(segments, start_addr=None):
+    """Serialize [(start, bytes), ...] and the start address record"""
+    parts = [_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(segments))]
+    for start, data in segments:
+        parts.append(_SEGMENT.pack(start, len(data)))
+        parts.append(bytes(data))
+    parts.append(json.dumps(start_addr).encode())
+    return b"".join(parts)
+
+
+def load_snapshot(blob):
+    """Inverse of dump_snapshot, returns (segments, start_addr)"""
+    magic, version, count = _HEADER.unpack_from(blob, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError("Not a firmware snapshot")
+    offset = _HEADER.size
+    segments = []
+    for _ in range(count):
+        start, length = _SEGMENT.unpack_from(blob, offset)
+        offset += _SEGMENT.size
+        segments.append((start, blob[offset:offset + length]))
+        offset += length
+    return segments, json.loads(blob[offset:])
+
+
+def prune_cache_dir(cache_dir, max_bytes, suffix=""):
+    """Delete least recently used files (oldest mtime) until the directory fits max_bytes"""
+    try:
+        entries = [e for e in os.scandir(cache_dir) if e.is_file() and e.name.endswith(suffix)]
+    except FileNotFoundError:
+        return
+    stats = sorted(((e.stat(), e.path) for e in entries), key=lambda item: item[0].st_mtime)
+    total = sum(st.st_size for st, _ in stats)
+    for st, path in stats:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= st.st_size
+        except OSError:
+            pass
+
+
+class ImageCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_memory=64 << 20, max_disk=256 << 20):
+        self.cache_dir = cache_dir
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self._entries = OrderedDict()  # (path, mtime_ns, size) -> (digest, segments, start_addr, nbytes)
+        self._memory_used = 0
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        """Return (digest, segments, start_addr) for a hex file, parsing it only on a miss"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[:3]
+
+        digest = file_digest(path)
+        cached = self._read_disk(digest)
+        if cached is None:
+            image = SparseImage.from_hex_file(path)
+            segments = [(start, bytes(image.view(start, end - start))) for start, end in image.segments()]
+            cached = (segments, image.start_addr)
+            self._write_disk(digest, *cached)
+        segments, start_addr = cached
+
+        nbytes = sum(len(data) for _, data in segments)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (digest, segments, start_addr, nbytes)
+                self._memory_used += nbytes
+                while self._memory_used > self.max_memory and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._memory_used -= evicted[3]
+        return digest, segments, start_addr
+
+    def load(self, path):
+        """Return a fresh SparseImage for path, safe for the caller to modify"""
+        _, segments, start_addr = self.get(path)
+        return SparseImage.from_segments(segments, start_addr)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._memory_used = 0
+
+    def _snapshot_path(self, digest):
+        return os.path.join(self.cache_dir, digest + ".bin")
+
+    def _read_disk(self, digest):
+        path = self._snapshot_path(digest)
+        try:
+            with open(path, "rb") as f:
+                cached = load_snapshot(f.read())
+            os.utime(path)  # Mark as recently used for pruning
+            return cached
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def _write_disk(self, digest, segments, start_addr):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            write_atomic(self._snapshot_path(digest), dump_snapshot(segments, start_addr))
+            prune_cache_dir(self.cache_dir, self.max_disk, suffix=".bin")
+        except OSError:
+            pass  # The disk cache is best effort
+
+
+default_cache = ImageCache()
+
+
+def load_hex(path):
+    """Parsed copy of a hex file through the shared cache"""
+    return default_cache.load(path)
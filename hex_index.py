@@ -0,0 +1,228 @@
+"""Intel HEX record reading and an address -> file offset index.
+
+Patching or decoding the config block only touches a few records, but
+finding them means decoding the header of every line. RecordIndex keeps,
+for each data record, its address range and where its line sits in the
+file; it is saved in the local cache (<tmp>/flashtool_cache/index), keyed by
+the hex file's absolute path, so later operations seek straight to the right
+lines without reading the rest of the file. Nothing is written next to the
+hex, which often sits on a read-only or shared folder.
+
+An index is used only while the file's size and mtime are the ones it was
+built from, and the header of every line read through it is checked again;
+any mismatch falls back to a full scan that rewrites the index.
+"""
+import bisect
+import hashlib
+import os
+import struct
+import tempfile
+
+from atomic_file import write_atomic
+
+RECORD_DATA = 0x00
+RECORD_EOF = 0x01
+RECORD_EXT_SEGMENT = 0x02
+RECORD_EXT_LINEAR = 0x04
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"FTIX"
+INDEX_VERSION = 1
+# magic, version, source size, source mtime_ns, EOF line offset, base at EOF, CRLF, record count
+_HEADER = struct.Struct(">4sBQQQIBI")
+# address, length, line start, line end, extended address base
+_RECORD = struct.Struct(">IBIII")
+_MAX_RECORD_LENGTH = 0xFF
+
+DEFAULT_INDEX_DIR = os.path.join(tempfile.gettempdir(), "flashtool_cache", "index")
+MAX_INDEX_BYTES = 64 << 20
+
+
+class HexFormatError(ValueError):
+    pass
+
+
+class StaleIndexError(ValueError):
+    pass
+
+
+def iter_records(source):
+    """Yield (line_start, line_end, address, rtype, length) for each record.
+
+    ``address`` is absolute (extended segment/linear records applied) and
+    ``line_end`` includes the newline. Only the record header is decoded.
+    """
+    base = 0
+    pos = 0
+    size = len(source)
+    while pos < size:
+        end = source.find(b"\n", pos)
+        end = size if end < 0 else end + 1
+        colon = source.find(b":", pos, end)
+        if colon >= 0:
+            length = int(source[colon + 1:colon + 3], 16)
+            offset = int(source[colon + 3:colon + 7], 16)
+            rtype = int(source[colon + 7:colon + 9], 16)
+            if rtype == RECORD_EXT_SEGMENT:
+                base = int(source[colon + 9:colon + 13], 16) << 4
+            elif rtype == RECORD_EXT_LINEAR:
+                base = int(source[colon + 9:colon + 13], 16) << 16
+            yield pos, end, base + offset, rtype, length
+        pos = end
+
+
+def record_data(source, line_start, length):
+    """Decode the data bytes of the record starting at line_start"""
+    colon = source.index(b":", line_start)
+    return bytearray.fromhex(source[colon + 9:colon + 9 + 2 * length].decode())
+
+
+def decode_record(line):
+    """(length, offset, rtype, data) of one record line, checksum verified"""
+    colon = line.find(b":")
+    try:
+        record = bytes.fromhex(line[colon + 1:].strip().decode())
+    except ValueError:
+        raise HexFormatError(f"Bad record: {bytes(line[:40])!r}") from None
+    if colon < 0 or len(record) < 5 or len(record) != record[0] + 5 or sum(record) & 0xFF:
+        raise HexFormatError(f"Bad record: {bytes(line[:40])!r}")
+    return record[0], (record[1] << 8) | record[2], record[3], record[4:-1]
+
+
+class RecordIndex:
+    """Data records of one hex file sorted by address.
+
+    Each record is (address, length, line_start, line_end, base) where base
+    is the extended address in effect, so address - base is the offset
+    field of the line.
+    """
+
+    def __init__(self, records, eof_start, base_at_eof=0, crlf=False, size=0, mtime_ns=0):
+        self.records = sorted(records)
+        self._addresses = [record[0] for record in self.records]
+        self.eof_start = eof_start
+        self.base_at_eof = base_at_eof
+        self.crlf = crlf
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def build(cls, source, size=0, mtime_ns=0):
+        """Index every data record of source (bytes or mmap)"""
+        records = []
+        base = 0
+        eof_start = len(source)
+        for line_start, line_end, address, rtype, length in iter_records(source):
+            if rtype == RECORD_EOF:
+                eof_start = line_start
+                break
+            if rtype in (RECORD_EXT_SEGMENT, RECORD_EXT_LINEAR):
+                base = address
+            elif rtype == RECORD_DATA:
+                records.append((address, length, line_start, line_end, base))
+        return cls(records, eof_start, base, b"\r\n" in source[:1024], size, mtime_ns)
+
+    def overlapping(self, start, size):
+        """Records holding any byte of [start, start + size), in file order"""
+        first = bisect.bisect_left(self._addresses, start - _MAX_RECORD_LENGTH)
+        last = bisect.bisect_left(self._addresses, start + size)
+        found = [r for r in self.records[first:last] if r[0] + r[1] > start]
+        return sorted(found, key=lambda record: record[2])
+
+    def check(self, source, records):
+        """Raise StaleIndexError unless each record's line in source still matches"""
+        for address, length, line_start, line_end, base in records:
+            line = source[line_start:line_end]
+            try:
+                header = bytes.fromhex(line[1:9].decode()) if line[:1] == b":" else b""
+            except ValueError:
+                header = b""
+            if header != bytes([length, (address - base) >> 8 & 0xFF, (address - base) & 0xFF, RECORD_DATA]):
+                raise StaleIndexError(f"Index does not match the line at offset {line_start}")
+
+    def check_eof(self, source):
+        """Raise StaleIndexError unless the EOF record (if any) is where the index says"""
+        if self.eof_start > len(source) or (self.eof_start < len(source)
+                                            and source[self.eof_start:self.eof_start + 9] != b":00000001"):
+            raise StaleIndexError(f"No EOF record at offset {self.eof_start}")
+
+    def read_records(self, f, records):
+        """Yield (address, data) of records by seeking in the open binary file f"""
+        for address, length, line_start, line_end, base in records:
+            f.seek(line_start)
+            line = f.read(line_end - line_start)
+            self.check(line, [(address, length, 0, len(line), base)])
+            yield address, decode_record(line)[3]
+
+    def dump(self):
+        parts = [_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.size, self.mtime_ns, self.eof_start,
+                              self.base_at_eof, self.crlf, len(self.records))]
+        parts.extend(_RECORD.pack(*record) for record in self.records)
+        return b"".join(parts)
+
+    @classmethod
+    def load(cls, blob):
+        magic, version, size, mtime_ns, eof_start, base_at_eof, crlf, count = _HEADER.unpack_from(blob, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("Not a record index")
+        if len(blob) != _HEADER.size + count * _RECORD.size:
+            raise ValueError("Truncated record index")
+        records = list(_RECORD.iter_unpack(blob[_HEADER.size:]))
+        return cls(records, eof_start, base_at_eof, bool(crlf), size, mtime_ns)
+
+
+def index_path(hex_path):
+    """Cache file of the index of the hex file at hex_path"""
+    key = os.path.normcase(os.path.abspath(hex_path)).encode("utf-8", "surrogateescape")
+    return os.path.join(DEFAULT_INDEX_DIR, hashlib.sha256(key).hexdigest() + INDEX_SUFFIX)
+
+
+def _read(hex_path, source):
+    if source is None:
+        with open(hex_path, "rb") as f:
+            source = f.read()
+    return source
+
+
+def save_index(path, index):
+    from hex_cache import prune_cache_dir  # hex_cache imports sparse_image, which imports this module
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, index.dump())
+    except OSError:
+        return None
+    prune_cache_dir(os.path.dirname(path), MAX_INDEX_BYTES, INDEX_SUFFIX)
+    return path
+
+
+def load_index(hex_path, source=None, create=True):
+    """RecordIndex of hex_path from the cache, else built (and saved).
+
+    A cached index is used while hex_path keeps its size and mtime; only the
+    file's metadata is read for it. source, when the caller already read (or
+    mapped) the file, avoids reading it again for a rebuild. With create=False
+    a missing or outdated index gives None.
+    """
+    path = index_path(hex_path)
+    try:
+        st = os.stat(hex_path)
+        with open(path, "rb") as f:
+            index = RecordIndex.load(f.read())
+        if (index.size, index.mtime_ns) == (st.st_size, st.st_mtime_ns):
+            os.utime(path)  # Recently used, see prune_cache_dir
+            return index
+    except (OSError, ValueError, struct.error):
+        pass
+    if not create:
+        return None
+    return rebuild_index(hex_path, source)
+
+
+def rebuild_index(hex_path, source=None):
+    """Full scan of hex_path into a new RecordIndex, saved in the cache"""
+    st = os.stat(hex_path)  # Before the read: a change during it makes the index outdated, not wrong
+    source = _read(hex_path, source)
+    index = RecordIndex.build(source, len(source), st.st_mtime_ns)
+    save_index(index_path(hex_path), index)
+    return index
@@ -0,0 +1,277 @@
+"""Local hex generation service that keeps base images and the encoder warm.
+
+Every GUI session and script pays interpreter start, imports and the base hex
+scan before its first file. This long-running server does that once: base
+firmwares are registered by name or path, their HexSplicer (and unit
+templates, see template.py) stay in memory, and requests are served
+concurrently, one thread each.
+
+    python hex_service.py [--port 8765] [--base main=fw/main.hex ...]
+    FlashTool.exe serve --base main=fw/main.hex
+
+Endpoints (JSON in and out, errors as {"error": ..., "violations": [...]}):
+
+    GET  /health                      {"ok": true, "bases": n, "requests": n}
+    GET  /bases                       registered bases
+    POST /bases     {"path", "name"}  register a base, gives its id (SHA-256)
+    POST /generate  {"base", "config", "format"}
+        base    id or name; a name follows its file when it changes
+        config  config dict as batch.py rows take it (serial / lot / date too)
+        format  "hex" (default): the patched hex file, "block": the config
+                block bytes (application/octet-stream)
+
+Only localhost is served unless --host says otherwise. request_hex() is the
+client side for scripts.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE, encode_config
+from hex_cache import file_digest
+from hex_splice import splicer_for_file
+from metrics import metrics
+from registry import FirmwareRegistry, check_layout
+from template import UNIT_OFFSET, ImageTemplate, unit_from_row
+from validate import format_violation, validate_rows
+
+DEFAULT_PORT = 8765
+DEFAULT_URL = os.environ.get("FLASHTOOL_SERVICE_URL", f"http://127.0.0.1:{DEFAULT_PORT}")
+MAX_REQUEST = 1 << 20
+MAX_TEMPLATES = 64
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message, violations=()):
+        super().__init__(message)
+        self.status = status
+        self.violations = list(violations)
+
+
+class BaseImage:
+    """One registered base firmware, ready to render"""
+
+    def __init__(self, path, name=None):
+        self.path = os.path.abspath(path)
+        self.name = name or os.path.splitext(os.path.basename(path))[0]
+        st = os.stat(self.path)
+        self.stat = (st.st_size, st.st_mtime_ns)
+        self.id = file_digest(self.path)
+        self.splicer = splicer_for_file(self.path, CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE)
+        self._templates = OrderedDict()  # static config block -> ImageTemplate
+        self._lock = threading.Lock()
+
+    def changed(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False  # Keep serving what was loaded
+        return (st.st_size, st.st_mtime_ns) != self.stat
+
+    def template(self, config_data):
+        key = bytes(config_data)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                return template
+        template = ImageTemplate(self.splicer.render(config_data))
+        with self._lock:
+            self._templates[key] = template
+            while len(self._templates) > MAX_TEMPLATES:
+                self._templates.popitem(last=False)
+        return template
+
+    def describe(self):
+        return {"id": self.id, "name": self.name, "path": self.path, "size": self.stat[0]}
+
+
+class HexService:
+    """Base registry and generation, independent of HTTP"""
+
+    def __init__(self, registry=None):
+        self.registry = registry or FirmwareRegistry()  # Refuses bases built for another config layout
+        self._by_id = {}
+        self._by_name = {}
+        self._lock = threading.Lock()
+        self.requests = 0  # Counted by count_request, from every handler thread
+
+    def register(self, path, name=None):
+        if not os.path.isfile(path):
+            raise ServiceError(404, f"No such file: {path}")
+        try:
+            check_layout(path, self.registry)
+        except ValueError as e:
+            raise ServiceError(409, str(e)) from None
+        base = BaseImage(path, name)
+        with self._lock:
+            self._by_id[base.id] = base
+            self._by_name[base.name] = base
+        return base
+
+    def base(self, key):
+        """Base by id or name; a named base is reloaded when its file changed"""
+        with self._lock:
+            base = self._by_id.get(key) or self._by_name.get(key)
+        if base is None:
+            raise ServiceError(404, f"Unknown base: {key}")
+        if key == base.name and base.changed():
+            base = self.register(base.path, base.name)
+        return base
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def bases(self):
+        with self._lock:
+            return [base.describe() for base in self._by_name.values()]
+
+    def generate(self, base_key, config, fmt="hex"):
+        """(content type, body) for one parameter set"""
+        if fmt not in ("hex", "block"):
+            raise ServiceError(400, f"Unknown format: {fmt}")
+        if not isinstance(config, dict):
+            raise ServiceError(400, "config must be an object")
+        violations = validate_rows([config], use_numpy=False)  # One row, NumPy would only add overhead
+        if violations:
+            raise ServiceError(400, "Invalid config", [format_violation(v) for v in violations])
+        base = self.base(base_key)
+        config_data = encode_config(config)
+        unit = unit_from_row(config)
+        if fmt == "block":
+            if unit is not None:
+                config_data[UNIT_OFFSET:UNIT_OFFSET + len(unit)] = unit
+            return "application/octet-stream", bytes(config_data)
+        if unit is not None:
+            return "text/plain", bytes(base.template(config_data).stamp(unit))
+        return "text/plain", base.splicer.render(config_data)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive for clients that send many requests
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def _get(self):
+        service = self.server.service
+        if self.path == "/health":
+            return self._json({"ok": True, "bases": len(service.bases()), "requests": service.requests})
+        if self.path == "/bases":
+            return self._json({"bases": service.bases()})
+        raise ServiceError(404, f"Not found: {self.path}")
+
+    def _post(self):
+        service = self.server.service
+        request = self._read_json()
+        if self.path == "/bases":
+            base = service.register(request.get("path", ""), request.get("name"))
+            return self._json(base.describe())
+        if self.path == "/generate":
+            content_type, body = service.generate(request.get("base"), request.get("config", {}),
+                                                  request.get("format", "hex"))
+            return self._send(200, content_type, body)
+        raise ServiceError(404, f"Not found: {self.path}")
+
+    def _handle(self, method):
+        start = time.perf_counter()
+        status = 500
+        try:
+            status = method()
+        except ServiceError as e:
+            self.close_connection = True  # The body may not have been read
+            status = self._json({"error": str(e), "violations": e.violations}, e.status)
+        except Exception as e:
+            status = self._json({"error": str(e), "violations": []}, 500)
+        finally:
+            self.server.service.count_request()
+            metrics.record("service", time.perf_counter() - start, status < 400,
+                           path=self.path, status=status)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST:
+            raise ServiceError(413, "Request too large")
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ServiceError(400, "Body is not JSON") from None
+        if not isinstance(request, dict):
+            raise ServiceError(400, "Body must be a JSON object")
+        return request
+
+    def _json(self, value, status=200):
+        return self._send(status, "application/json", json.dumps(value).encode())
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return status
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=DEFAULT_PORT, service=None, verbose=False):
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service or HexService()
+    server.verbose = verbose
+    return server
+
+
+def request_hex(config, base, fmt="hex", url=DEFAULT_URL, timeout=10):
+    """Client: bytes of the generated hex (or config block) from a running service"""
+    body = json.dumps({"base": base, "config": config, "format": fmt}).encode()
+    request = urllib.request.Request(url.rstrip("/") + "/generate", body, {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.read()
+    except urllib.error.HTTPError as e:
+        try:
+            detail = json.loads(e.read())
+        except ValueError:
+            raise e from None
+        raise ServiceError(e.code, detail.get("error", str(e)), detail.get("violations", ())) from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="hex_service", description="Serve hex generation on localhost")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (default: localhost only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--base", action="append", default=[], metavar="[NAME=]PATH", help="base firmware to load")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, verbose=args.verbose)
+    for spec in args.base:
+        name, _, path = spec.rpartition("=")
+        base = server.service.register(path, name or None)
+        print(f"{base.name}: {base.path} ({base.id[:12]})")
+    print(f"Serving on http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
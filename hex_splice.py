@@ -0,0 +1,115 @@
+"""Splice-in-place Intel HEX writer.
+
+Only the config block changes between the base firmware and a generated file,
+so instead of re-serializing the whole image the original file is copied
+record by record as byte slices. Data records overlapping the patched range
+are re-emitted with the new bytes and checksum (same address and length);
+bytes of the range that the base file does not contain are added as new
+records just before the EOF record.
+"""
+from hex_index import (RECORD_DATA, RECORD_EOF, RECORD_EXT_LINEAR, RecordIndex, StaleIndexError, load_index,
+                       rebuild_index, record_data)
+
+NEW_RECORD_SIZE = 16
+
+
+def format_record(address, rtype, data=b""):
+    """One Intel HEX record line (without newline) as bytes"""
+    record = bytes([len(data), (address >> 8) & 0xFF, address & 0xFF, rtype]) + bytes(data)
+    checksum = (-sum(record)) & 0xFF
+    return b":" + record.hex().upper().encode() + b"%02X" % checksum
+
+
+class HexSplicer:
+    """Re-emits one source hex with the range [start, start + size) replaced.
+
+    The overlapping records are found once, through index (a
+    hex_index.RecordIndex of source) or a scan of source; render() then only
+    formats those records, so it can be called repeatedly (batch generation).
+    """
+
+    def __init__(self, source, start, size, index=None):
+        self.start = start
+        self.size = size
+        self._pieces = []  # bytes slices, or (address, record offset, original data) to patch
+        if index is None:
+            index = RecordIndex.build(source)
+        records = index.overlapping(start, size)
+        index.check(source, records)
+        index.check_eof(source)
+        self.newline = b"\r\n" if index.crlf else b"\n"
+        covered = bytearray(size)
+        copied_from = 0
+        for address, length, line_start, line_end, base in records:
+            self._pieces.append(source[copied_from:line_start])
+            self._pieces.append((address, address - base, record_data(source, line_start, length)))
+            copied_from = line_end
+            for i in range(max(address, start), min(address + length, start + size)):
+                covered[i - start] = 1
+        self._pieces.append(source[copied_from:index.eof_start])
+        self._missing = self._missing_runs(covered)
+        self._base_at_eof = index.base_at_eof
+        self._tail = source[index.eof_start:]
+
+    def _missing_runs(self, covered):
+        runs = []
+        i = 0
+        while i < self.size:
+            if covered[i]:
+                i += 1
+                continue
+            j = i
+            while j < self.size and not covered[j] and j - i < NEW_RECORD_SIZE:
+                j += 1
+            runs.append((self.start + i, j - i))
+            i = j
+        return runs
+
+    def render(self, data):
+        """Return the full output file with ``data`` written at ``start``"""
+        if len(data) != self.size:
+            raise ValueError(f"Expected {self.size} bytes, got {len(data)}")
+        data = bytes(data)
+        out = []
+        for piece in self._pieces:
+            if isinstance(piece, tuple):
+                address, offset, record = piece
+                record = bytearray(record)
+                lo = max(address, self.start)
+                hi = min(address + len(record), self.start + self.size)
+                record[lo - address:hi - address] = data[lo - self.start:hi - self.start]
+                out.append(format_record(offset, RECORD_DATA, record) + self.newline)
+            else:
+                out.append(piece)
+        base = self._base_at_eof
+        for address, length in self._missing:
+            upper = address & ~0xFFFF
+            if upper != base:
+                out.append(format_record(0, RECORD_EXT_LINEAR, (upper >> 16).to_bytes(2, "big")) + self.newline)
+                base = upper
+            chunk = data[address - self.start:address - self.start + length]
+            out.append(format_record(address & 0xFFFF, RECORD_DATA, chunk) + self.newline)
+        out.append(self._tail or format_record(0, RECORD_EOF) + self.newline)
+        return b"".join(out)
+
+
+def splicer_for_file(path, start, size):
+    """HexSplicer of the hex file at path, located through its cached record index"""
+    with open(path, "rb") as f:
+        source = f.read()
+    try:
+        return HexSplicer(source, start, size, load_index(path, source))
+    except StaleIndexError:
+        return HexSplicer(source, start, size, rebuild_index(path, source))
+
+
+def splice_hex(src_path, start, data):
+    """The hex file at src_path with ``data`` spliced in at ``start``, as bytes"""
+    return splicer_for_file(src_path, start, len(data)).render(data)
+
+
+def splice_hex_file(src_path, dst_path, start, data):
+    """Write src_path to dst_path with ``data`` spliced in at ``start``"""
+    output = splice_hex(src_path, start, data)
+    with open(dst_path, "wb") as f:
+        f.write(output)
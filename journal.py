@@ -0,0 +1,211 @@
+"""Persistent flash job journal (SQLite in WAL mode) for crash recovery.
+
+A run is one image flashed on a number of boards (station slots x rounds,
+or one Save & Flash from the GUI). Every board gets a row and every step it
+completes (probe, erase, reset, write, lock) is recorded, so after a crash
+or restart the run resumes where it stopped: finished boards are skipped,
+a board that was written but not locked only gets the lock, anything else
+is flashed again from the erase.
+
+Writes are queued to one writer thread and committed in batches (every
+FLUSH_INTERVAL seconds or BATCH_SIZE writes), so journaling never waits on
+the disk inside a flash cycle. At worst the last batch is lost in a crash,
+which only means a step is repeated.
+
+Environment:
+    FLASHTOOL_JOURNAL  database file (default <tmp>/flashtool_journal.sqlite)
+"""
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from plans import PROBE_STEP
+
+DEFAULT_JOURNAL = os.environ.get("FLASHTOOL_JOURNAL",
+                                 os.path.join(tempfile.gettempdir(), "flashtool_journal.sqlite"))
+FLUSH_INTERVAL = 0.5
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    station TEXT NOT NULL,
+    image TEXT,
+    image_digest TEXT,
+    lock INTEGER,
+    rounds INTEGER,
+    status TEXT NOT NULL,
+    created REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS boards (
+    id TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL REFERENCES runs(id),
+    slot TEXT,
+    seq INTEGER,
+    status TEXT NOT NULL,
+    mcu_id TEXT,
+    error TEXT,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS steps (
+    id INTEGER PRIMARY KEY,
+    board_id TEXT NOT NULL REFERENCES boards(id),
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    seconds REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS boards_run ON boards(run_id);
+CREATE INDEX IF NOT EXISTS steps_board ON steps(board_id);
+CREATE INDEX IF NOT EXISTS runs_open ON runs(station, status);
+"""
+
+# Step outcomes that mean the step's effect holds on the board
+DONE_STEP = ("done", "skipped")
+FINISHED_BOARD = ("done", "failed")
+
+
+def resume_plan(plan, done_steps):
+    """Steps of plan still needed on a board that already completed done_steps (names).
+
+    Partially programmed flash cannot be rewritten without an erase, so
+    unless the write completed the whole plan runs again.
+    """
+    names = [step.name for step in plan]
+    if all(name in done_steps for name in names):
+        return []
+    if "write" in done_steps and "write" in names:
+        rest = [step for step in plan[names.index("write") + 1:] if step.name not in done_steps]
+        return [PROBE_STEP] + rest
+    return list(plan)
+
+
+class FlashJournal:
+    def __init__(self, path=DEFAULT_JOURNAL, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent, only the last commits can be lost
+        return conn
+
+    # Writes: queued, ids are made here so callers never wait for the database
+
+    def _put(self, sql, params):
+        self._writes.put((sql, params))
+
+    def start_run(self, station, image=None, image_digest=None, lock=True, rounds=1):
+        run_id = uuid.uuid4().hex
+        self._put("INSERT INTO runs (id, station, image, image_digest, lock, rounds, status, created) "
+                  "VALUES (?, ?, ?, ?, ?, ?, 'running', ?)",
+                  (run_id, station, image, image_digest, int(lock), rounds, time.time()))
+        return run_id
+
+    def finish_run(self, run_id, status="done"):
+        self._put("UPDATE runs SET status = ?, finished = ? WHERE id = ?", (status, time.time(), run_id))
+
+    def abandon_runs(self, station):
+        """Close the unfinished runs of station, e.g. when a new run replaces them"""
+        self._put("UPDATE runs SET status = 'abandoned', finished = ? WHERE station = ? AND status = 'running'",
+                  (time.time(), station))
+
+    def add_board(self, run_id, slot, seq):
+        """Board id of (slot, seq) in the run; its row is created on first use"""
+        board_id = f"{run_id}/{slot}/{seq}"
+        self._put("INSERT OR IGNORE INTO boards (id, run_id, slot, seq, status) VALUES (?, ?, ?, ?, 'pending')",
+                  (board_id, run_id, slot, seq))
+        return board_id
+
+    def board_started(self, board_id):
+        self._put("UPDATE boards SET status = 'running', started = ? WHERE id = ?", (time.time(), board_id))
+
+    def step_finished(self, board_id, step, status="done", seconds=None):
+        """Record a step outcome: "done", "skipped" (effect already held) or "failed" """
+        self._put("INSERT INTO steps (board_id, step, status, seconds, finished) VALUES (?, ?, ?, ?, ?)",
+                  (board_id, step, status, seconds, time.time()))
+
+    def board_finished(self, board_id, ok, mcu_id=None, error=None):
+        self._put("UPDATE boards SET status = ?, mcu_id = ?, error = ?, finished = ? WHERE id = ?",
+                  ("done" if ok else "failed", mcu_id, error, time.time(), board_id))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is committed"""
+        committed = threading.Event()
+        self._writes.put(committed)
+        return committed.wait(timeout)
+
+    def close(self):
+        self.flush()
+        self._writes.put(None)
+        self._writer.join()
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                batch = [self._writes.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while batch[-1] is not None and not isinstance(batch[-1], threading.Event) \
+                        and len(batch) < BATCH_SIZE:
+                    try:
+                        batch.append(self._writes.get(timeout=max(0.0, deadline - time.monotonic())))
+                    except queue.Empty:
+                        break
+                try:
+                    with conn:
+                        for item in batch:
+                            if isinstance(item, tuple):
+                                conn.execute(*item)
+                except sqlite3.Error as e:
+                    print(f"Journal write failed: {e}")  # The flash itself goes on
+                for item in batch:
+                    if isinstance(item, threading.Event):
+                        item.set()
+                if batch[-1] is None:
+                    break
+        finally:
+            conn.close()
+
+    # Reads: pending writes are flushed first so they see the latest state
+
+    def open_run(self, station, image_digest=None):
+        """Latest unfinished run of station (for that image), as a dict, or None"""
+        self.flush()
+        sql = "SELECT id, image, image_digest, lock, rounds FROM runs WHERE station = ? AND status = 'running'"
+        params = [station]
+        if image_digest is not None:
+            sql += " AND image_digest = ?"
+            params.append(image_digest)
+        with closing(self._connect()) as conn:
+            row = conn.execute(sql + " ORDER BY created DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "image", "image_digest", "lock", "rounds"), row))
+
+    def board_progress(self, run_id):
+        """{(slot, seq): (board status, set of completed step names)} of a run"""
+        self.flush()
+        progress = {}
+        with closing(self._connect()) as conn:
+            for board_id, slot, seq, status in conn.execute(
+                    "SELECT id, slot, seq, status FROM boards WHERE run_id = ?", (run_id,)):
+                steps = {name for name, in conn.execute(
+                    "SELECT step FROM steps WHERE board_id = ? AND status IN (?, ?)", (board_id,) + DONE_STEP)}
+                progress[(slot, seq)] = (status, steps)
+        return progress
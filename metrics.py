@@ -0,0 +1,228 @@
+"""Timing spans and flash station throughput metrics.
+
+Spans time one piece of work: every NuLink command (tagged with the command
+and its exit code), the hex parse, the config encode, the file write and the
+whole flash cycle of a board. Each span is appended as one JSON line to a
+rotating log, and after every cycle a Prometheus textfile is rewritten with,
+per station: boards flashed in the last hour, p50/p95 cycle time, failure
+rate, cycle counters and NuLink time per command.
+
+Each process (the GUI, a headless station, ...) writes its own span log,
+spans_<process>.jsonl, and its own textfile, flashtool_<process>.prom, with a
+"process" label on every sample, so two processes never rotate or overwrite
+each other's files (give processes running at once different
+FLASHTOOL_PROCESS names). node_exporter's textfile collector reads all the
+.prom files of the folder, python metrics.py all the span logs.
+
+Environment:
+    FLASHTOOL_METRICS_DIR  where the files go (default <tmp>/flashtool_metrics)
+    FLASHTOOL_METRICS      "0" to keep metrics in memory only
+    FLASHTOOL_STATION      station label (default: the host name)
+    FLASHTOOL_PROCESS      process label (default: the script name, e.g. "app", "station")
+
+    python metrics.py [spans_app.jsonl ...]   summarize the span logs (default: all of them)
+"""
+import glob
+import json
+import logging
+import logging.handlers
+import math
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from atomic_file import write_atomic
+
+METRICS_DIR = os.environ.get("FLASHTOOL_METRICS_DIR", os.path.join(tempfile.gettempdir(), "flashtool_metrics"))
+STATION = os.environ.get("FLASHTOOL_STATION") or platform.node() or "station"
+SPAN_LOG = "spans_{}.jsonl"
+PROCESS = re.sub(r"[^A-Za-z0-9_-]", "_", os.environ.get("FLASHTOOL_PROCESS")
+                 or os.path.splitext(os.path.basename(sys.argv[0] or ""))[0]).strip("-_") or "python"
+TEXTFILE = "flashtool_{}.prom"
+WINDOW = 3600.0  # Seconds of cycles behind boards/hour and the percentiles
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+class Metrics:
+    def __init__(self, directory=METRICS_DIR, station=STATION, max_bytes=1 << 20, backups=5, window=WINDOW,
+                 process=PROCESS):
+        self.directory = directory  # None: nothing is written
+        self.station = station
+        self.process = process
+        self.window = window
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._cycles = {}  # station -> deque of (end time, seconds, ok) within the window
+        self._totals = {}  # (station, "ok" / "failed") -> count
+        self._commands = {}  # (station, command) -> [count, seconds]
+        self._log = None
+
+    def record(self, span, seconds, ok=True, **tags):
+        """Store one finished span"""
+        tags.setdefault("station", self.station)
+        event = {"ts": round(time.time(), 3), "span": span, "seconds": round(seconds, 6), "ok": ok}
+        event.update(tags)
+        with self._lock:
+            self._write_span(event)
+            station = tags["station"]
+            if span == "nulink":
+                total = self._commands.setdefault((station, tags.get("command", "")), [0, 0.0])
+                total[0] += 1
+                total[1] += seconds
+            elif span == "cycle":
+                cycles = self._cycles.setdefault(station, deque())
+                cycles.append((time.monotonic(), seconds, ok))
+                key = (station, "ok" if ok else "failed")
+                self._totals[key] = self._totals.get(key, 0) + 1
+        if span == "cycle":
+            self.write_textfile()
+
+    @contextmanager
+    def span(self, name, **tags):
+        """Time the with-block; it fails the span if it raises. Yields tags for additions"""
+        start = time.perf_counter()
+        ok = False
+        try:
+            yield tags
+            ok = True
+        finally:
+            self.record(name, time.perf_counter() - start, ok, **tags)
+
+    def summary(self):
+        """{station: {"boards_per_hour", "p50", "p95", "failure_rate", "cycles"}} over the window"""
+        now = time.monotonic()
+        result = {}
+        with self._lock:
+            for station, cycles in self._cycles.items():
+                while cycles and now - cycles[0][0] > self.window:
+                    cycles.popleft()
+                result[station] = summarize_cycles([(seconds, ok) for _, seconds, ok in cycles], self.window)
+        return result
+
+    def textfile(self):
+        """Prometheus text exposition of summary() and the running totals"""
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            """samples: (labels, value), or (suffix, labels, value) for the _sum / _count of a summary"""
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                suffix, labels, value = sample if len(sample) == 3 else ("", *sample)
+                labels = (("process", self.process),) + labels
+                label_text = ",".join(f'{key}="{_label(val)}"' for key, val in labels)
+                lines.append(f"{name}{suffix}{{{label_text}}} {value:.6g}")
+
+        metric("flashtool_boards_per_hour", "gauge", "Boards flashed successfully in the last hour",
+               [((("station", s),), v["boards_per_hour"]) for s, v in summary.items()])
+        metric("flashtool_cycle_seconds", "gauge", "Flash cycle time over the last hour",
+               [((("station", s), ("quantile", q)), v[key]) for s, v in summary.items() if v["cycles"]
+                for q, key in (("0.5", "p50"), ("0.95", "p95"))])
+        metric("flashtool_failure_ratio", "gauge", "Failed share of the flash cycles of the last hour",
+               [((("station", s),), v["failure_rate"]) for s, v in summary.items()])
+        with self._lock:
+            totals = sorted(self._totals.items())
+            commands = sorted(self._commands.items())
+        metric("flashtool_cycles_total", "counter", "Flash cycles since start",
+               [((("station", s), ("result", r)), count) for (s, r), count in totals])
+        metric("flashtool_nulink_seconds", "summary", "Time spent in NuLink commands",
+               [(suffix, (("station", s), ("command", c)), value) for (s, c), (count, seconds) in commands
+                for suffix, value in (("_sum", seconds), ("_count", count))])
+        return "\n".join(lines) + "\n"
+
+    def _write_span(self, event):
+        if self.directory is None:
+            return
+        try:
+            if self._log is None:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, SPAN_LOG.format(self.process))
+                handler = logging.handlers.RotatingFileHandler(path,
+                                                               maxBytes=self.max_bytes, backupCount=self.backups,
+                                                               encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._log = logging.getLogger(f"flashtool.spans.{id(self)}")
+                self._log.propagate = False
+                self._log.setLevel(logging.INFO)
+                self._log.addHandler(handler)
+            self._log.info(json.dumps(event, separators=(",", ":")))
+        except OSError:
+            pass  # Metrics must never stop a flash
+
+    def write_textfile(self):
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, TEXTFILE.format(self.process))
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            write_atomic(path, self.textfile().encode("utf-8"))  # node_exporter must never see a half-written file
+        except OSError:
+            pass
+
+
+def summarize_cycles(cycles, window=WINDOW):
+    """Summary of [(seconds, ok), ...] cycles that ended within window seconds"""
+    times = [seconds for seconds, _ in cycles]
+    passed = sum(1 for _, ok in cycles if ok)
+    return {
+        "cycles": len(cycles),
+        "boards_per_hour": passed * 3600.0 / window,
+        "p50": percentile(times, 0.5) if times else 0.0,
+        "p95": percentile(times, 0.95) if times else 0.0,
+        "failure_rate": (len(cycles) - passed) / len(cycles) if cycles else 0.0,
+    }
+
+
+metrics = Metrics(None if os.environ.get("FLASHTOOL_METRICS") == "0" else METRICS_DIR)
+span = metrics.span
+record = metrics.record
+
+
+def main(argv=None):
+    """Per-station cycle summary and per-span timings from span logs (all of them)"""
+    paths = ((argv if argv is not None else sys.argv[1:])
+             or sorted(glob.glob(os.path.join(METRICS_DIR, SPAN_LOG.format("*") + "*"))))  # Rotated ones too
+    spans = {}
+    cycles = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                name = event["span"] + (f" {event['command']}" if "command" in event else "")
+                spans.setdefault(name, []).append(event["seconds"])
+                if event["span"] == "cycle":
+                    cycles.setdefault(event.get("station", ""), []).append((event["ts"], event["seconds"], event["ok"]))
+    for station, station_cycles in sorted(cycles.items()):
+        stamps = [ts for ts, _, _ in station_cycles]
+        duration = max(max(stamps) - min(stamps), 1.0)
+        summary = summarize_cycles([(seconds, ok) for _, seconds, ok in station_cycles], duration)
+        print(f"{station}: {summary['cycles']} cycles, {summary['boards_per_hour']:.0f} boards/h, "
+              f"p50 {summary['p50']:.2f}s, p95 {summary['p95']:.2f}s, {summary['failure_rate']:.1%} failed")
+    for name, times in sorted(spans.items(), key=lambda item: -sum(item[1])):
+        print(f"  {name:24} n={len(times):6}  total {sum(times):9.1f}s  "
+              f"p50 {percentile(times, 0.5):7.3f}s  p95 {percentile(times, 0.95):7.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
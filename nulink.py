@@ -0,0 +1,195 @@
+"""Runs NuLink_8051OT commands as child processes with streamed output.
+
+Used from worker threads: output lines are handed to a callback as they
+arrive (progress lines such as "Program APROM ... 45%" as a fraction) and a
+running command can be cancelled from another thread.
+
+Each command has a timeout (DEFAULT_TIMEOUTS by command, overridable per
+runner); a command that runs past it is killed and started again up to
+``retries`` times, so a hung adapter fails the board instead of blocking the
+station.
+"""
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from metrics import metrics
+
+PROBE = ("-p",)
+ERASE = ("-e", "ALL")
+RESET = ("-reset",)
+LOCK = ("-w", "cfg0", "0xFFFFFFFD")
+LIST = ("-l",)  # Attached adapter IDs; an ID placed before a command selects that adapter
+
+# Seconds per command, keyed like the metrics "command" tag (see command_key)
+DEFAULT_TIMEOUTS = {
+    "-p": 15.0,
+    "-e ALL": 60.0,
+    "-reset": 15.0,
+    "-w APROM": 180.0,
+    "-r APROM": 180.0,
+    "-w cfg0": 15.0,
+}
+DEFAULT_TIMEOUT = 60.0
+PROGRESS_PATTERN = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*%")
+ADAPTER_ID_PATTERN = re.compile(r"\bID\s*[:#=]?\s*(\w+)|\b((?:0x)?[0-9A-Fa-f]{8})\b")
+
+
+class NuLinkError(Exception):
+    pass
+
+
+class CommandCancelled(NuLinkError):
+    pass
+
+
+class CommandTimeout(NuLinkError):
+    pass
+
+
+def command_key(args):
+    """The command without its file argument: "-w APROM", "-e ALL", "-p", ..."""
+    return " ".join(str(a) for a in args[:2])
+
+
+def parse_progress(line):
+    """Fraction done (0-1) from a progress line of the tool, or None"""
+    match = PROGRESS_PATTERN.search(line)
+    if match is None:
+        return None
+    return min(float(match.group(1)), 100.0) / 100
+
+
+def parse_mcu_id(info):
+    """MCU name printed after the second >>> of the probe output"""
+    info_parts = info.split('>>>')
+    if len(info_parts) > 2:
+        return ''.join(c for c in info_parts[2] if c.isalnum())[:9]
+    return ""
+
+
+def parse_adapter_ids(output):
+    """Adapter IDs listed by "-l": the word after "ID", or 8-digit hex numbers"""
+    ids = []
+    for line in output.splitlines():
+        match = ADAPTER_ID_PATTERN.search(line)
+        if match and (match.group(1) or match.group(2)) not in ids:
+            ids.append(match.group(1) or match.group(2))
+    return ids
+
+
+def tool_command(tool_path):
+    """Command prefix for the tool; .py stand-ins run under this interpreter"""
+    if tool_path.lower().endswith(".py"):
+        return [sys.executable, tool_path]
+    return [tool_path]
+
+
+def _popen_kwargs():
+    if os.name != "nt":
+        return {}
+    # Keep the console window of the tool hidden
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    startupinfo.wShowWindow = subprocess.SW_HIDE
+    return {"startupinfo": startupinfo}
+
+
+class NuLinkRunner:
+    def __init__(self, tool_path, extra_args=(), timed=True, timeouts=None, retries=1):
+        self.tool_path = tool_path
+        self.extra_args = [str(a) for a in extra_args]  # e.g. adapter selection for a station slot
+        self.timed = timed  # Record a metrics span per command
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.retries = retries  # Extra attempts of a command that timed out
+        self._process = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, *args, on_output=None, on_progress=None, timeout=None):
+        """Run the tool with args and return its output.
+
+        Each output line is passed to on_output while the command runs, or
+        as a fraction to on_progress when it is a progress line (if given).
+        Raises NuLinkError on a non-zero exit, CommandTimeout when every
+        attempt ran past timeout (default: self.timeouts) and
+        CommandCancelled if cancel() was called.
+        """
+        if timeout is None:
+            timeout = self.timeouts.get(command_key(args), DEFAULT_TIMEOUT)
+        for attempt in range(self.retries + 1):
+            try:
+                return self._run_once(args, on_output, on_progress, timeout)
+            except CommandTimeout as e:
+                if attempt == self.retries:
+                    raise
+                if on_output:
+                    on_output(f"{e}, retrying")
+
+    def _run_once(self, args, on_output, on_progress, timeout):
+        if self._cancelled.is_set():
+            raise CommandCancelled("Cancelled")
+        start = time.perf_counter()
+        process = subprocess.Popen(tool_command(self.tool_path) + self.extra_args + [str(a) for a in args],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT,
+                                   stdin=subprocess.DEVNULL,
+                                   text=True,
+                                   errors="replace",
+                                   **_popen_kwargs())
+        with self._lock:
+            self._process = process
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            process.kill()
+
+        watchdog = threading.Timer(timeout, expire) if timeout else None
+        if watchdog is not None:
+            watchdog.daemon = True
+            watchdog.start()
+        lines = []
+        try:
+            # Text mode also ends a line at a bare \r, as progress counters use
+            for line in process.stdout:
+                lines.append(line)
+                line = line.rstrip("\r\n")
+                fraction = parse_progress(line) if on_progress else None
+                if fraction is not None:
+                    on_progress(fraction)
+                elif on_output:
+                    on_output(line)
+            returncode = process.wait()
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            process.stdout.close()
+            with self._lock:
+                self._process = None
+            if self.timed:
+                metrics.record("nulink", time.perf_counter() - start, process.returncode == 0,
+                               command=command_key(args), exit_code=process.returncode,
+                               adapter=" ".join(self.extra_args), timed_out=expired.is_set())
+        output = "".join(lines)
+        if self._cancelled.is_set():
+            raise CommandCancelled("Cancelled")
+        if expired.is_set():
+            raise CommandTimeout(f"{command_key(args)} timed out after {timeout:g}s")
+        if returncode != 0:
+            raise NuLinkError(output.strip() or f"{' '.join(map(str, args))} failed ({returncode})")
+        return output
+
+    def cancel(self):
+        """Stop the running command; later run() calls fail until reset()"""
+        self._cancelled.set()
+        with self._lock:
+            if self._process is not None:
+                self._process.kill()
+
+    def reset(self):
+        self._cancelled.clear()
+
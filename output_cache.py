@@ -0,0 +1,108 @@
+"""Content-addressed cache of generated hex files.
+
+A generated file depends only on the base firmware and the encoded config
+block, so it is stored under a key made of the base file's SHA-256 and the
+block bytes. A repeated configuration (re-orders, repeated batch rows) is
+hard-linked from the cache, or copied where links are not possible, instead
+of being built again.
+
+Each entry is <key>.hex plus <key>.sha256 holding the digest of the file; a
+hit is used only if the file still matches it (a hard-linked output edited in
+place would otherwise poison the cache). Entries are pruned least recently
+used first above a size cap.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from atomic_file import replacing, write_atomic
+from hex_cache import file_digest, prune_cache_dir
+
+DEFAULT_OUTPUT_DIR = os.path.join(tempfile.gettempdir(), "flashtool_cache", "outputs")
+PRUNE_EVERY = 64  # Stores between two prunes, scanning a big cache on every store is slow
+
+
+def link_or_copy(src, dst):
+    """Make dst a hard link to src, or a copy when linking is not possible"""
+    with replacing(dst) as partial:
+        try:
+            os.link(src, partial)
+        except OSError:
+            shutil.copyfile(src, partial)
+
+
+class OutputCache:
+    def __init__(self, cache_dir=DEFAULT_OUTPUT_DIR, max_bytes=512 << 20):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._stores = 0
+
+    @staticmethod
+    def key(base_digest, block, variant="splice"):
+        """Cache key of an output; variant separates the ways of writing it (splice / rewrite)"""
+        digest = hashlib.sha256(f"{base_digest}:{variant}:".encode())
+        digest.update(bytes(block))
+        return digest.hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".hex", base + ".sha256"
+
+    def fetch(self, key, dst):
+        """Put the cached output for key at dst; False on a miss or a damaged entry"""
+        path, checksum_path = self._paths(key)
+        try:
+            with open(checksum_path) as f:
+                expected = f.read().strip()
+            if file_digest(path) != expected:
+                raise ValueError("Cached output does not match its checksum")
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError):
+            self.discard(key)
+            return False
+        try:
+            link_or_copy(path, dst)
+            os.utime(path)  # Recently used, pruned last
+            os.utime(checksum_path)
+        except OSError:
+            return False
+        return True
+
+    def store(self, key, src):
+        """Add the output file src under key (best effort)"""
+        path, checksum_path = self._paths(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            digest = file_digest(src)
+            link_or_copy(src, path)
+            write_atomic(checksum_path, digest.encode())
+        except OSError:
+            return
+        self._stores += 1
+        if self._stores % PRUNE_EVERY == 1:
+            self.prune()
+
+    def discard(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def prune(self):
+        prune_cache_dir(self.cache_dir, self.max_bytes)
+
+    def build(self, key, dst, write):
+        """Fetch key into dst, or call write(path) and cache the result. True on a cache hit"""
+        if self.fetch(key, dst):
+            return True
+        # Written aside and renamed: dst may be a link into the cache from an earlier hit
+        with replacing(dst) as partial:
+            write(partial)
+            self.store(key, partial)
+        return False
+
+
+default_output_cache = OutputCache()
@@ -0,0 +1,207 @@
+"""Config packs: a lot's parameter sets as ready-encoded config blocks.
+
+A pack is a fixed header followed by one config block per unit (the exact
+bytes stored from CONFIG_BLOCK_ADDRESS, unit values included), all of the
+same stride, so record N is at header_size + N * stride. Stations map the
+file and slice records out of it: opening is instant whatever the lot size
+and nothing is parsed, validated or encoded again.
+
+    python pack.py build params.csv -o lot.pack
+    python pack.py info lot.pack [--check]
+    python pack.py show lot.pack 41
+
+Header (little endian): magic "FTCP", pack version, config layout version
+(config_block.LAYOUT_VERSION), header size, stride, block size, record
+count, SHA-256 of the records. A pack built for another layout is refused.
+Batch (batch.py) takes a pack as its parameter file too.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import sys
+
+from atomic_file import replacing
+from config_block import CONFIG_BLOCK_SIZE, LAYOUT_VERSION, decode_config, encode_config
+from template import UNIT_OFFSET, UNIT_STRUCT, decode_unit, unit_from_row
+
+MAGIC = b"FTCP"
+PACK_VERSION = 2  # 2: unit values at template.UNIT_OFFSET (version 1 put them over the shutdown field)
+HEADER = struct.Struct("<4sHHHHHxxI32s")
+PACK_SUFFIX = ".pack"
+
+_NO_UNIT = bytes(UNIT_STRUCT.size)
+
+
+class PackError(ValueError):
+    pass
+
+
+def encode_rows(rows):
+    """Config blocks (bytearrays) of table rows, unit columns stamped in"""
+    for row in rows:
+        block = encode_config(row)
+        unit = unit_from_row(row)
+        if unit is not None:
+            block[UNIT_OFFSET:UNIT_OFFSET + len(unit)] = unit
+        yield block
+
+
+def write_pack(path, blocks):
+    """Write config blocks (each CONFIG_BLOCK_SIZE bytes) as a pack; returns the record count"""
+    digest = hashlib.sha256()
+    count = 0
+    with replacing(path) as partial, open(partial, "wb") as f:
+        f.write(bytes(HEADER.size))  # Filled in once count and digest are known
+        for block in blocks:
+            if len(block) != CONFIG_BLOCK_SIZE:
+                raise PackError(f"Record {count}: {len(block)} bytes, expected {CONFIG_BLOCK_SIZE}")
+            f.write(block)
+            digest.update(block)
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, PACK_VERSION, LAYOUT_VERSION, HEADER.size, CONFIG_BLOCK_SIZE,
+                            CONFIG_BLOCK_SIZE, count, digest.digest()))
+    return count
+
+
+class ConfigPack:
+    """Read-only mapping of a pack file; pack[n] is a zero-copy view of record n"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # Empty file
+                raise PackError(f"{path}: not a config pack") from None
+        try:
+            self._open()
+        except BaseException:
+            self._map.close()
+            raise
+
+    def _open(self):
+        if len(self._map) < HEADER.size:
+            raise PackError(f"{self.path}: not a config pack")
+        magic, version, layout, header_size, stride, block_size, count, digest = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise PackError(f"{self.path}: not a config pack")
+        if version != PACK_VERSION:
+            raise PackError(f"{self.path}: pack version {version}, this tool reads version {PACK_VERSION} "
+                            f"(build the pack again)")
+        if layout != LAYOUT_VERSION or block_size != CONFIG_BLOCK_SIZE:
+            raise PackError(f"{self.path}: built for config layout {layout}, "
+                            f"this tool writes layout {LAYOUT_VERSION}")
+        if stride < block_size or len(self._map) < header_size + count * stride:
+            raise PackError(f"{self.path}: truncated ({count} records announced)")
+        self.layout = layout
+        self.header_size = header_size
+        self.stride = stride
+        self.count = count
+        self.digest = digest
+        self._view = memoryview(self._map)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError(f"Record {n} outside the pack ({self.count} records)")
+        start = self.header_size + n * self.stride
+        return self._view[start:start + CONFIG_BLOCK_SIZE]
+
+    def __iter__(self):
+        return (self[n] for n in range(self.count))
+
+    def check(self):
+        """True if the records match the digest in the header (reads the whole file)"""
+        digest = hashlib.sha256()
+        for block in self:
+            digest.update(block)
+        return digest.digest() == self.digest
+
+    def close(self):
+        if self._map is not None:
+            self._view.release()
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def split_unit(block):
+    """(static config block, unit bytes or None) of a packed record"""
+    unit = bytes(block[UNIT_OFFSET:UNIT_OFFSET + UNIT_STRUCT.size])
+    if unit == _NO_UNIT:
+        return bytes(block), None
+    static = bytearray(block)
+    static[UNIT_OFFSET:UNIT_OFFSET + UNIT_STRUCT.size] = _NO_UNIT
+    return bytes(static), unit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pack", description="Build and inspect config packs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="encode a parameter table into a pack")
+    build.add_argument("params", help="parameter sets (.csv or JSON lines, as batch.py reads them)")
+    build.add_argument("-o", "--output", required=True, help="pack file to write")
+    build.add_argument("--no-validate", action="store_true", help="pack even if values are out of range")
+    info = commands.add_parser("info", help="show a pack's header")
+    info.add_argument("pack")
+    info.add_argument("--check", action="store_true", help="verify the records against the header digest")
+    show = commands.add_parser("show", help="decode one record")
+    show.add_argument("pack")
+    show.add_argument("index", type=int, help="record index (from 0)")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        from batch import read_rows
+
+        rows = read_rows(args.params)
+        if not args.no_validate:
+            from validate import format_violation, validate_rows
+
+            violations = validate_rows(rows)
+            for violation in violations[:50]:
+                print(format_violation(violation), file=sys.stderr)
+            if violations:
+                print(f"{len(violations)} invalid values, nothing packed (--no-validate to force)", file=sys.stderr)
+                return 2
+        count = write_pack(args.output, encode_rows(rows))
+        print(f"Packed {count} config blocks into {args.output}")
+        return 0
+
+    try:
+        pack = ConfigPack(args.pack)
+    except PackError as e:
+        print(e, file=sys.stderr)
+        return 2
+    with pack:
+        if args.command == "info":
+            print(f"{args.pack}: {len(pack)} records, layout {pack.layout}, stride {pack.stride}, "
+                  f"sha256 {pack.digest.hex()[:12]}")
+            if args.check and not pack.check():
+                print("Records do not match the header digest", file=sys.stderr)
+                return 1
+        else:
+            try:
+                block = bytes(pack[args.index])
+            except IndexError as e:
+                print(e, file=sys.stderr)
+                return 2
+            values = decode_config(block, labels=True)
+            values.update((k, v) for k, v in decode_unit(block).items() if v != "")
+            print(json.dumps(values, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
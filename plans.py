@@ -0,0 +1,132 @@
+"""Device operation plans: ordered NuLink steps, optimized and timed.
+
+Every device action (Save & Flash, Flash, Erase, Reset, Connect) is a plan,
+a list of Step tuples. optimize() drops steps whose effect is already known
+to hold (a fresh probe, the same command twice in a row), and execute() runs
+the rest back to back, stops at the first failure and records how long each
+step took. An erase is never skipped because of an earlier plan: the session
+only knows the part number, not which board is on the adapter now.
+
+Steps are NuLink commands except "verify", which execute() runs as
+verify.verify_image (readback, page compare, selective rewrite).
+"""
+import time
+from collections import namedtuple
+
+from nulink import ERASE, LOCK, PROBE, RESET, NuLinkError, parse_mcu_id
+from verify import verify_image
+
+Step = namedtuple("Step", "name args")
+StepResult = namedtuple("StepResult", "step seconds output")
+
+PROBE_STEP = Step("probe", PROBE)
+ERASE_STEP = Step("erase", ERASE)
+RESET_STEP = Step("reset", RESET)
+LOCK_STEP = Step("lock", LOCK)
+
+
+def erase_from_step(address):
+    """Erase APROM from address (page aligned) to its end"""
+    return Step("page_erase", ("-e", "APROM", "offset", f"0x{address:X}"))
+
+
+def write_step(image_path):
+    return Step("write", ("-w", "APROM", image_path))
+
+
+def verify_step(image_path):
+    """Read back and compare the pages image_path programs (before the lock, a locked chip cannot be read)"""
+    return Step("verify", (image_path,))
+
+
+def read_step(bin_path):
+    """Read APROM back into a raw binary file"""
+    return Step("read", ("-r", "APROM", bin_path))
+
+
+def flash_plan(image_path, lock=True, verify=True):
+    """Probe, erase, reset, write APROM, verify it and optionally lock"""
+    plan = [PROBE_STEP, ERASE_STEP, RESET_STEP, write_step(image_path)]
+    if verify:
+        plan.append(verify_step(image_path))
+    if lock:
+        plan.append(LOCK_STEP)
+    return plan
+
+
+def connect_plan():
+    return [ERASE_STEP, PROBE_STEP]
+
+
+class PlanResult:
+    def __init__(self):
+        self.steps = []  # StepResult per executed step
+        self.skipped = []  # Steps removed by optimize()
+        self.mcu_id = None
+
+    @property
+    def seconds(self):
+        return sum(result.seconds for result in self.steps)
+
+
+def optimize(plan, session=None):
+    """Return (steps to run, skipped steps) for plan"""
+    steps = []
+    skipped = []
+    for step in plan:
+        redundant = (
+            # Same command twice in a row (writes are kept, they carry a file)
+            (steps and steps[-1] == step and step.name != "write")
+            or (session is not None and session.is_fresh() and step.name == "probe")
+        )
+        (skipped if redundant else steps).append(step)
+    return steps, skipped
+
+
+def execute(runner, plan, session=None, on_output=None, on_skip=None, on_start=None, on_step=None,
+            on_progress=None):
+    """Run an optimized plan; raises on the first failing step.
+
+    on_skip(step) is called for each dropped step, then on_start(index,
+    count, step) before and on_step(index, count, result) after each step;
+    on_progress(index, count, fraction) reports the progress lines of a
+    running step.
+    """
+    steps, skipped = optimize(plan, session)
+    result = PlanResult()
+    result.skipped = skipped
+    if session is not None and session.is_fresh():
+        result.mcu_id = session.mcu_id
+    for step in skipped:
+        if on_skip:
+            on_skip(step)
+    for index, step in enumerate(steps):
+        if on_start:
+            on_start(index, len(steps), step)
+        start = time.perf_counter()
+        step_progress = None
+        if on_progress:
+            step_progress = lambda fraction, index=index: on_progress(index, len(steps), fraction)
+        try:
+            if step.name == "probe" and session is not None:
+                output = result.mcu_id = session.probe(runner, force=True, on_output=on_output)
+            elif step.name == "verify":
+                output = verify_image(runner, *step.args, on_output=on_output)
+            else:
+                output = runner.run(*step.args, on_output=on_output, on_progress=step_progress)
+                if step.name == "probe":
+                    if not output:
+                        raise NuLinkError("Device not connected")
+                    result.mcu_id = parse_mcu_id(output)
+        except NuLinkError:
+            if session is not None:
+                session.invalidate()
+            raise
+        if session is not None:
+            session.touch()
+            if step.name == "erase":
+                session.fingerprint = None
+        result.steps.append(StepResult(step, time.perf_counter() - start, output))
+        if on_step:
+            on_step(index, len(steps), result.steps[-1])
+    return result
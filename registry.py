@@ -0,0 +1,177 @@
+"""Registry of known base firmwares, looked up by hash.
+
+Every registered firmware is stored with three keys, each a dict lookup:
+
+- the SHA-256 of its hex file: identifies a file the operator picks
+- its code fingerprint (flash_layout.code_fingerprint, config pages left
+  out): identifies the firmware on a board from an APROM readback, whatever
+  its parameters
+- the hashes of its programmed pages: when neither matches (a damaged or
+  partly written board) the firmware sharing most pages is the best guess
+
+and the config block layout it was built for (config_block.LAYOUT_VERSION at
+the time), so a file for a different layout is refused before a board is
+flashed with a wrong block.
+
+    python registry.py add base.hex --name cooler --version 2.1 [--layout 1]
+    python registry.py identify file.hex
+    python registry.py list
+
+Environment:
+    FLASHTOOL_REGISTRY  registry file (default ~/.flashtool/firmware_registry.json)
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter, namedtuple
+
+from atomic_file import replacing
+from config_block import LAYOUT_VERSION
+from flash_layout import APROM_SIZE, CONFIG_PAGES, ERASED, PAGE_SIZE, aprom_bytes, code_fingerprint, page_hashes
+from hex_cache import file_digest, load_hex
+
+DEFAULT_REGISTRY = os.environ.get("FLASHTOOL_REGISTRY",
+                                  os.path.join(os.path.expanduser("~"), ".flashtool", "firmware_registry.json"))
+REGISTRY_VERSION = 1
+PAGE_HASH_LENGTH = 16  # Bytes of each page digest kept, plenty for dozens of firmwares
+
+Firmware = namedtuple("Firmware", "name version layout sha256 fingerprint file pages")
+# How a file or board was identified: "file", "fingerprint" or "pages" (share = matching pages / pages)
+Match = namedtuple("Match", "firmware by share")
+
+_ERASED_PAGE = bytes([ERASED]) * PAGE_SIZE
+
+
+def code_page_hashes(aprom):
+    """{page: short hex digest} of the programmed pages outside the config pages"""
+    pages = [page for page in range(0, APROM_SIZE, PAGE_SIZE)
+             if page not in CONFIG_PAGES and aprom[page:page + PAGE_SIZE] != _ERASED_PAGE]
+    return {page: digest[:PAGE_HASH_LENGTH].hex() for page, digest in page_hashes(aprom, pages).items()}
+
+
+class FirmwareRegistry:
+    def __init__(self, path=DEFAULT_REGISTRY):
+        self.path = path
+        self.firmwares = []
+        self._by_sha256 = {}
+        self._by_fingerprint = {}
+        self._by_page = {}  # (page, digest) -> [Firmware]
+        data = {"firmwares": []}
+        try:
+            if path is not None:  # None: an empty registry that is not saved
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+        except FileNotFoundError:
+            pass
+        for entry in data["firmwares"]:
+            entry["pages"] = {int(page): digest for page, digest in entry["pages"].items()}
+            self._index(Firmware(**entry))
+
+    def _index(self, firmware):
+        self.firmwares.append(firmware)
+        self._by_sha256[firmware.sha256] = firmware
+        self._by_fingerprint[firmware.fingerprint] = firmware
+        for item in firmware.pages.items():
+            self._by_page.setdefault(item, []).append(firmware)
+
+    def add(self, hex_path, name, version, layout=LAYOUT_VERSION):
+        """Register the base firmware at hex_path (replacing an entry with the same file)"""
+        aprom = aprom_bytes(load_hex(hex_path))
+        firmware = Firmware(name, version, layout, file_digest(hex_path), code_fingerprint(aprom),
+                            os.path.basename(hex_path), code_page_hashes(aprom))
+        kept = [f for f in self.firmwares if f.sha256 != firmware.sha256]
+        self.firmwares, self._by_sha256, self._by_fingerprint, self._by_page = [], {}, {}, {}
+        for entry in kept + [firmware]:
+            self._index(entry)
+        return firmware
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with replacing(self.path) as partial, open(partial, "w", encoding="utf-8") as f:
+            json.dump({"version": REGISTRY_VERSION, "firmwares": [f._asdict() for f in self.firmwares]}, f)
+
+    def by_file(self, hex_path):
+        """Match of a hex file by its content hash, or None"""
+        firmware = self._by_sha256.get(file_digest(hex_path))
+        return Match(firmware, "file", 1.0) if firmware else None
+
+    def by_fingerprint(self, fingerprint):
+        firmware = self._by_fingerprint.get(fingerprint)
+        return Match(firmware, "fingerprint", 1.0) if firmware else None
+
+    def closest(self, aprom, min_share=0.5):
+        """Firmware sharing the most programmed pages with aprom (at least min_share of them)"""
+        hashes = code_page_hashes(aprom)
+        votes = Counter()
+        for item in hashes.items():
+            for firmware in self._by_page.get(item, ()):
+                votes[firmware.sha256] += 1
+        if not votes:
+            return None
+        sha256, count = votes.most_common(1)[0]
+        firmware = self._by_sha256[sha256]
+        share = count / max(len(firmware.pages), len(hashes))
+        return Match(firmware, "pages", share) if share >= min_share else None
+
+    def identify_image(self, aprom):
+        """Match of an APROM image (e.g. a board readback): fingerprint, else closest pages"""
+        return self.by_fingerprint(code_fingerprint(aprom)) or self.closest(aprom)
+
+    def identify_file(self, hex_path):
+        """Match of a hex file: content hash, else what its APROM image matches"""
+        return self.by_file(hex_path) or self.identify_image(aprom_bytes(load_hex(hex_path)))
+
+
+def check_layout(hex_path, registry=None):
+    """Match of hex_path; ValueError if it is a known firmware built for another config layout"""
+    match = (registry or FirmwareRegistry(DEFAULT_REGISTRY)).identify_file(hex_path)
+    if match is not None and match.firmware.layout != LAYOUT_VERSION:
+        raise ValueError(f"{describe(match)}: this tool writes config layout {LAYOUT_VERSION}")
+    return match
+
+
+def describe(match):
+    if match is None:
+        return "unknown firmware"
+    firmware = match.firmware
+    text = f"{firmware.name} {firmware.version} (layout {firmware.layout})"
+    if match.by == "fingerprint":
+        text += ", same code, other parameters"
+    elif match.by == "pages":
+        text += f", closest match: {match.share:.0%} of pages"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="registry", description="Known base firmwares")
+    parser.add_argument("--registry", default=DEFAULT_REGISTRY, help="registry file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="register a base firmware")
+    add.add_argument("hex")
+    add.add_argument("--name", required=True)
+    add.add_argument("--version", required=True)
+    add.add_argument("--layout", type=int, default=LAYOUT_VERSION, help="config block layout it was built for")
+    identify = commands.add_parser("identify", help="identify hex files")
+    identify.add_argument("hex", nargs="+")
+    commands.add_parser("list", help="list registered firmwares")
+    args = parser.parse_args(argv)
+
+    registry = FirmwareRegistry(args.registry)
+    if args.command == "add":
+        firmware = registry.add(args.hex, args.name, args.version, args.layout)
+        registry.save()
+        print(f"Registered {firmware.name} {firmware.version} ({len(firmware.pages)} pages)")
+    elif args.command == "identify":
+        for path in args.hex:
+            print(f"{path}: {describe(registry.identify_file(path))}")
+    else:
+        for firmware in registry.firmwares:
+            print(f"{firmware.name:20} {firmware.version:10} layout {firmware.layout}  "
+                  f"{firmware.sha256[:12]}  {firmware.file}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Bundled resources (NuLink tool, QR image) with launch-to-launch caching.
+
+The onefile exe unpacks its data into a fresh _MEIPASS folder on every
+launch. The NuLink tool is copied to the temp folder under a name holding
+its SHA-256 (NuLink_8051OT-<sha8>.exe), once per tool version: a copy that
+another instance is running is never replaced, and an interrupted copy never
+gets that name. The QR code is resized once into a PNG that Tk loads without
+PIL.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+from atomic_file import replacing
+from hex_cache import file_digest
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "flashtool_cache")
+
+
+def bundle_dir():
+    """Folder holding the bundled data files (PyInstaller or source tree)"""
+    if getattr(sys, 'frozen', False):
+        return sys._MEIPASS
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def extract_tool(src, directory):
+    """Path of a copy of src in directory named after its content, copied on first use only"""
+    stem, ext = os.path.splitext(os.path.basename(src))
+    dst = os.path.join(directory, f"{stem}-{file_digest(src)[:8]}{ext}")
+    if not os.path.exists(dst):
+        try:
+            with replacing(dst) as partial:
+                shutil.copy2(src, partial)
+        except OSError:
+            if not os.path.exists(dst):  # Not just another launch copying the same version first
+                raise
+    return dst
+
+
+def qr_thumbnail(src, size=(75, 75), cache_dir=CACHE_DIR):
+    """Path of a PNG of src resized to size, made with PIL on first use only"""
+    # Keyed by content: files unpacked from the onefile exe get a new mtime every launch
+    name = f"{os.path.splitext(os.path.basename(src))[0]}_{size[0]}x{size[1]}_{file_digest(src)[:16]}.png"
+    thumb = os.path.join(cache_dir, name)
+    if not os.path.exists(thumb):
+        from PIL import Image  # Only needed once per QR image version
+
+        os.makedirs(cache_dir, exist_ok=True)
+        with replacing(thumb) as partial:
+            Image.open(src).resize(size).save(partial, "PNG")
+    return thumb
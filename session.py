@@ -0,0 +1,100 @@
+"""Connection session: cached probe result plus a background unplug/replug poller.
+
+Every device button used to spawn ``NuLink_8051OT -p`` before doing real
+work. The session remembers the last probe (connected flag and MCU id) for
+``ttl`` seconds, and any successful NuLink command refreshes it, so most jobs
+start straight away. A poller thread re-probes while the device is idle and
+reports connection changes through ``on_change``.
+
+The poller skips a round while ``device_lock`` is held, which main-window
+jobs do for their whole run. Station slots run their own runners without the
+lock, so the GUI stops the poller while the station window is open.
+"""
+import threading
+import time
+
+from nulink import PROBE, CommandCancelled, NuLinkError, NuLinkRunner, parse_mcu_id
+
+
+class ConnectionSession:
+    def __init__(self, tool_path, ttl=5.0, poll_interval=1.0, on_change=None):
+        self.runner = NuLinkRunner(tool_path, timed=False)  # Idle polling stays out of the metrics
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.on_change = on_change or (lambda mcu_id: None)
+        # Held by main-window jobs while they use the device; the poller skips a round instead of waiting
+        self.device_lock = threading.Lock()
+        self.mcu_id = None  # None while disconnected
+        self.checked_at = 0.0
+        self.fingerprint = None  # code_fingerprint last read or flashed, only to name the firmware in the log
+        self._stop = threading.Event()
+        self._poller = None
+
+    @property
+    def connected(self):
+        return self.mcu_id is not None
+
+    def is_fresh(self):
+        return self.connected and time.monotonic() - self.checked_at < self.ttl
+
+    def probe(self, runner=None, force=False, on_output=None):
+        """Return the MCU id, probing only when the cached result is stale.
+
+        Raises NuLinkError("Device not connected") if the probe fails.
+        """
+        if not force and self.is_fresh():
+            return self.mcu_id
+        try:
+            info = (runner or self.runner).run(*PROBE, on_output=on_output)
+        except CommandCancelled:
+            raise
+        except NuLinkError:
+            info = ""
+        if not info:
+            self._set(None)
+            raise NuLinkError("Device not connected")
+        self._set(parse_mcu_id(info))
+        return self.mcu_id
+
+    def touch(self):
+        """A command just succeeded, so the device is still there"""
+        if self.connected:
+            self.checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Force the next probe() to ask the device again"""
+        self.checked_at = 0.0
+        self.fingerprint = None
+
+    def _set(self, mcu_id):
+        changed = mcu_id != self.mcu_id
+        if changed:
+            self.fingerprint = None
+        self.mcu_id = mcu_id
+        self.checked_at = time.monotonic()
+        if changed:
+            self.on_change(mcu_id)
+
+    def start_polling(self):
+        if self._poller is None:
+            self._stop.clear()
+            self.runner.reset()
+            self._poller = threading.Thread(target=self._poll, name="nulink-poller", daemon=True)
+            self._poller.start()
+
+    def stop_polling(self):
+        self._stop.set()
+        self.runner.cancel()
+        self._poller = None
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            # Skip this round if a job is using the device or the result is still fresh
+            if self.is_fresh() or not self.device_lock.acquire(blocking=False):
+                continue
+            try:
+                self.probe(force=True)
+            except NuLinkError:
+                pass
+            finally:
+                self.device_lock.release()
@@ -0,0 +1,194 @@
+"""Compact firmware memory image made of contiguous bytearray segments.
+
+Replaces IntelHex's dict-per-byte storage: each run of contiguous addresses is
+one bytearray, and a sorted list of segment start addresses is the gap index.
+Bulk writes go through write(); view() hands out zero-copy memoryview slices.
+Images load from and save to Intel HEX and raw binary.
+"""
+from bisect import bisect_right
+
+from hex_index import RECORD_DATA, RECORD_EOF, RECORD_EXT_LINEAR, RECORD_EXT_SEGMENT, HexFormatError
+from hex_splice import format_record
+
+RECORD_START_SEGMENT = 0x03
+RECORD_START_LINEAR = 0x05
+
+
+class SparseImage:
+    def __init__(self):
+        self._starts = []    # sorted segment start addresses
+        self._segments = []  # bytearray per start address
+        self.start_addr = None  # {"CS": .., "IP": ..} or {"EIP": ..} like IntelHex
+
+    @classmethod
+    def from_segments(cls, segments, start_addr=None):
+        """Build an image from [(start, bytes), ...]; the data is copied"""
+        image = cls()
+        for start, data in segments:
+            image.write(start, data)
+        image.start_addr = dict(start_addr) if start_addr else None
+        return image
+
+    @classmethod
+    def from_hex(cls, text):
+        """Parse Intel HEX text (str or bytes)"""
+        if isinstance(text, str):
+            text = text.encode("ascii")
+        image = cls()
+        base = 0
+        for lineno, line in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line[:1] != b":":
+                raise HexFormatError(f"Line {lineno}: missing ':'")
+            try:
+                record = bytes.fromhex(line[1:].decode("ascii"))
+            except ValueError:
+                raise HexFormatError(f"Line {lineno}: invalid hex digits") from None
+            if len(record) < 5 or len(record) != record[0] + 5:
+                raise HexFormatError(f"Line {lineno}: bad record length")
+            if sum(record) & 0xFF:
+                raise HexFormatError(f"Line {lineno}: checksum mismatch")
+            rtype = record[3]
+            data = record[4:-1]
+            if rtype == RECORD_DATA:
+                image.write(base + ((record[1] << 8) | record[2]), data)
+            elif rtype == RECORD_EOF:
+                break
+            elif rtype == RECORD_EXT_SEGMENT:
+                base = int.from_bytes(data, "big") << 4
+            elif rtype == RECORD_EXT_LINEAR:
+                base = int.from_bytes(data, "big") << 16
+            elif rtype == RECORD_START_SEGMENT:
+                image.start_addr = {"CS": int.from_bytes(data[:2], "big"), "IP": int.from_bytes(data[2:], "big")}
+            elif rtype == RECORD_START_LINEAR:
+                image.start_addr = {"EIP": int.from_bytes(data, "big")}
+            else:
+                raise HexFormatError(f"Line {lineno}: unknown record type {rtype:02X}")
+        return image
+
+    @classmethod
+    def from_hex_file(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_hex(f.read())
+
+    @classmethod
+    def from_bin_file(cls, path, offset=0):
+        image = cls()
+        with open(path, "rb") as f:
+            image.write(offset, f.read())
+        return image
+
+    def __len__(self):
+        """Number of bytes present (gaps excluded)"""
+        return sum(len(data) for data in self._segments)
+
+    def segments(self):
+        """[(start, end), ...] of the contiguous runs, end exclusive"""
+        return [(start, start + len(data)) for start, data in zip(self._starts, self._segments)]
+
+    def minaddr(self):
+        return self._starts[0] if self._starts else None
+
+    def maxaddr(self):
+        """Last used address (inclusive), like IntelHex.maxaddr"""
+        return self._starts[-1] + len(self._segments[-1]) - 1 if self._starts else None
+
+    def write(self, address, data):
+        """Write a run of bytes, merging with neighbouring segments"""
+        size = len(data)
+        if not size:
+            return
+        end = address + size
+        starts = self._starts
+        lo = bisect_right(starts, address) - 1
+        if lo < 0 or starts[lo] + len(self._segments[lo]) < address:
+            lo += 1
+        hi = bisect_right(starts, end)  # segments lo..hi-1 overlap or touch [address, end]
+        if lo == hi:
+            starts.insert(lo, address)
+            self._segments.insert(lo, bytearray(data))
+            return
+        first_start = starts[lo]
+        first = self._segments[lo]
+        if hi - lo == 1 and first_start <= address:
+            # Common case: inside or extending a single segment, done in place
+            first[address - first_start:end - first_start] = data
+            return
+        new_start = min(address, first_start)
+        last_end = starts[hi - 1] + len(self._segments[hi - 1])
+        merged = bytearray(max(end, last_end) - new_start)
+        for start, segment in zip(starts[lo:hi], self._segments[lo:hi]):
+            merged[start - new_start:start - new_start + len(segment)] = segment
+        merged[address - new_start:end - new_start] = data
+        starts[lo:hi] = [new_start]
+        self._segments[lo:hi] = [merged]
+
+    def view(self, address, size):
+        """Zero-copy memoryview of [address, address + size); must not span a gap"""
+        i = bisect_right(self._starts, address) - 1
+        if i >= 0:
+            offset = address - self._starts[i]
+            segment = self._segments[i]
+            if offset + size <= len(segment):
+                return memoryview(segment)[offset:offset + size]
+        raise KeyError(f"Range 0x{address:X}+{size} is not contiguous in the image")
+
+    def read(self, address, size, pad=0xFF):
+        """Copy of [address, address + size) with gaps filled by ``pad``"""
+        out = bytearray([pad]) * size
+        end = address + size
+        i = max(bisect_right(self._starts, address) - 1, 0)
+        while i < len(self._starts) and self._starts[i] < end:
+            start = self._starts[i]
+            segment = self._segments[i]
+            lo = max(start, address)
+            hi = min(start + len(segment), end)
+            if lo < hi:
+                out[lo - address:hi - address] = segment[lo - start:hi - start]
+            i += 1
+        return bytes(out)
+
+    def to_hex(self, record_size=16):
+        """Serialize as Intel HEX text"""
+        lines = []
+        upper = 0
+        for start, segment in zip(self._starts, self._segments):
+            address = start
+            end = start + len(segment)
+            while address < end:
+                if address >> 16 != upper:
+                    upper = address >> 16
+                    lines.append(format_record(0, RECORD_EXT_LINEAR, upper.to_bytes(2, "big")))
+                # Records never cross a 64K boundary
+                chunk_end = min(end, address + record_size, (upper + 1) << 16)
+                chunk = segment[address - start:chunk_end - start]
+                lines.append(format_record(address & 0xFFFF, RECORD_DATA, chunk))
+                address = chunk_end
+        if self.start_addr:
+            if "EIP" in self.start_addr:
+                lines.append(format_record(0, RECORD_START_LINEAR, self.start_addr["EIP"].to_bytes(4, "big")))
+            else:
+                data = self.start_addr["CS"].to_bytes(2, "big") + self.start_addr["IP"].to_bytes(2, "big")
+                lines.append(format_record(0, RECORD_START_SEGMENT, data))
+        lines.append(format_record(0, RECORD_EOF))
+        return b"\n".join(lines).decode("ascii") + "\n"
+
+    def write_hex_file(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_hex())
+
+    def to_bin(self, start=None, end=None, pad=0xFF):
+        """Flat binary from start to end (exclusive), gaps filled by ``pad``"""
+        if not self._starts:
+            return b""
+        if start is None:
+            start = self.minaddr()
+        if end is None:
+            end = self.maxaddr() + 1
+        return self.read(start, max(end - start, 0), pad)
+
+    def write_bin_file(self, path, start=None, end=None, pad=0xFF):
+        with open(path, "wb") as f:
+            f.write(self.to_bin(start, end, pad))
@@ -0,0 +1,72 @@
+"""Hand in-memory images to the programmer through private temp files.
+
+NuLink only takes a file name, so a merged image has to reach the disk at
+some point, but not next to the source (often a network share, and shared
+by every station using that base firmware). A SpooledImage keeps the
+rendered hex in memory and writes it, only when a path is actually needed,
+to a uniquely named file in the local spool folder; close() removes it.
+
+Environment:
+    FLASHTOOL_SPOOL_DIR  spool folder (default <tmp>/flashtool_spool)
+"""
+import os
+import tempfile
+import time
+
+SPOOL_DIR = os.environ.get("FLASHTOOL_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "flashtool_spool"))
+STALE_AGE = 24 * 3600  # Seconds after which a leftover spool file (crashed session) is removed
+
+
+class SpooledImage:
+    def __init__(self, data, name="merged", spool_dir=SPOOL_DIR):
+        self.data = data
+        self.name = name
+        self.spool_dir = spool_dir
+        self._path = None
+
+    def path(self):
+        """File holding the image, written on first use"""
+        if self._path is None:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix=self.name + "_", suffix=".hex", dir=self.spool_dir)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self.data)
+            except BaseException:
+                os.remove(path)
+                raise
+            self._path = path
+        return self._path
+
+    @property
+    def written(self):
+        return self._path is not None
+
+    def close(self):
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            self._path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def remove_stale(spool_dir=SPOOL_DIR, max_age=STALE_AGE):
+    """Delete spool files left behind by sessions that did not exit cleanly"""
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(spool_dir))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
@@ -0,0 +1,339 @@
+"""Multi-programmer flashing station.
+
+A station is a list of slots, one per attached NuLink adapter. Each slot has
+its own job queue and worker thread, so N boards are flashed at once with the
+same probe/erase/reset/write/lock sequence as Save & Flash.
+
+Slots are described in a JSON file:
+
+    {"slots": [
+        {"name": "A", "tool": "C:/.../NuLink_8051OT.exe", "args": []},
+        {"name": "B", "tool": "fake_nulink.py", "args": ["--adapter", "B"]}
+    ]}
+
+"args" is inserted before every command and selects the adapter. Without a
+file, detect_slots makes one slot per adapter the tool lists ("-l"), selected
+by its ID. For development and CI the tool can be fake_nulink.py. Optional "timeouts"
+({"-w APROM": 300, ...}, seconds per command, see nulink.DEFAULT_TIMEOUTS) and
+"retries" (attempts after a timeout) tune how fast a hung adapter is given up.
+
+Every board is recorded in the flash journal (journal.py). If the run is
+interrupted (crash, restart, Cancel), starting it again with the same image
+skips the boards already done and finishes half-done ones.
+
+Headless use:
+    python station.py station.json merged.hex [--rounds N] [--no-lock] [--new-run]
+    python station.py --detect NuLink_8051OT.exe merged.hex [...]
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import tkinter as tk
+from tkinter import messagebox, ttk
+
+from hex_cache import file_digest
+from journal import FINISHED_BOARD, FlashJournal, resume_plan
+from metrics import metrics
+from nulink import LIST, CommandCancelled, NuLinkRunner, parse_adapter_ids
+from plans import execute, flash_plan
+
+
+def load_station_config(path):
+    """Read the slot list from a station JSON file"""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    slots = []
+    for i, slot in enumerate(config["slots"]):
+        tool = slot["tool"]
+        if not os.path.isabs(tool):
+            tool = os.path.join(base_dir, tool)
+        slots.append({"name": slot.get("name", str(i + 1)), "tool": tool, "args": slot.get("args", []),
+                      "timeouts": slot.get("timeouts"), "retries": slot.get("retries", 1)})
+    return slots
+
+
+def detect_slots(tool_path, timeouts=None, retries=1):
+    """One slot per adapter listed by the tool, named and selected by its ID"""
+    output = NuLinkRunner(tool_path, timed=False).run(*LIST)
+    return [{"name": adapter_id, "tool": tool_path, "args": [adapter_id], "timeouts": timeouts, "retries": retries}
+            for adapter_id in parse_adapter_ids(output)]
+
+
+class Slot:
+    """One adapter with its own job queue and worker thread"""
+
+    def __init__(self, name, tool_path, args=(), on_event=None, journal=None, on_board_finished=None,
+                 timeouts=None, retries=1):
+        self.name = name
+        self.runner = NuLinkRunner(tool_path, args, timeouts=timeouts, retries=retries)
+        self.on_event = on_event or (lambda slot, kind, value: None)
+        self.journal = journal
+        self.on_board_finished = on_board_finished or (lambda run_id: None)
+        self.jobs = queue.Queue()
+        self.passed = 0
+        self.failed = 0
+        self.thread = threading.Thread(target=self._worker, name=f"slot-{name}", daemon=True)
+        self.thread.start()
+
+    def submit(self, plan, board=None):
+        """Queue a plan; board is (journal board id, run id) when journaled"""
+        self.on_event(self, "state", "Queued")
+        self.jobs.put((plan, board))
+
+    def cancel(self):
+        """Drop queued jobs and stop the running one"""
+        try:
+            while True:
+                self.jobs.get_nowait()
+        except queue.Empty:
+            pass
+        self.runner.cancel()
+
+    def close(self):
+        self.cancel()
+        self.jobs.put(None)
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            plan, board = job
+            board_id = board[0] if board and self.journal else None
+            self.runner.reset()
+            current = []
+
+            def on_start(index, count, step):
+                current[:] = [step]
+
+            def on_step(index, count, result):
+                if board_id:
+                    self.journal.step_finished(board_id, result.step.name, seconds=result.seconds)
+                current.clear()
+                self.on_event(self, "progress", (index + 1) / count)
+
+            def on_progress(index, count, fraction):
+                self.on_event(self, "progress", (index + fraction) / count)
+
+            self.on_event(self, "state", "Running")
+            if board_id:
+                self.journal.board_started(board_id)
+            start = time.perf_counter()
+            try:
+                result = execute(self.runner, plan, on_start=on_start, on_step=on_step, on_progress=on_progress)
+                self.passed += 1
+                metrics.record("cycle", time.perf_counter() - start, action="station", slot=self.name)
+                if board_id:
+                    self.journal.board_finished(board_id, True, result.mcu_id)
+                    self.on_board_finished(board[1])
+                self.on_event(self, "done", (result.mcu_id, result.seconds))
+            except CommandCancelled:
+                self.on_event(self, "state", "Cancelled")  # Left unfinished, the next run resumes it
+            except Exception as e:
+                self.failed += 1
+                metrics.record("cycle", time.perf_counter() - start, False, action="station", slot=self.name)
+                if board_id:
+                    if current:
+                        self.journal.step_finished(board_id, current[0].name, "failed")
+                    self.journal.board_finished(board_id, False, error=str(e))
+                    self.on_board_finished(board[1])
+                self.on_event(self, "error", str(e))
+
+
+class Station:
+    def __init__(self, slots, on_event=None, journal=None):
+        self.journal = journal
+        self.label = "station:" + ",".join(s["name"] for s in slots)  # Identifies the station's runs
+        self._outstanding = {}  # run id -> boards not finished yet
+        self._lock = threading.Lock()
+        self.slots = [Slot(s["name"], s["tool"], s["args"], on_event, journal, self._board_finished,
+                           s.get("timeouts"), s.get("retries", 1))
+                      for s in slots]
+
+    def open_run(self, image_path):
+        """Interrupted journal run of this station for the image, or None"""
+        if self.journal is None:
+            return None
+        return self.journal.open_run(self.label, file_digest(image_path))
+
+    def flash_all(self, image_path, lock=True, rounds=1, resume=False):
+        """Queue rounds flash jobs on every slot; returns how many boards were queued.
+
+        With resume, an interrupted run of the same image continues instead
+        (its own lock and rounds settings apply).
+        """
+        if self.journal is None:
+            for _ in range(rounds):
+                for slot in self.slots:
+                    slot.submit(flash_plan(image_path, lock))
+            return rounds * len(self.slots)
+
+        run = self.open_run(image_path) if resume else None
+        progress = {}
+        if run is not None:
+            run_id, lock, rounds = run["id"], bool(run["lock"]), run["rounds"]
+            progress = self.journal.board_progress(run_id)
+        else:
+            self.journal.abandon_runs(self.label)
+            run_id = self.journal.start_run(self.label, os.path.abspath(image_path), file_digest(image_path),
+                                            lock, rounds)
+        plan = flash_plan(image_path, lock)
+        jobs = []
+        for seq in range(rounds):
+            for slot in self.slots:
+                status, done_steps = progress.get((slot.name, seq), ("pending", set()))
+                if status in FINISHED_BOARD:
+                    continue
+                steps = resume_plan(plan, done_steps)
+                board_id = self.journal.add_board(run_id, slot.name, seq)
+                if not steps:
+                    self.journal.board_finished(board_id, True)
+                    continue
+                jobs.append((slot, steps, board_id))
+        with self._lock:
+            self._outstanding[run_id] = len(jobs)
+        if not jobs:
+            self.journal.finish_run(run_id)
+        for slot, steps, board_id in jobs:
+            slot.submit(steps, (board_id, run_id))
+        return len(jobs)
+
+    def _board_finished(self, run_id):
+        with self._lock:
+            self._outstanding[run_id] -= 1
+            finished = self._outstanding[run_id] == 0
+        if finished:
+            self.journal.finish_run(run_id)
+
+    def cancel(self):
+        for slot in self.slots:
+            slot.cancel()
+
+    def close(self):
+        for slot in self.slots:
+            slot.close()
+        if self.journal is not None:
+            self.journal.flush()
+
+
+class StationWindow:
+    """Per-slot status grid for a station, driven from the main window"""
+
+    COLUMNS = ("slot", "mcu", "state", "time", "passed", "failed")
+
+    def __init__(self, parent, slots, image_path, lock=True, on_close=None, journal=None):
+        self.image_path = image_path
+        self.lock = lock
+        self.on_close = on_close
+        self.events = queue.Queue()
+        self.station = Station(slots, on_event=lambda slot, kind, value: self.events.put((slot, kind, value)),
+                               journal=journal)
+
+        self.window = tk.Toplevel(parent)
+        self.window.title("Flash Station")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.grid = ttk.Treeview(self.window, columns=self.COLUMNS, show="headings", height=max(len(slots), 4))
+        for column, width in zip(self.COLUMNS, (60, 90, 160, 60, 55, 55)):
+            self.grid.heading(column, text=column.capitalize())
+            self.grid.column(column, width=width, anchor="center")
+        self.grid.pack(fill="both", expand=True, padx=5, pady=5)
+        for slot in self.station.slots:
+            self.grid.insert("", "end", iid=slot.name, values=(slot.name, "", "Idle", "", 0, 0))
+
+        btn_frame = ttk.Frame(self.window)
+        btn_frame.pack(fill="x", padx=5, pady=(0, 5))
+        ttk.Button(btn_frame, text="Flash all", command=self.flash_all).pack(side="left", padx=5)
+        ttk.Button(btn_frame, text="Cancel", command=self.station.cancel).pack(side="left", padx=5)
+        self.poll_events()
+
+        run = self.station.open_run(image_path)
+        if run is not None and messagebox.askyesno(
+                "Station", "Lượt flash trước với file này bị gián đoạn. Tiếp tục các bo mạch còn lại?",
+                parent=self.window):
+            self.station.flash_all(image_path, resume=True)
+
+    def flash_all(self):
+        self.station.flash_all(self.image_path, self.lock)
+
+    def set_cell(self, slot, column, value):
+        self.grid.set(slot.name, column, value)
+
+    def poll_events(self):
+        try:
+            while True:
+                slot, kind, value = self.events.get_nowait()
+                if kind == "state":
+                    self.set_cell(slot, "state", value)
+                elif kind == "progress":
+                    self.set_cell(slot, "state", f"Running {value:.0%}")
+                elif kind == "done":
+                    mcu_id, seconds = value
+                    self.set_cell(slot, "mcu", mcu_id or "")
+                    self.set_cell(slot, "state", "OK")
+                    self.set_cell(slot, "time", f"{seconds:.1f}s")
+                elif kind == "error":
+                    self.set_cell(slot, "state", f"FAIL: {value.splitlines()[-1] if value else ''}")
+                self.set_cell(slot, "passed", slot.passed)
+                self.set_cell(slot, "failed", slot.failed)
+        except queue.Empty:
+            pass
+        if self.window.winfo_exists():
+            self.window.after(100, self.poll_events)
+
+    def close(self):
+        if any(not slot.jobs.empty() for slot in self.station.slots):
+            if not messagebox.askyesno("Station", "Jobs are still queued. Cancel them and close?", parent=self.window):
+                return
+        self.station.close()
+        self.window.destroy()
+        if self.on_close:
+            self.on_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="station", description="Flash one image on every station slot")
+    parser.add_argument("config", help="station JSON file (the NuLink tool with --detect)")
+    parser.add_argument("image", help="hex image to flash")
+    parser.add_argument("--rounds", type=int, default=1, help="boards per slot")
+    parser.add_argument("--no-lock", action="store_true", help="do not lock the chip")
+    parser.add_argument("--journal", default=None, help="journal database (default: FLASHTOOL_JOURNAL or temp)")
+    parser.add_argument("--new-run", action="store_true", help="do not resume an interrupted run of this image")
+    parser.add_argument("--detect", action="store_true", help="one slot per adapter the tool lists (-l)")
+    args = parser.parse_args(argv)
+    slots = detect_slots(os.path.abspath(args.config)) if args.detect else load_station_config(args.config)
+    if not slots:
+        print("No NuLink adapter found", file=sys.stderr)
+        return 2
+
+    results = queue.Queue()
+
+    def on_event(slot, kind, value):
+        if kind in ("done", "error"):
+            results.put((slot.name, kind, value))
+
+    journal = FlashJournal(args.journal) if args.journal else FlashJournal()
+    station = Station(slots, on_event, journal)
+    start = time.perf_counter()
+    if not args.new_run and station.open_run(args.image) is not None:
+        print("Resuming the interrupted run of this image")
+    count = station.flash_all(args.image, lock=not args.no_lock, rounds=args.rounds, resume=not args.new_run)
+    failed = 0
+    for _ in range(count):
+        name, kind, value = results.get()
+        failed += kind == "error"
+        print(f"{name}: {'OK ' + (value[0] or '') if kind == 'done' else 'FAIL ' + value}")
+    station.close()
+    journal.close()
+    elapsed = time.perf_counter() - start
+    print(f"{count} boards in {elapsed:.1f}s, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""Serialized units: a rendered image template stamped with per-unit values.
+
+Every unit of a lot gets the same firmware and parameters but its own
+serial number, lot code and date, stored in the last reserved bytes of the
+config block (UNIT_STRUCT ending where the reserved area ends, all zero when
+unused; the firmware's shutdown and tried_time fields before it are left alone). An ImageTemplate is the output file rendered once with the static
+config; it knows where the hex digits of those bytes and the checksums of
+their records sit in the text, so stamping a unit is a copy of the template
+plus a few two-character writes.
+
+    python template.py base.hex params.json --serial 1000 --count 500 [--lot L123] [--date 2024-05-01] -o out_dir
+
+params holds the static config (the first row of a .csv / JSON-lines file,
+as batch.py reads them); the files are named by serial.
+"""
+import argparse
+import datetime
+import os
+import struct
+import sys
+
+from atomic_file import write_atomic
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE, RESERVED_OFFSET, RESERVED_SIZE, encode_config
+from hex_index import RecordIndex
+from hex_splice import splicer_for_file
+
+# serial (uint32), lot code (ASCII, NUL padded), date (year - 2000, month, day)
+UNIT_STRUCT = struct.Struct(">I8s3B")
+UNIT_COLUMNS = ("serial", "lot", "date")
+UNIT_OFFSET = RESERVED_OFFSET + RESERVED_SIZE - UNIT_STRUCT.size
+UNIT_ADDRESS = CONFIG_BLOCK_ADDRESS + UNIT_OFFSET
+assert UNIT_OFFSET >= RESERVED_OFFSET
+
+_HEX = [b"%02X" % i for i in range(256)]
+
+
+def encode_unit(serial, lot="", date=None):
+    """The UNIT_STRUCT bytes of a unit; date is a datetime.date or "YYYY-MM-DD" (None: no date)"""
+    try:
+        serial = int(serial)
+    except (TypeError, ValueError):
+        raise ValueError(f"Serial is not a number: {serial!r}") from None
+    if not 0 <= serial <= 0xFFFFFFFF:
+        raise ValueError(f"Serial does not fit uint32: {serial}")
+    lot = str(lot or "")
+    if not lot.isascii() or len(lot) > 8:
+        raise ValueError(f"Lot code must be at most 8 ASCII characters: {lot!r}")
+    if date is None or date == "":
+        ymd = (0, 0, 0)
+    else:
+        if not isinstance(date, datetime.date):
+            date = datetime.date.fromisoformat(str(date).strip())
+        if not 2000 <= date.year <= 2255:
+            raise ValueError(f"Date out of range: {date}")
+        ymd = (date.year - 2000, date.month, date.day)
+    return UNIT_STRUCT.pack(serial, lot.encode("ascii"), *ymd)
+
+
+def unit_from_row(row):
+    """UNIT_STRUCT bytes from a table row, or None if it has no unit columns"""
+    if not any(row.get(name) not in (None, "") for name in UNIT_COLUMNS):
+        return None
+    return encode_unit(row.get("serial"), row.get("lot"), row.get("date") or None)
+
+
+def decode_unit(data, offset=0):
+    """{"serial", "lot", "date"} from a config block (empty strings for an unserialized one)"""
+    serial, lot, year, month, day = UNIT_STRUCT.unpack_from(data, offset + UNIT_OFFSET)
+    if not (serial or lot.strip(b"\0") or month):
+        return {"serial": "", "lot": "", "date": ""}
+    return {
+        "serial": serial,
+        "lot": lot.rstrip(b"\0").decode("ascii", "replace"),
+        "date": f"{year + 2000:04d}-{month:02d}-{day:02d}" if month else "",
+    }
+
+
+class ImageTemplate:
+    """A rendered hex file with a hole at [start, start + size) that stamp() fills.
+
+    Every byte of the hole must be in a data record of image (true for the
+    output of HexSplicer or SparseImage.to_hex once the config block is written).
+    """
+
+    def __init__(self, image, start=UNIT_ADDRESS, size=UNIT_STRUCT.size):
+        self.image = bytes(image)
+        self.start = start
+        self.size = size
+        self._digits = []  # (offset of the two hex digits in image, hole byte)
+        self._checksums = []  # (offset of the checksum digits, sum of the record's other bytes, hole bytes)
+        covered = set()
+        for address, length, line_start, line_end, base in RecordIndex.build(self.image).overlapping(start, size):
+            colon = self.image.index(b":", line_start)
+            record = bytes.fromhex(self.image[colon + 1:colon + 11 + 2 * length].decode())
+            fixed = sum(record[:4])
+            holes = []
+            for i in range(length):
+                if start <= address + i < start + size:
+                    holes.append(address + i - start)
+                    self._digits.append((colon + 9 + 2 * i, address + i - start))
+                else:
+                    fixed += record[4 + i]
+            covered.update(holes)
+            self._checksums.append((colon + 9 + 2 * length, fixed, tuple(holes)))
+        if len(covered) != size:
+            raise ValueError(f"Image has no data for {size - len(covered)} bytes of the hole at 0x{start:X}")
+
+    @classmethod
+    def for_file(cls, path, config_data):
+        """Template of path with config_data spliced in (see hex_splice)"""
+        splicer = splicer_for_file(path, CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE)
+        return cls(splicer.render(config_data))
+
+    def stamp(self, values):
+        """The image with values (size bytes) in the hole, record checksums updated"""
+        if len(values) != self.size:
+            raise ValueError(f"Expected {self.size} bytes, got {len(values)}")
+        out = bytearray(self.image)
+        for pos, i in self._digits:
+            out[pos:pos + 2] = _HEX[values[i]]
+        for pos, fixed, holes in self._checksums:
+            out[pos:pos + 2] = _HEX[-(fixed + sum(values[i] for i in holes)) & 0xFF]
+        return out
+
+
+def main(argv=None):
+    from batch import read_rows
+
+    parser = argparse.ArgumentParser(prog="template", description="Generate serialized hex files for a lot")
+    parser.add_argument("base", help="base firmware .hex")
+    parser.add_argument("params", help="static parameters (.csv or JSON lines, first row)")
+    parser.add_argument("--serial", type=int, required=True, help="serial number of the first unit")
+    parser.add_argument("--count", type=int, default=1, help="number of units")
+    parser.add_argument("--lot", default="", help="lot code (up to 8 ASCII characters)")
+    parser.add_argument("--date", default=datetime.date.today().isoformat(), help="date stamp (YYYY-MM-DD)")
+    parser.add_argument("-o", "--out-dir", default="output", help="directory for generated files")
+    args = parser.parse_args(argv)
+
+    rows = read_rows(args.params)
+    template = ImageTemplate.for_file(args.base, encode_config(rows[0] if rows else {}))
+    os.makedirs(args.out_dir, exist_ok=True)
+    for serial in range(args.serial, args.serial + args.count):
+        unit = encode_unit(serial, args.lot, args.date)
+        write_atomic(os.path.join(args.out_dir, f"{serial}.hex"), template.stamp(unit))
+    print(f"Generated {args.count} hex files in {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flash_layout import APROM_SIZE  # noqa: E402
+from nulink import NuLinkRunner  # noqa: E402
+
+FAKE_NULINK = os.path.join(ROOT, "fake_nulink.py")
+
+
+class FakeBoard:
+    """The fake_nulink.py board of adapter "0" in a private state folder"""
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.memory_path = os.path.join(state_dir, "0.bin")
+
+    def read(self):
+        with open(self.memory_path, "rb") as f:
+            return f.read().ljust(APROM_SIZE, b"\xFF")
+
+    def write(self, memory):
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(self.memory_path, "wb") as f:
+            f.write(memory)
+
+    def swap(self):
+        """Replace the board on the adapter with a blank one"""
+        for name in os.listdir(self.state_dir):
+            os.remove(os.path.join(self.state_dir, name))
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    """Keep record indexes (hex_index) out of the shared temp cache"""
+    import hex_index
+
+    monkeypatch.setattr(hex_index, "DEFAULT_INDEX_DIR", str(tmp_path / "index"))
+    return hex_index.DEFAULT_INDEX_DIR
+
+
+@pytest.fixture(autouse=True)
+def registry_path(tmp_path, monkeypatch):
+    """Keep the firmware registry (registry.py) out of the home folder"""
+    import registry
+
+    monkeypatch.setattr(registry, "DEFAULT_REGISTRY", str(tmp_path / "firmware_registry.json"))
+    return registry.DEFAULT_REGISTRY
+
+
+@pytest.fixture
+def fake_board(tmp_path, monkeypatch):
+    state_dir = str(tmp_path / "fake_nulink")
+    monkeypatch.setenv("FAKE_NULINK_STATE", state_dir)
+    monkeypatch.delenv("FAKE_NULINK_BIT_ERRORS", raising=False)
+    return FakeBoard(state_dir)
+
+
+@pytest.fixture
+def runner(fake_board):
+    return NuLinkRunner(FAKE_NULINK)
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+from atomic_file import replacing, write_atomic
+from output_cache import OutputCache
+
+
+def test_replaces_on_success(tmp_path):
+    path = str(tmp_path / "f")
+    write_atomic(path, b"old")
+    write_atomic(path, b"new")
+    assert open(path, "rb").read() == b"new"
+    assert os.listdir(tmp_path) == ["f"]
+
+
+def test_failure_keeps_the_old_file(tmp_path):
+    path = str(tmp_path / "f")
+    write_atomic(path, b"old")
+    with pytest.raises(RuntimeError):
+        with replacing(path) as partial:
+            with open(partial, "wb") as f:
+                f.write(b"half")
+            raise RuntimeError
+    assert open(path, "rb").read() == b"old"
+    assert os.listdir(tmp_path) == ["f"]
+
+
+def test_output_cache_round_trip(tmp_path):
+    cache = OutputCache(str(tmp_path / "cache"))
+    key = cache.key("base", b"block")
+    out = str(tmp_path / "out.hex")
+
+    def write(path):
+        with open(path, "wb") as f:
+            f.write(b":00000001FF\n")
+
+    assert not cache.build(key, out, write)
+    os.remove(out)
+    assert cache.build(key, out, write)
+    assert open(out, "rb").read() == b":00000001FF\n"
+    assert sorted(os.listdir(tmp_path)) == ["cache", "out.hex"]
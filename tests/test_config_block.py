@@ -0,0 +1,85 @@
+import pytest
+
+from config_block import (CONFIG_BLOCK_SIZE, DEFAULT_CONFIG, RESERVED_OFFSET, RESERVED_SIZE, decode_config,
+                          encode_config)
+
+# Form entries of the baseline app.py in struct order: (name, bytes, combo map or None)
+BASELINE_ENTRIES = (
+    ("time_cl_run", 2, None), ("time_op_run", 2, None), ("time_cl_defrost", 2, None), ("time_op_defrost", 2, None),
+    ("delay_st", 1, None), ("st", 1, None),
+    ("mode_df", 1, "combo"), ("mode_end", 1, "combo"), ("mode_run", 1, "combo"), ("mode_defrost", 1, "combo"),
+    ("mode_sl", 1, "combo"),
+    ("lock_time", 2, None), ("led_green", 1, None), ("led_red", 1, None),
+    ("mode_hcf", 1, "combo"), ("mode_hdf", 1, "combo"), ("led_on_time", 1, "combo"), ("touch_num", 1, "combo"),
+    ("try_time", 2, None), ("hcf_op_time", 2, None),
+)
+BASELINE_CHECKBOXES = ("op_defrost_seconds", "show_df", "show_end", "show_sl", "show_hcf", "show_hdf", "try_time_days")
+BASELINE_RANGES = ("cl_run", "op_run", "cl_defrost", "op_defrost")
+
+
+def baseline_combo(value):
+    """The combo mapping of the baseline save_and_flash"""
+    if value == "CF":
+        return 1
+    if value == "H":
+        return 0
+    if value in ["OP", "LED", "ON"]:
+        return 1
+    return {"R1:2 R2:1": 1, "R1:1 R2:2": 2, "R1:2 R2:2": 3, "2": 1}.get(value, 0)
+
+
+def baseline_entry_bytes(value, num_bytes):
+    """The baseline get_entry_bytes: big endian, 0 when too wide or not a number"""
+    try:
+        value = int(value)
+    except ValueError:
+        return [0] * num_bytes
+    if value > (1 << 8 * num_bytes) - 1:
+        return [0] * num_bytes
+    return list(value.to_bytes(num_bytes, "big"))
+
+
+def baseline_form_bytes(form):
+    """The bytes the baseline form wrote from 0x7F00 for a dict of form strings"""
+    data = [2]
+    for name, width, kind in BASELINE_ENTRIES:
+        if kind == "combo":
+            data.append(baseline_combo(form[name]))
+        else:
+            data.extend(baseline_entry_bytes(form[name], width))
+    data.extend(1 if int(form[name]) else 0 for name in BASELINE_CHECKBOXES)
+    data.extend([0] * 202)
+    for prefix in ("min", "max"):
+        for name in BASELINE_RANGES:
+            data.extend(int(form[f"{prefix}_{name}"]).to_bytes(2, "big"))
+    return bytes(data)
+
+
+FORMS = [
+    {name: str(value) for name, value in DEFAULT_CONFIG.items()},
+    dict({name: str(value) for name, value in DEFAULT_CONFIG.items()},
+         time_cl_run="999", time_op_defrost="60", delay_st="300", st="x", mode_df="OFF", mode_run="CL",
+         mode_sl="LED", lock_time="70000", led_green="7", mode_hcf="H", mode_hdf="ON", led_on_time="R1:2 R2:2",
+         touch_num="2", try_time="12", show_sl="1", try_time_days="1", min_cl_run="3", max_op_defrost="45"),
+]
+
+
+@pytest.mark.parametrize("form", FORMS)
+def test_matches_baseline_form_encoding(form):
+    config = dict(form, **{name: int(form[name]) for name in BASELINE_CHECKBOXES})
+    assert bytes(encode_config(config)) == baseline_form_bytes(form)
+
+
+def test_round_trip():
+    config = dict(DEFAULT_CONFIG, time_cl_run=321, led_red=5, mode_df="OFF", led_on_time="R1:1 R2:2",
+                  shutdown=1, tried_time_2=0x01020304, max_cl_run=500)
+    decoded = decode_config(encode_config(config), labels=True)
+    assert decoded == config
+    assert encode_config(decoded) == encode_config(config)
+
+
+def test_firmware_fields_are_not_reserved():
+    data = encode_config(dict(DEFAULT_CONFIG, shutdown=1, tried_time_0=0xFFFFFFFF, tried_time_3=7))
+    assert len(data) == CONFIG_BLOCK_SIZE
+    assert data[RESERVED_OFFSET - 17:RESERVED_OFFSET] == bytes([1, 0xFF, 0xFF, 0xFF, 0xFF] + [0] * 11 + [7])
+    assert data[RESERVED_OFFSET:RESERVED_OFFSET + RESERVED_SIZE] == bytes(RESERVED_SIZE)
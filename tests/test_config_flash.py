@@ -0,0 +1,61 @@
+import pytest
+
+from bench import make_base_hex
+from config_block import CONFIG_BLOCK_ADDRESS, DEFAULT_CONFIG, encode_config
+from config_flash import flash_config_only
+from flash_layout import aprom_bytes
+from plans import execute, flash_plan
+from session import ConnectionSession
+from sparse_image import SparseImage
+
+from conftest import FAKE_NULINK
+
+
+def config_image(base_path, **values):
+    image = SparseImage.from_hex_file(base_path)
+    image.write(CONFIG_BLOCK_ADDRESS, encode_config(dict(DEFAULT_CONFIG, **values)))
+    return image
+
+
+@pytest.fixture
+def flashed(tmp_path, runner):
+    """Base firmware path and session after a full, unlocked flash with the default config"""
+    base_path = make_base_hex(str(tmp_path / "base.hex"), 16384)
+    merged_path = str(tmp_path / "merged.hex")
+    config_image(base_path).write_hex_file(merged_path)
+    session = ConnectionSession(FAKE_NULINK)
+    execute(runner, flash_plan(merged_path, lock=False), session)
+    return base_path, session
+
+
+def test_config_only_rewrites_config_pages(flashed, runner, fake_board):
+    base_path, session = flashed
+    image = config_image(base_path, led_green=7)
+    result = flash_config_only(runner, image, lock=False, session=session)
+    assert result is not None
+    names = [step.step.name for step in result.steps]
+    assert "erase" not in names
+    assert names.index("page_erase") < names.index("write") < names.index("verify")
+    assert fake_board.read() == aprom_bytes(image)
+
+
+def test_swapped_board_gets_full_flash(flashed, runner, fake_board):
+    base_path, session = flashed
+    fake_board.swap()  # Same part number, fresh session, but a blank board
+    assert session.is_fresh()
+    assert flash_config_only(runner, config_image(base_path, led_green=7), lock=False, session=session) is None
+
+
+def test_other_firmware_gets_full_flash(flashed, runner, fake_board, tmp_path):
+    _, session = flashed
+    other_path = make_base_hex(str(tmp_path / "other.hex"), 16384, seed=99)
+    assert flash_config_only(runner, config_image(other_path), lock=False, session=session) is None
+
+
+def test_locked_board_gets_full_flash(tmp_path, runner):
+    base_path = make_base_hex(str(tmp_path / "base.hex"), 16384)
+    merged_path = str(tmp_path / "merged.hex")
+    config_image(base_path).write_hex_file(merged_path)
+    session = ConnectionSession(FAKE_NULINK)
+    execute(runner, flash_plan(merged_path, lock=True), session)
+    assert flash_config_only(runner, config_image(base_path, led_green=7), lock=False, session=session) is None
@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from bench import make_base_hex
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE, DEFAULT_CONFIG, encode_config
+from hex_service import HexService, ServiceError, make_server, request_hex
+from hex_splice import splice_hex
+from registry import FirmwareRegistry
+from template import UNIT_OFFSET, encode_unit
+
+
+@pytest.fixture
+def base(tmp_path):
+    return make_base_hex(str(tmp_path / "main.hex"), 16384)
+
+
+@pytest.fixture
+def url(base):
+    service = HexService(FirmwareRegistry(None))
+    service.register(base, "main")
+    server = make_server(port=0, service=service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def post(url, path, body):
+    request = urllib.request.Request(url + path, body, {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_generate_hex(url, base):
+    config = dict(DEFAULT_CONFIG, led_green=3)
+    assert request_hex(config, "main", url=url) == splice_hex(base, CONFIG_BLOCK_ADDRESS, encode_config(config))
+
+
+def test_generate_serialized_hex(url, base):
+    config = dict(DEFAULT_CONFIG, serial=1001, lot="L123", date="2024-05-01")
+    block = encode_config(config)
+    unit = encode_unit(1001, "L123", "2024-05-01")
+    block[UNIT_OFFSET:UNIT_OFFSET + len(unit)] = unit
+    assert request_hex(config, "main", url=url) == splice_hex(base, CONFIG_BLOCK_ADDRESS, block)
+
+
+def test_generate_block(url):
+    config = dict(DEFAULT_CONFIG, led_green=3, serial=1001)
+    block = request_hex(config, "main", fmt="block", url=url)
+    assert len(block) == CONFIG_BLOCK_SIZE
+    expected = encode_config(config)
+    unit = encode_unit(1001, "", None)
+    expected[UNIT_OFFSET:UNIT_OFFSET + len(unit)] = unit
+    assert block == bytes(expected)
+
+
+def test_invalid_config_is_400(url):
+    with pytest.raises(ServiceError) as e:
+        request_hex(dict(DEFAULT_CONFIG, led_green=1000), "main", url=url)
+    assert e.value.status == 400
+    assert any("led_green" in violation for violation in e.value.violations)
+
+
+def test_bad_json_is_400(url):
+    status, body = post(url, "/generate", b"{not json")
+    assert status == 400
+    assert body["error"] == "Body is not JSON"
+    assert post(url, "/generate", b"[1, 2]")[0] == 400
+
+
+def test_unknown_base_is_404(url):
+    with pytest.raises(ServiceError) as e:
+        request_hex(DEFAULT_CONFIG, "other", url=url)
+    assert e.value.status == 404
+
+
+def test_named_base_follows_its_file(url, base):
+    config = dict(DEFAULT_CONFIG, led_green=3)
+    before = request_hex(config, "main", url=url)
+    make_base_hex(base, 16384, seed=2)
+    st = os.stat(base)
+    os.utime(base, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    after = request_hex(config, "main", url=url)
+    assert after != before
+    assert after == splice_hex(base, CONFIG_BLOCK_ADDRESS, encode_config(config))
+
+
+def test_requests_are_counted(url):
+    threads = [threading.Thread(target=request_hex, args=(DEFAULT_CONFIG, "main"), kwargs={"url": url})
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    deadline = time.monotonic() + 5
+    polls = 0
+    while True:  # A handler counts its request after sending the response, /health polls count too
+        with urllib.request.urlopen(url + "/health", timeout=10) as response:
+            health = json.loads(response.read())
+        if health["requests"] - polls >= 8 or time.monotonic() > deadline:
+            break
+        polls += 1
+        time.sleep(0.01)
+    assert (health["ok"], health["bases"], health["requests"] - polls) == (True, 1, 8)
@@ -0,0 +1,95 @@
+import os
+
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE
+import hex_index
+from hex_splice import splice_hex
+from sparse_image import SparseImage
+
+
+def write_base(path, eof=True):
+    image = SparseImage()
+    image.write(0, bytes(range(256)) * 4)
+    image.write(CONFIG_BLOCK_ADDRESS, bytes(CONFIG_BLOCK_SIZE))
+    text = image.to_hex()
+    if not eof:
+        text = "".join(line + "\n" for line in text.splitlines() if not line.startswith(":00000001"))
+    with open(path, "w") as f:
+        f.write(text)
+    return image
+
+
+def test_splice_matches_rewrite(tmp_path):
+    path = str(tmp_path / "base.hex")
+    image = write_base(path)
+    block = bytes(range(CONFIG_BLOCK_SIZE))
+    image.write(CONFIG_BLOCK_ADDRESS, block)
+    spliced = SparseImage.from_hex(splice_hex(path, CONFIG_BLOCK_ADDRESS, block).decode())
+    assert spliced.read(0, 0x8000, pad=0xFF) == image.read(0, 0x8000, pad=0xFF)
+
+
+def test_splice_base_without_eof_record(tmp_path):
+    path = str(tmp_path / "base.hex")
+    image = write_base(path, eof=False)
+    with open(path, "rb") as f:
+        assert b":00000001FF" not in f.read()
+    block = bytes(range(CONFIG_BLOCK_SIZE))
+    out = splice_hex(path, CONFIG_BLOCK_ADDRESS, block)
+    assert out.rstrip().endswith(b":00000001FF")
+    image.write(CONFIG_BLOCK_ADDRESS, block)
+    assert SparseImage.from_hex(out.decode()).read(0, 0x8000, pad=0xFF) == image.read(0, 0x8000, pad=0xFF)
+
+
+def test_index_is_cached_away_from_the_hex(tmp_path, index_dir):
+    base_dir = tmp_path / "share"
+    base_dir.mkdir()
+    path = str(base_dir / "base.hex")
+    write_base(path)
+    splice_hex(path, CONFIG_BLOCK_ADDRESS, bytes(CONFIG_BLOCK_SIZE))
+    assert sorted(p.name for p in base_dir.iterdir()) == ["base.hex"]
+    assert hex_index.load_index(path, create=False) is not None
+    assert os.listdir(index_dir)
+
+
+def assert_spliced(path):
+    block = bytes(range(CONFIG_BLOCK_SIZE))
+    image = SparseImage.from_hex_file(path)
+    image.write(CONFIG_BLOCK_ADDRESS, block)
+    out = splice_hex(path, CONFIG_BLOCK_ADDRESS, block)
+    assert SparseImage.from_hex(out.decode()).read(0, 0x8000, pad=0xFF) == image.read(0, 0x8000, pad=0xFF)
+
+
+def test_cached_index_does_not_read_the_hex(tmp_path, monkeypatch):
+    path = str(tmp_path / "base.hex")
+    write_base(path)
+    hex_index.rebuild_index(path)
+
+    def no_read(*args):
+        raise AssertionError("the hex was read")
+
+    monkeypatch.setattr(hex_index, "_read", no_read)
+    assert hex_index.load_index(path) is not None
+
+
+def test_changed_hex_drops_its_index(tmp_path):
+    path = str(tmp_path / "base.hex")
+    write_base(path)
+    hex_index.rebuild_index(path)
+    write_base(path, eof=False)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert hex_index.load_index(path, create=False) is None
+    assert_spliced(path)
+
+
+def test_index_with_same_size_and_mtime_is_checked(tmp_path):
+    path = str(tmp_path / "base.hex")
+    write_base(path)
+    st = os.stat(path)
+    hex_index.rebuild_index(path)
+    with open(path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    with open(path, "wb") as f:  # Same bytes in another order: same size, same mtime below
+        f.write(b"".join(lines[:-1][::-1] + lines[-1:]))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert hex_index.load_index(path, create=False) is not None
+    assert_spliced(path)
@@ -0,0 +1,149 @@
+import json
+import os
+import queue
+
+import pytest
+
+import app
+from bench import make_base_hex
+from flash_layout import aprom_bytes
+from hex_cache import file_digest
+from journal import FlashJournal, resume_plan
+from nulink import NuLinkRunner
+from plans import flash_plan
+from session import ConnectionSession
+from sparse_image import SparseImage
+from station import Station
+
+from conftest import FAKE_NULINK
+
+LOCKED = 0xFFFFFFFD
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = FlashJournal(str(tmp_path / "journal.sqlite"), flush_interval=0.01)
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    return make_base_hex(str(tmp_path / "image.hex"), 16384)
+
+
+def adapter_state(fake_board, adapter):
+    """(APROM bytes, CONFIG0) of a fake adapter's board"""
+    with open(os.path.join(fake_board.state_dir, f"{adapter}.bin"), "rb") as f:
+        memory = f.read()
+    with open(os.path.join(fake_board.state_dir, f"{adapter}.json")) as f:
+        return memory, json.load(f).get("cfg0")
+
+
+def record_commands(runner):
+    """List that gets the command ("-w APROM", "-p", ...) of every run of runner"""
+    commands = []
+    run = runner.run
+
+    def recording_run(*args, **kwargs):
+        commands.append(" ".join(args[:2]))
+        return run(*args, **kwargs)
+
+    runner.run = recording_run
+    return commands
+
+
+def test_resume_plan():
+    plan = flash_plan("image.hex", lock=True)
+    names = lambda steps: [step.name for step in steps]
+    assert resume_plan(plan, set(names(plan))) == []
+    assert names(resume_plan(plan, {"probe", "erase", "reset", "write", "verify"})) == ["probe", "lock"]
+    assert names(resume_plan(plan, {"probe", "erase", "reset", "write"})) == ["probe", "verify", "lock"]
+    assert resume_plan(plan, {"probe", "erase", "reset"}) == plan
+
+
+def test_station_resumes_an_interrupted_run(fake_board, journal, image_path):
+    slots = [{"name": name, "tool": FAKE_NULINK, "args": ["--adapter", name]} for name in "ABC"]
+    results = queue.Queue()
+    station = Station(slots, lambda slot, kind, value: kind in ("done", "error") and results.put((slot.name, kind)),
+                      journal)
+    commands = {slot.name: record_commands(slot.runner) for slot in station.slots}
+
+    # The run before the crash: A finished, B written and verified, C cut off while programming
+    expected = aprom_bytes(SparseImage.from_hex_file(image_path))
+    runner = NuLinkRunner(FAKE_NULINK, ["--adapter", "B"])
+    runner.run("-e", "ALL")
+    runner.run("-w", "APROM", image_path)
+    half = SparseImage()
+    half.write(0, expected[:4096])
+    half_path = image_path + ".half.hex"
+    half.write_hex_file(half_path)
+    NuLinkRunner(FAKE_NULINK, ["--adapter", "C"]).run("-w", "APROM", half_path)
+    run_id = journal.start_run(station.label, os.path.abspath(image_path), file_digest(image_path), True, 1)
+    for name, steps in (("A", ["probe", "erase", "reset", "write", "verify", "lock"]),
+                        ("B", ["probe", "erase", "reset", "write", "verify"]),
+                        ("C", ["probe", "erase", "reset"])):
+        board_id = journal.add_board(run_id, name, 0)
+        journal.board_started(board_id)
+        for step in steps:
+            journal.step_finished(board_id, step)
+    journal.board_finished(f"{run_id}/A/0", True)
+    journal.step_finished(f"{run_id}/C/0", "write", "failed")
+
+    assert station.open_run(image_path)["id"] == run_id
+    assert station.flash_all(image_path, lock=False, rounds=3, resume=True) == 2  # The run's own settings apply
+    done = sorted(results.get(timeout=30) for _ in range(2))
+    station.close()
+    assert done == [("B", "done"), ("C", "done")]
+    assert commands["A"] == []
+    assert commands["B"] == ["-p", "-w cfg0"]
+    assert commands["C"] == ["-p", "-e ALL", "-reset", "-w APROM", "-r APROM", "-w cfg0"]
+    assert adapter_state(fake_board, "B") == (expected, LOCKED)
+    assert adapter_state(fake_board, "C") == (expected, LOCKED)
+    assert journal.open_run(station.label) is None
+    assert all(status == "done" for status, _ in journal.board_progress(run_id).values())
+
+
+class HeadlessGui:
+    """The journal and job parts of app.FlashToolGUI, without Tk"""
+
+    run_job = app.FlashToolGUI.run_job
+    run_plan = app.FlashToolGUI.run_plan
+    plan_hooks = app.FlashToolGUI.plan_hooks
+    finish_journal = app.FlashToolGUI.finish_journal
+    report_interrupted_job = app.FlashToolGUI.report_interrupted_job
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.journal_board = None
+        self.runner = NuLinkRunner(FAKE_NULINK)
+        self.session = ConnectionSession(FAKE_NULINK)
+        self.log = []
+
+    def post_event(self, kind, value=None):
+        pass
+
+    def append_log(self, line):
+        self.log.append(line)
+
+
+def test_gui_reports_an_interrupted_flash(fake_board, tmp_path, image_path):
+    path = str(tmp_path / "gui.sqlite")
+    journal = FlashJournal(path, flush_interval=0.01)
+    gui = HeadlessGui(journal)
+
+    def job():
+        gui.run_plan(flash_plan(image_path, lock=True)[:-1])
+        raise KeyboardInterrupt  # Power cut before the lock: run_job never closes the run
+
+    with pytest.raises(KeyboardInterrupt):
+        gui.run_job(job, "Flash!", None, cycle="flash")
+    journal.close()
+
+    restarted = HeadlessGui(FlashJournal(path))
+    restarted.report_interrupted_job()
+    assert restarted.log == ["The last flash was interrupted (steps completed: probe, erase, reset, write, verify). "
+                             "Flash that board again."]
+    restarted.report_interrupted_job()  # Reported once, the run is closed
+    assert len(restarted.log) == 1
+    restarted.journal.close()
@@ -0,0 +1,20 @@
+import metrics
+from metrics import Metrics
+
+
+def test_processes_keep_their_own_files(tmp_path, monkeypatch, capsys):
+    directory = str(tmp_path / "metrics")
+    for process, seconds in (("app", 2.0), ("station", 4.0)):
+        recorder = Metrics(directory, station="bench", process=process, max_bytes=300, backups=2)
+        for _ in range(3):
+            recorder.record("nulink", 0.5, command="-p")
+            recorder.record("cycle", seconds)
+    names = sorted(p.name for p in (tmp_path / "metrics").iterdir())
+    assert {"spans_app.jsonl", "spans_station.jsonl", "flashtool_app.prom", "flashtool_station.prom"} <= set(names)
+    assert any(name.startswith("spans_app.jsonl.") for name in names)  # Rotated within its own log
+
+    monkeypatch.setattr(metrics, "METRICS_DIR", directory)
+    assert metrics.main([]) == 0
+    out = capsys.readouterr().out
+    assert "bench: 6 cycles" in out
+    assert "nulink -p" in out and "n=     6" in out
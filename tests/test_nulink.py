@@ -0,0 +1,62 @@
+import json
+import os
+import time
+
+import pytest
+
+from bench import make_base_hex
+from nulink import CommandTimeout, NuLinkRunner, parse_progress
+from plans import ERASE_STEP, PROBE_STEP, execute, write_step
+
+from conftest import FAKE_NULINK
+
+
+def hangs(fake_board):
+    with open(os.path.join(fake_board.state_dir, "0.json")) as f:
+        return json.load(f).get("hangs", 0)
+
+
+def test_hung_command_is_killed_retried_then_fails(fake_board, monkeypatch):
+    monkeypatch.setenv("FAKE_NULINK_HANG", "-reset")
+    runner = NuLinkRunner(FAKE_NULINK, retries=2)
+    output = []
+    start = time.monotonic()
+    with pytest.raises(CommandTimeout):
+        runner.run("-reset", timeout=0.5, on_output=output.append)
+    elapsed = time.monotonic() - start
+    assert 1.5 <= elapsed < 10  # Three attempts of 0.5 s, nowhere near the fake's hour-long hang
+    assert hangs(fake_board) == 3
+    assert sum(line.endswith("retrying") for line in output) == 2
+
+
+def test_hang_once_succeeds_on_retry(fake_board, monkeypatch):
+    monkeypatch.setenv("FAKE_NULINK_HANG", "-reset:1")
+    runner = NuLinkRunner(FAKE_NULINK, retries=1)
+    assert "Reset ... done" in runner.run("-reset", timeout=1.0)
+    assert hangs(fake_board) == 1
+
+
+def test_timeouts_come_from_the_runner(fake_board, monkeypatch):
+    monkeypatch.setenv("FAKE_NULINK_HANG", "-reset")
+    runner = NuLinkRunner(FAKE_NULINK, timeouts={"-reset": 0.3}, retries=0)
+    with pytest.raises(CommandTimeout, match="-reset timed out after 0.3s"):
+        runner.run("-reset")
+
+
+def test_progress_reaches_execute(fake_board, tmp_path, monkeypatch):
+    monkeypatch.setenv("FAKE_NULINK_DELAY", "0.2")
+    image_path = make_base_hex(str(tmp_path / "image.hex"), 4096)
+    progress = []
+    execute(NuLinkRunner(FAKE_NULINK), [PROBE_STEP, ERASE_STEP, write_step(image_path)],
+            on_progress=lambda index, count, fraction: progress.append((index, count, fraction)))
+    for index in (1, 2):  # Erase and write print progress, the probe does not
+        fractions = [fraction for i, count, fraction in progress if i == index]
+        assert fractions == sorted(fractions) and fractions[0] == 0.0 and fractions[-1] == 1.0
+        assert len(fractions) > 2
+    assert {count for _, count, _ in progress} == {3}
+    assert not [entry for entry in progress if entry[0] == 0]
+
+
+def test_parse_progress():
+    assert parse_progress("Program APROM ... 40%") == 0.4
+    assert parse_progress("Program APROM ... done") is None
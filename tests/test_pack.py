@@ -0,0 +1,114 @@
+import csv
+import hashlib
+import os
+
+import pytest
+
+import batch
+import pack
+from bench import make_base_hex
+from config_block import DEFAULT_CONFIG, LAYOUT_VERSION, encode_config
+from pack import HEADER, PACK_VERSION, ConfigPack, PackError, encode_rows, write_pack
+from template import UNIT_OFFSET, encode_unit
+
+ROWS = [
+    {"led_green": "3", "time_cl_run": "15", "mode_df": "OFF", "serial": "1000", "lot": "L123", "date": "2024-05-01"},
+    {"led_green": "1", "time_cl_run": "20", "mode_df": "OFF", "serial": "1001", "lot": "L123", "date": "2024-05-01"},
+    {"led_green": "0", "time_cl_run": "20", "mode_df": "ON", "serial": "1002", "lot": "L124", "date": "2024-05-02"},
+]
+
+
+def write_csv(path, rows):
+    columns = sorted({name for row in rows for name in row})
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+@pytest.fixture
+def pack_path(tmp_path):
+    path = str(tmp_path / "lot.pack")
+    assert pack.main(["build", write_csv(str(tmp_path / "params.csv"), ROWS), "-o", path]) == 0
+    return path
+
+
+def rewrite_header(path, **fields):
+    with open(path, "r+b") as f:
+        values = dict(zip(("magic", "version", "layout", "header_size", "stride", "block_size", "count",
+                           "digest"), HEADER.unpack(f.read(HEADER.size))))
+        values.update(fields)
+        f.seek(0)
+        f.write(HEADER.pack(*values.values()))
+
+
+def test_records_are_the_encoded_rows(pack_path):
+    with ConfigPack(pack_path) as records:
+        assert len(records) == len(ROWS)
+        for n, row in enumerate(ROWS):
+            block = encode_config(row)
+            unit = encode_unit(int(row["serial"]), row["lot"], row["date"])
+            block[UNIT_OFFSET:UNIT_OFFSET + len(unit)] = unit
+            assert bytes(records[n]) == bytes(block)
+        assert bytes(records[-1]) == bytes(records[len(ROWS) - 1])
+        with pytest.raises(IndexError):
+            records[len(ROWS)]
+        assert records.check()
+
+
+def test_unserialized_rows_keep_the_plain_block(tmp_path):
+    path = str(tmp_path / "plain.pack")
+    rows = [dict(DEFAULT_CONFIG, led_green=n) for n in range(3)]
+    assert write_pack(path, encode_rows(rows)) == 3
+    with ConfigPack(path) as records:
+        assert [bytes(block) for block in records] == [bytes(encode_config(row)) for row in rows]
+
+
+def test_digest_mismatch_is_rejected(tmp_path, pack_path):
+    with open(pack_path, "r+b") as f:
+        f.seek(HEADER.size + 5)
+        f.write(b"\x42")
+    with ConfigPack(pack_path) as records:  # Opening reads only the header
+        assert not records.check()
+    assert pack.main(["info", pack_path, "--check"]) == 1
+    base = make_base_hex(str(tmp_path / "base.hex"), 16384)
+    assert batch.main([base, pack_path, "-o", str(tmp_path / "out"), "-j", "1", "--no-cache"]) == 2
+    assert not os.path.exists(tmp_path / "out")
+
+
+def test_truncated_pack_is_rejected(pack_path):
+    with open(pack_path, "r+b") as f:
+        f.truncate(os.path.getsize(pack_path) - 1)
+    with pytest.raises(PackError, match="truncated"):
+        ConfigPack(pack_path)
+
+
+@pytest.mark.parametrize("field, value", [("layout", LAYOUT_VERSION + 1), ("version", PACK_VERSION - 1)])
+def test_other_layout_or_version_is_refused(pack_path, field, value):
+    rewrite_header(pack_path, **{field: value})
+    with pytest.raises(PackError, match=f"{field} {value}"):
+        ConfigPack(pack_path)
+
+
+def test_empty_or_foreign_file_is_rejected(tmp_path):
+    path = tmp_path / "other.pack"
+    path.write_bytes(b"")
+    with pytest.raises(PackError):
+        ConfigPack(str(path))
+    path.write_bytes(b"\x00" * 100)
+    with pytest.raises(PackError):
+        ConfigPack(str(path))
+
+
+def digests(directory):
+    return {name: hashlib.sha256((directory / name).read_bytes()).hexdigest() for name in os.listdir(directory)}
+
+
+def test_batch_from_pack_matches_the_table(tmp_path, pack_path):
+    base = make_base_hex(str(tmp_path / "base.hex"), 16384)
+    params = write_csv(str(tmp_path / "named.csv"), [dict(row, output=row["serial"]) for row in ROWS])
+    for source, out in ((params, "from_csv"), (pack_path, "from_pack")):
+        assert batch.main([base, source, "-o", str(tmp_path / out), "-j", "1", "--no-cache"]) == 0
+    assert digests(tmp_path / "from_pack") == digests(tmp_path / "from_csv")
+    assert sorted(os.listdir(tmp_path / "from_pack")) == ["1000.hex", "1001.hex", "1002.hex"]
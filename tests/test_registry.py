@@ -0,0 +1,73 @@
+import pytest
+
+from bench import make_base_hex
+from config_block import CONFIG_BLOCK_ADDRESS, DEFAULT_CONFIG, LAYOUT_VERSION, encode_config
+from flash_layout import PAGE_SIZE, aprom_bytes
+from registry import FirmwareRegistry, check_layout, describe
+from sparse_image import SparseImage
+
+
+@pytest.fixture
+def base(tmp_path):
+    return make_base_hex(str(tmp_path / "cooler.hex"), 16384)
+
+
+@pytest.fixture
+def registry(base, registry_path):
+    registry = FirmwareRegistry(registry_path)
+    registry.add(base, "cooler", "2.1")
+    registry.add(make_base_hex(str(registry_path) + ".other.hex", 16384, seed=2), "heater", "1.0")
+    return registry
+
+
+def with_config(base, path, **values):
+    """Copy of base with a config block of its own parameters"""
+    image = SparseImage.from_hex_file(base)
+    image.write(CONFIG_BLOCK_ADDRESS, encode_config(dict(DEFAULT_CONFIG, **values)))
+    image.write_hex_file(path)
+    return path
+
+
+def test_identify_by_file(registry, base):
+    match = registry.identify_file(base)
+    assert (match.firmware.name, match.by, match.share) == ("cooler", "file", 1.0)
+
+
+def test_identify_by_fingerprint_after_a_parameter_change(registry, base, tmp_path):
+    path = with_config(base, str(tmp_path / "unit.hex"), led_green=3)
+    assert registry.by_file(path) is None
+    match = registry.identify_file(path)
+    assert (match.firmware.name, match.by) == ("cooler", "fingerprint")
+    assert describe(match) == "cooler 2.1 (layout 1), same code, other parameters"
+
+
+def test_identify_damaged_image_by_closest_pages(registry, base):
+    aprom = bytearray(aprom_bytes(SparseImage.from_hex_file(base)))
+    for page in range(0, 10 * PAGE_SIZE, PAGE_SIZE):  # 10 of 128 code pages damaged
+        aprom[page] ^= 0xFF
+    match = registry.identify_image(bytes(aprom))
+    assert (match.firmware.name, match.by, match.share) == ("cooler", "pages", 118 / 128)
+    assert registry.closest(bytes(aprom), min_share=0.95) is None
+
+
+def test_unknown_firmware(registry, tmp_path):
+    path = make_base_hex(str(tmp_path / "unknown.hex"), 16384, seed=3)
+    assert registry.identify_file(path) is None
+    assert check_layout(path, registry) is None
+
+
+def test_check_layout(registry, base, tmp_path):
+    assert check_layout(base, registry).firmware.name == "cooler"
+    registry.add(base, "cooler", "3.0", layout=LAYOUT_VERSION + 1)
+    with pytest.raises(ValueError, match="cooler 3.0"):
+        check_layout(base, registry)
+    with pytest.raises(ValueError):  # Same code with other parameters
+        check_layout(with_config(base, str(tmp_path / "unit.hex")), registry)
+
+
+def test_save_and_load(registry, base, registry_path):
+    registry.save()
+    loaded = FirmwareRegistry(registry_path)
+    assert loaded.firmwares == registry.firmwares
+    assert loaded.identify_file(base) == registry.identify_file(base)
+    assert check_layout(base).firmware.name == "cooler"  # The default registry file
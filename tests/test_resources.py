@@ -0,0 +1,25 @@
+import os
+
+from resources import extract_tool
+
+
+def test_tool_copy_is_named_by_content(tmp_path):
+    src = tmp_path / "bundle" / "NuLink_8051OT.exe"
+    src.parent.mkdir()
+    src.write_bytes(b"tool v1")
+    directory = str(tmp_path / "temp")
+    os.mkdir(directory)
+    first = extract_tool(str(src), directory)
+    assert os.path.basename(first).startswith("NuLink_8051OT-") and first.endswith(".exe")
+    mtime = os.stat(first).st_mtime_ns
+    assert extract_tool(str(src), directory) == first
+    assert os.stat(first).st_mtime_ns == mtime  # Not copied again
+
+    src.write_bytes(b"tool v2")
+    second = extract_tool(str(src), directory)
+    assert second != first
+    with open(first, "rb") as f:  # The copy an older instance may be running is left alone
+        assert f.read() == b"tool v1"
+    with open(second, "rb") as f:
+        assert f.read() == b"tool v2"
+    assert sorted(os.listdir(directory)) == sorted([os.path.basename(first), os.path.basename(second)])
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from nulink import PROBE
+from session import ConnectionSession
+from station import detect_slots
+
+from conftest import FAKE_NULINK
+
+
+@pytest.fixture
+def polled(fake_board):
+    """Session polling the fake every 20 ms with no probe cache, and the list of -p it spawned"""
+    session = ConnectionSession(FAKE_NULINK, ttl=0, poll_interval=0.02)
+    probes = []
+    run = session.runner.run
+
+    def counting_run(*args, **kwargs):
+        if args == PROBE:
+            probes.append(time.monotonic())
+        return run(*args, **kwargs)
+
+    session.runner.run = counting_run
+    yield session, probes
+    session.stop_polling()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_no_probe_while_a_job_holds_the_lock(polled):
+    session, probes = polled
+    session.start_polling()
+    wait_for(lambda: session.connected)
+    with session.device_lock:
+        time.sleep(0.1)  # A probe spawned just before the job may still be finishing
+        during = len(probes)
+        time.sleep(0.5)
+        assert len(probes) == during
+    wait_for(lambda: len(probes) > during)
+
+
+def test_stopped_poller_spawns_nothing(polled):
+    session, probes = polled
+    session.start_polling()
+    wait_for(lambda: session.connected)
+    session.stop_polling()
+    time.sleep(0.1)
+    stopped = len(probes)
+    time.sleep(0.3)
+    assert len(probes) == stopped
+
+
+def test_detect_slots_lists_the_adapters(fake_board, monkeypatch):
+    monkeypatch.setenv("FAKE_NULINK_ADAPTERS", "0x16010001,0x16010002")
+    slots = detect_slots(FAKE_NULINK)
+    assert [(slot["name"], slot["args"]) for slot in slots] == [
+        ("0x16010001", ["0x16010001"]), ("0x16010002", ["0x16010002"])]
@@ -0,0 +1,59 @@
+import datetime
+
+import pytest
+
+from bench import make_base_hex
+from config_block import CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE, DEFAULT_CONFIG, decode_config, encode_config
+from hex_splice import splice_hex
+from sparse_image import SparseImage
+from template import UNIT_OFFSET, UNIT_STRUCT, ImageTemplate, decode_unit, encode_unit
+
+UNITS = [
+    (1000, "L123", "2024-05-01"),
+    (0xFFFFFFFF, "ABCDEFGH", datetime.date(2255, 12, 31)),
+    (7, "", None),
+]
+
+
+@pytest.fixture(params=[16384, 0x7F00], ids=["no-block", "block-in-base"])
+def base(request, tmp_path):
+    """Base firmware without a config block, or with one already in its records"""
+    path = make_base_hex(str(tmp_path / "base.hex"), request.param)
+    if request.param == 0x7F00:
+        image = SparseImage.from_hex_file(path)
+        image.write(CONFIG_BLOCK_ADDRESS, bytes(CONFIG_BLOCK_SIZE))
+        image.write_hex_file(path)
+    return path
+
+
+@pytest.mark.parametrize("serial, lot, date", UNITS)
+def test_stamp_matches_full_render(base, serial, lot, date):
+    config = dict(DEFAULT_CONFIG, led_green=3, shutdown=1, tried_time_3=0x11223344)
+    template = ImageTemplate.for_file(base, encode_config(config))
+    unit = encode_unit(serial, lot, date)
+    block = encode_config(config)
+    block[UNIT_OFFSET:UNIT_OFFSET + len(unit)] = unit
+    stamped = bytes(template.stamp(unit))
+    assert stamped == splice_hex(base, CONFIG_BLOCK_ADDRESS, block)
+    # Every record checksum is valid and the firmware fields are untouched
+    image = SparseImage.from_hex(stamped.decode())
+    data = image.read(CONFIG_BLOCK_ADDRESS, CONFIG_BLOCK_SIZE)
+    assert decode_config(data) == decode_config(encode_config(config))
+
+
+@pytest.mark.parametrize("serial, lot, date", UNITS)
+def test_unit_round_trip(serial, lot, date):
+    block = encode_config(DEFAULT_CONFIG)
+    block[UNIT_OFFSET:UNIT_OFFSET + UNIT_STRUCT.size] = encode_unit(serial, lot, date)
+    assert decode_unit(block) == {"serial": serial, "lot": lot, "date": str(date) if date else ""}
+
+
+def test_unserialized_block_has_no_unit():
+    assert decode_unit(encode_config(dict(DEFAULT_CONFIG, shutdown=1, tried_time_0=5))) == \
+        {"serial": "", "lot": "", "date": ""}
+
+
+@pytest.mark.parametrize("args", [(-1,), (1 << 32,), ("x",), (1, "TOO-LONG-LOT"), (1, "", "1999-01-01")])
+def test_bad_units_are_refused(args):
+    with pytest.raises(ValueError):
+        encode_unit(*args)
@@ -0,0 +1,55 @@
+import pytest
+
+import validate
+from audit import main as audit_main
+from batch import read_rows
+from config_block import VALUE_FIELDS, encode_config, parse_value
+from hex_splice import splice_hex_file
+from bench import make_base_hex
+
+FIELDS = {field.name: field for field in VALUE_FIELDS}
+
+
+@pytest.mark.parametrize("value, expected", [
+    (7, 7), (7.0, 7), ("7", 7), (1.5, None), (7.9, None), (True, None), (False, None), ("x", None),
+])
+def test_parse_value_numbers(value, expected):
+    assert parse_value(FIELDS["led_green"], value) == expected
+
+
+def test_parse_value_combo():
+    assert parse_value(FIELDS["mode_df"], "ON") == 1
+    assert parse_value(FIELDS["mode_df"], 0) == 0
+    assert parse_value(FIELDS["mode_df"], True) is None
+
+
+def test_bool_and_int_are_told_apart():
+    rows = [{"led_green": 1}, {"led_green": True}, {"led_green": 2.5}]
+    violations = validate.validate_rows(rows, use_numpy=False)
+    assert [(v.row, v.value) for v in violations] == [(2, True), (3, 2.5)]
+
+
+def test_time_range_reports_the_default():
+    rows = [{"min_op_run": 5, "max_op_run": 4}, {"min_cl_run": 10, "max_cl_run": 3}]
+    violations = validate.validate_rows(rows, use_numpy=False)
+    assert [(v.row, v.field, v.value) for v in violations] == [(1, "min_op_run", 5), (2, "min_cl_run", 10)]
+    defaulted = validate.validate_rows([{"max_cl_run": 0}], use_numpy=False)
+    assert [(v.field, v.value) for v in defaulted if v.problem.startswith("min_cl_run >")] == [("min_cl_run", 1)]
+
+
+def test_numpy_matches_python():
+    pytest.importorskip("numpy")
+    rows = [{"led_green": 1}, {"led_green": True}, {"led_green": 2.5}, {"max_cl_run": 0}, {"mode_df": "??"}]
+    assert validate.validate_rows(rows, use_numpy=True) == validate.validate_rows(rows, use_numpy=False)
+
+
+def test_audit_csv_is_a_valid_batch_table(tmp_path):
+    base = make_base_hex(str(tmp_path / "base.hex"), 16384)
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    splice_hex_file(base, str(archive / "a.hex"), 0x7F00, encode_config({"led_green": 3, "mode_df": "OFF"}))
+    audit_csv = str(tmp_path / "audit.csv")
+    assert audit_main([str(archive), "-o", audit_csv]) == 0
+    rows = read_rows(audit_csv)
+    assert rows[0]["file"] and rows[0]["status"] == "ok"
+    assert validate.validate_rows(rows) == []
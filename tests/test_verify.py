@@ -0,0 +1,89 @@
+import pytest
+
+from bench import make_base_hex
+from flash_layout import PAGE_SIZE, aprom_bytes, image_pages
+from nulink import NuLinkRunner
+from sparse_image import SparseImage
+from verify import VerifyError, verify_image
+
+from conftest import FAKE_NULINK
+
+
+class RecordingRunner(NuLinkRunner):
+    """NuLinkRunner keeping each command and the pages of every APROM write"""
+
+    def __init__(self, tool_path):
+        super().__init__(tool_path)
+        self.commands = []
+        self.written = []
+        self.reads = []  # Offset of each APROM readback
+
+    def run(self, *args, **kwargs):
+        self.commands.append(args[:2])
+        if args[:2] == ("-r", "APROM"):
+            self.reads.append(int(args[4], 16) if len(args) == 5 else 0)
+        if args[:2] == ("-w", "APROM"):
+            self.written.append(image_pages(SparseImage.from_hex_file(args[2])))
+        return super().run(*args, **kwargs)
+
+
+def differing_pages(memory, expected):
+    return [page for page in range(0, len(expected), PAGE_SIZE)
+            if memory[page:page + PAGE_SIZE] != expected[page:page + PAGE_SIZE]]
+
+
+def write_image(tmp_path):
+    """(image path, expected APROM, runner) after an erase and one write of a 16 KB image"""
+    image_path = make_base_hex(str(tmp_path / "image.hex"), 16384)
+    runner = RecordingRunner(FAKE_NULINK)
+    runner.run("-e", "ALL")
+    runner.run("-w", "APROM", image_path)
+    runner.commands.clear()
+    runner.written.clear()
+    runner.reads.clear()
+    return image_path, aprom_bytes(SparseImage.from_hex_file(image_path)), runner
+
+
+def test_only_bad_pages_are_rewritten(tmp_path, fake_board, monkeypatch):
+    monkeypatch.setenv("FAKE_NULINK_BIT_ERRORS", "3:1")  # The first write only
+    image_path, expected, runner = write_image(tmp_path)
+    bad = differing_pages(fake_board.read(), expected)
+    assert 1 <= len(bad) <= 3
+    verify_image(runner, image_path)
+    assert runner.written == [bad]
+    assert runner.reads == [0, bad[0]]  # The retry reads from the first rewritten page
+    assert ("-e", "APROM") not in runner.commands
+    assert fake_board.read() == expected
+
+
+def test_cleared_bit_erases_from_its_page(tmp_path, fake_board):
+    image_path, expected, runner = write_image(tmp_path)
+    bad_page = 0x2000
+    memory = bytearray(fake_board.read())
+    i = next(i for i in range(bad_page, bad_page + PAGE_SIZE) if memory[i] & 1)
+    memory[i] &= 0xFE  # A 0 that writing again cannot turn back into a 1
+    fake_board.write(bytes(memory))
+    verify_image(runner, image_path)
+    assert ("-e", "APROM") in runner.commands
+    assert runner.written == [list(range(bad_page, 16384, PAGE_SIZE))]
+    assert fake_board.read() == expected
+
+
+def test_persistent_errors_raise(tmp_path, fake_board, monkeypatch):
+    monkeypatch.setenv("FAKE_NULINK_BIT_ERRORS", "2")  # Every write, rewrites included
+    image_path, _, runner = write_image(tmp_path)
+    with pytest.raises(VerifyError) as error:
+        verify_image(runner, image_path, retries=1)
+    assert error.value.pages
+    assert len(runner.written) == 1
+
+
+def test_readback_starts_at_the_first_image_page(tmp_path, fake_board):
+    image_path, expected, runner = write_image(tmp_path)
+    tail_path = str(tmp_path / "tail.hex")
+    tail = SparseImage()
+    tail.write(0x3E00, expected[0x3E00:0x4000])
+    tail.write_hex_file(tail_path)
+    assert verify_image(runner, tail_path) == "Verify: 4 pages OK"
+    assert runner.reads == [0x3E00]
+    assert runner.written == []
@@ -0,0 +1,218 @@
+"""Batch validation of parameter sets against the config block field ranges.
+
+encode_config silently turns bad values into zeros (see
+config_block.coerce_value), which is fine for one form but not for a batch of
+thousands of units. validate_rows checks every row of a batch at once:
+
+- values that are not numbers, or not one of a combo field's labels
+- values too wide for the stored uint8 / uint16
+- values outside the field's form range (times 1-999, LED levels 0-7, ...)
+- min > max in the time range table
+- serial / lot / date of serialized units that template.encode_unit refuses
+
+With NumPy installed each field is one array and every check is a single
+vectorized comparison over all rows; without it the same checks run row by
+row in Python and give the same report.
+
+    python validate.py params.csv [--limit N]
+"""
+import argparse
+import sys
+from collections import namedtuple
+
+from config_block import FIELD_NAMES, TIME_RANGE_NAMES, VALUE_FIELDS, WIDTH_MAX, parse_value
+from template import UNIT_COLUMNS, encode_unit
+
+try:
+    import numpy as np
+except ImportError:  # Optional, the pure-Python checks below give the same result
+    np = None
+
+# row is 1-based (None for a problem with a whole column); value is the input as given
+Violation = namedtuple("Violation", "row field value problem")
+
+# batch.py's file name column, audit.py's file and status columns (an audit CSV is a valid batch table)
+IGNORED_COLUMNS = ("output", "file", "status")
+_BIG = 1 << 62  # Stand-in for values too large for int64, still reported as too wide
+
+
+def _problems(field):
+    """(not a number, too wide, out of range) messages of a field"""
+    if field.choices is not None:
+        bad = "not one of " + ", ".join(field.choices)
+    else:
+        bad = "not a number"
+    width = f"does not fit uint{8 if field.code == 'B' else 16} (0-{WIDTH_MAX[field.code]})"
+    if field.choices is not None:
+        out_of_range = bad
+    elif field.min_val is not None:
+        out_of_range = f"outside {field.min_val}-{field.max_val}"
+    else:
+        out_of_range = None
+    return bad, width, out_of_range
+
+
+def unknown_columns(rows):
+    """Violations for columns that are not config fields (typos would fall back to defaults)"""
+    known = set(FIELD_NAMES) | set(UNIT_COLUMNS) | set(IGNORED_COLUMNS)
+    columns = set()
+    for row in rows:
+        columns.update(row)
+    return [Violation(None, name, None, "unknown column") for name in sorted(columns - known)]
+
+
+def _raw_column(rows, field):
+    default = field.default
+    name = field.name
+    return [row.get(name, default) for row in rows]
+
+
+def _keys(raw):
+    """Memo keys of raw values: True == 1 == 1.0 but they do not parse the same"""
+    return [(type(value), value) for value in raw]
+
+
+def _parse_column(field, raw):
+    """Parsed values with None where the input is not a value of the field"""
+    keys = _keys(raw)
+    try:
+        # A batch repeats few distinct values per field, parse each once
+        parsed = {key: parse_value(field, key[1]) for key in set(keys)}
+    except TypeError:  # Unhashable JSON values
+        return [parse_value(field, value) for value in raw]
+    return [parsed[key] for key in keys]
+
+
+def _check_python(rows):
+    violations = []
+    parsed = {}
+    raws = {}
+    for field in VALUE_FIELDS:
+        raw = raws[field.name] = _raw_column(rows, field)
+        values = _parse_column(field, raw)
+        parsed[field.name] = values
+        bad, width, out_of_range = _problems(field)
+        limit = WIDTH_MAX[field.code]
+        allowed = set(field.choices.values()) if field.choices is not None else None
+        for i, value in enumerate(values):
+            if value is None:
+                problem = bad
+            elif value < 0 or value > limit:
+                problem = width
+            elif allowed is not None and value not in allowed:
+                problem = out_of_range
+            elif field.min_val is not None and not field.min_val <= value <= field.max_val:
+                problem = out_of_range
+            else:
+                continue
+            violations.append(Violation(i + 1, field.name, raw[i], problem))
+    for min_name, max_name in TIME_RANGE_NAMES:
+        for i, (low, high) in enumerate(zip(parsed[min_name], parsed[max_name])):
+            if low is not None and high is not None and low > high:
+                violations.append(Violation(i + 1, min_name, raws[min_name][i], f"{min_name} > {max_name}"))
+    return violations
+
+
+def _check_units(rows):
+    """Unit columns of the serialized rows (any of them set), row by row: they are all different anyway"""
+    checks = (
+        ("serial", lambda value: encode_unit(value)),
+        ("lot", lambda value: encode_unit(0, value)),
+        ("date", lambda value: encode_unit(0, "", value or None)),
+    )
+    violations = []
+    for i, row in enumerate(rows):
+        if all(row.get(name) in (None, "") for name in UNIT_COLUMNS):
+            continue
+        for name, check in checks:
+            try:
+                check(row.get(name))
+            except ValueError as e:
+                violations.append(Violation(i + 1, name, row.get(name), str(e)))
+    return violations
+
+
+def _clip(value):
+    return _BIG + 1 if value is None else max(-_BIG, min(value, _BIG))
+
+
+def _numpy_column(field, raw):
+    """(int64 values, invalid mask) of one field over all rows"""
+    keys = _keys(raw)
+    try:
+        # Parse each distinct value once, then gather: no Python work per cell but a dict lookup
+        distinct = {key: i for i, key in enumerate(set(keys))}
+        codes = np.fromiter(map(distinct.__getitem__, keys), dtype=np.intp, count=len(keys))
+        table = np.array([_clip(parse_value(field, key[1])) for key in distinct], dtype=np.int64)
+        values = table[codes]
+    except TypeError:  # Unhashable JSON values
+        values = np.array([_clip(value) for value in _parse_column(field, raw)], dtype=np.int64)
+    return values, values == _BIG + 1
+
+
+def _check_numpy(rows):
+    found = []  # (row index array, field, problem)
+    parsed = {}
+    raws = {}
+    for field in VALUE_FIELDS:
+        raw = raws[field.name] = _raw_column(rows, field)
+        values, invalid = _numpy_column(field, raw)
+        parsed[field.name] = (values, invalid)
+        bad, width, out_of_range = _problems(field)
+        too_wide = ~invalid & ((values < 0) | (values > WIDTH_MAX[field.code]))
+        if field.choices is not None:
+            outside = ~np.isin(values, list(field.choices.values()))
+        elif field.min_val is not None:
+            outside = (values < field.min_val) | (values > field.max_val)
+        else:
+            outside = np.zeros(len(rows), dtype=bool)
+        found.append((np.flatnonzero(invalid), field.name, bad))
+        found.append((np.flatnonzero(too_wide), field.name, width))
+        found.append((np.flatnonzero(outside & ~invalid & ~too_wide), field.name, out_of_range))
+    for min_name, max_name in TIME_RANGE_NAMES:
+        low, low_invalid = parsed[min_name]
+        high, high_invalid = parsed[max_name]
+        found.append((np.flatnonzero(~low_invalid & ~high_invalid & (low > high)), min_name,
+                      f"{min_name} > {max_name}"))
+    violations = []
+    for indexes, name, problem in found:
+        raw = raws[name]
+        violations.extend(Violation(int(i) + 1, name, raw[i], problem) for i in indexes)
+    return violations
+
+
+def validate_rows(rows, use_numpy=None):
+    """Every violation in rows (config dicts, missing fields take the defaults), by row then field"""
+    if use_numpy is None:
+        use_numpy = np is not None
+    violations = (_check_numpy if use_numpy else _check_python)(rows) if rows else []
+    violations += _check_units(rows)
+    order = {name: i for i, name in enumerate(FIELD_NAMES + UNIT_COLUMNS)}
+    violations.sort(key=lambda v: (v.row, order[v.field]))
+    return unknown_columns(rows) + violations
+
+
+def format_violation(violation):
+    if violation.row is None:
+        return f"column {violation.field}: {violation.problem}"
+    return f"row {violation.row}, {violation.field} = {violation.value!r}: {violation.problem}"
+
+
+def main(argv=None):
+    from batch import read_rows
+
+    parser = argparse.ArgumentParser(prog="validate", description="Check a parameter table before a batch")
+    parser.add_argument("params", help="parameter sets (.csv or JSON lines)")
+    parser.add_argument("--limit", type=int, default=0, help="print at most N violations (default: all)")
+    args = parser.parse_args(argv)
+
+    rows = read_rows(args.params)
+    violations = validate_rows(rows)
+    for violation in violations[:args.limit or None]:
+        print(format_violation(violation))
+    print(f"{len(rows)} rows, {len(violations)} violations", file=sys.stderr)
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
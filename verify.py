@@ -0,0 +1,117 @@
+"""Verify-after-write: compare the written pages with a readback.
+
+A zero exit code from "-w APROM" does not prove the flash holds the image.
+The verify step hashes the pages the image programs (once per image file,
+the hashes are kept), reads APROM back from the first of those pages
+("-r APROM <file> offset", so a config-only flash reads its tail pages, not
+32 KB) and compares only those pages. Pages that differ are written again on
+their own (a page image, like config-only flash) and checked again, up to
+VERIFY_RETRIES times, instead of repeating the whole erase and program; a
+retry reads back from the first rewritten page and checks only those.
+
+"-w APROM" only programs bits (1 -> 0), it does not erase. A page whose
+readback only has extra 1 bits (cells that did not program) is fixed by
+writing it again. A 0 where the image has a 1 needs an erase: APROM is
+erased from the first such page to its end ("-e APROM offset", as config-only
+flash does) and every image page from there on is rewritten.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from flash_layout import APROM_SIZE, ERASED, PAGE_SIZE, aprom_bytes, image_pages, page_hashes, page_image
+from nulink import NuLinkError
+from sparse_image import SparseImage
+
+VERIFY_RETRIES = 2
+_EXPECTED_CACHE_SIZE = 16
+
+_expected = OrderedDict()  # (path, size, mtime_ns) -> (image, {page: digest})
+_expected_lock = threading.Lock()
+
+
+class VerifyError(NuLinkError):
+    def __init__(self, pages):
+        super().__init__("Verify failed at " + ", ".join(f"0x{page:04X}" for page in pages))
+        self.pages = pages
+
+
+def expected_pages(image_path):
+    """(SparseImage, {page: SHA-256 digest}) of the pages image_path programs"""
+    st = os.stat(image_path)
+    key = (os.path.abspath(image_path), st.st_size, st.st_mtime_ns)
+    with _expected_lock:
+        if key in _expected:
+            _expected.move_to_end(key)
+            return _expected[key]
+    image = SparseImage.from_hex_file(image_path)  # Not load_hex: spooled images are seen once, no snapshot
+    result = (image, page_hashes(aprom_bytes(image), image_pages(image)))
+    with _expected_lock:
+        _expected[key] = result
+        while len(_expected) > _EXPECTED_CACHE_SIZE:
+            _expected.popitem(last=False)
+    return result
+
+
+def read_aprom(runner, path, start=0, on_output=None):
+    """APROM_SIZE bytes read back from start on (bytes below start are not read, left ERASED)"""
+    if start:
+        runner.run("-r", "APROM", path, "offset", f"0x{start:X}", on_output=on_output)
+    else:
+        runner.run("-r", "APROM", path, on_output=on_output)
+    with open(path, "rb") as f:
+        data = f.read()
+    return (bytes([ERASED]) * start + data).ljust(APROM_SIZE, bytes([ERASED]))
+
+
+def bad_pages(readback, expected):
+    """Pages of expected ({page: digest}) whose content in readback differs"""
+    readback = readback.ljust(APROM_SIZE, bytes([ERASED]))
+    return [page for page, digest in expected.items()
+            if hashlib.sha256(readback[page:page + PAGE_SIZE]).digest() != digest]
+
+
+def programmable(readback, expected):
+    """True if writing expected over readback (bits can only go 1 -> 0) gives expected"""
+    return all(have & want == want for have, want in zip(readback, expected))
+
+
+def repair_plan(readback, image, pages):
+    """(erase from address or None, sorted pages to rewrite) for the bad pages of a readback"""
+    readback = readback.ljust(APROM_SIZE, bytes([ERASED]))
+    wanted = aprom_bytes(image)
+    for page in pages:
+        if not programmable(readback[page:page + PAGE_SIZE], wanted[page:page + PAGE_SIZE]):
+            return page, [p for p in pages if p < page] + [p for p in image_pages(image) if p >= page]
+    return None, pages
+
+
+def verify_image(runner, image_path, retries=VERIFY_RETRIES, on_output=None):
+    """Check the board against image_path, rewriting pages that differ; raises VerifyError"""
+    image, expected = expected_pages(image_path)
+    with tempfile.TemporaryDirectory() as workdir:
+        readback_path = os.path.join(workdir, "readback.bin")
+        pages_path = os.path.join(workdir, "retry_pages.hex")
+        checked = expected
+        for attempt in range(retries + 1):
+            readback = read_aprom(runner, readback_path, min(checked, default=0), on_output)
+            pages = bad_pages(readback, checked)
+            if not pages:
+                message = f"Verify: {len(expected)} pages OK"
+                if on_output:
+                    on_output(message)
+                return message
+            if attempt == retries:
+                raise VerifyError(pages)
+            erase_from, rewrite = repair_plan(readback, image, pages)
+            if on_output:
+                on_output(f"Verify: {len(pages)} pages differ, "
+                          + (f"erasing from 0x{erase_from:04X}, " if erase_from is not None else "")
+                          + "rewriting " + ", ".join(f"0x{page:04X}" for page in rewrite))
+            if erase_from is not None:
+                runner.run("-e", "APROM", "offset", f"0x{erase_from:X}", on_output=on_output)
+            page_image(image, rewrite).write_hex_file(pages_path)
+            runner.run("-w", "APROM", pages_path, on_output=on_output)
+            checked = {page: expected[page] for page in rewrite}